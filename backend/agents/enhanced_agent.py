@@ -600,10 +600,8 @@ class EnhancedAgent(ABC):
             # 根据阶段上下文定制专家提示词
             if "stage_context" in context:
                 stage_ctx = context["stage_context"]
-                system_prompt = self.stage_reasoning.get_expert_system_prompt(
-                    stage=stage_ctx.stage,
-                    user_type=self.user_type,
-                    context=stage_ctx,
+                system_prompt = self.stage_reasoning.expert_manager.build_system_prompt(
+                    expert_role, stage_ctx
                 )
         else:
             # 回退到子类的默认系统提示词
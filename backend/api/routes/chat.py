@@ -4,7 +4,6 @@
 """
 import os
 import sys
-import json
 import base64
 import tempfile
 import time
@@ -21,7 +20,7 @@ from backend.agents.b_end_agent import BEndAgent
 from backend.api.middleware.auth import get_current_user, require_user_type
 from backend.core.output_formatter import (
     OutputFormatter, OutputType, Source,
-    QuickReply, create_decoration_process
+    QuickReply, create_decoration_process, to_json_line
 )
 from backend.core.multimodal import (
     get_multimodal_manager, MediaContent, MediaType,
@@ -97,14 +96,17 @@ async def chat_stream(request: ChatRequest):
     else:
         # 使用通用RAG服务
         rag = get_rag_service(user_type)
-        rag.enable_search = request.enable_search
-        rag.show_thinking = request.show_thinking
 
         async def event_generator():
             # 发送流开始标记
             yield formatter.stream_start()
 
-            session_config = {"configurable": {"session_id": session_id}}
+            # 请求级开关通过 config 传入检索链，不修改多个请求共享的 RAG 服务实例
+            session_config = {"configurable": {
+                "session_id": session_id,
+                "enable_search": request.enable_search,
+                "show_thinking": request.show_thinking,
+            }}
             input_data = {"input": request.message}
 
             try:
@@ -116,7 +118,7 @@ async def chat_stream(request: ChatRequest):
                             docs = event["data"]["output"]
                             if docs:
                                 # 输出思考过程
-                                if hasattr(docs[0], "metadata") and "thinking_log" in docs[0].metadata:
+                                if request.show_thinking and hasattr(docs[0], "metadata") and "thinking_log" in docs[0].metadata:
                                     logs = docs[0].metadata["thinking_log"]
                                     yield formatter.thinking(logs)
 
@@ -411,7 +413,7 @@ async def chat_with_media(
                 async for event in agent.process(enhanced_message, active_id):
                     yield event
             except Exception as e:
-                yield json.dumps({"type": "error", "content": str(e)}, ensure_ascii=False) + "\n"
+                yield to_json_line({"type": "error", "content": str(e)})
 
         return StreamingResponse(agent_stream(), media_type="application/x-ndjson")
     elif filename.endswith(".pdf") or filename.endswith(".txt"):
@@ -494,7 +496,7 @@ async def chat_with_media(
                 async for event in agent.process(enhanced_message, active_id):
                     yield event
             except Exception as e:
-                yield json.dumps({"type": "error", "content": str(e)}, ensure_ascii=False) + "\n"
+                yield to_json_line({"type": "error", "content": str(e)})
 
         return StreamingResponse(agent_stream(), media_type="application/x-ndjson")
     else:
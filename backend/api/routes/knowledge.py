@@ -4,7 +4,8 @@
 """
 import os
 import sys
-from typing import Optional, List
+from datetime import datetime
+from typing import Optional, List, Union
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from pydantic import BaseModel
@@ -51,6 +52,25 @@ class CollectionStats(BaseModel):
     target_user: str
 
 
+def format_create_time(ts: Union[int, float, str, None]) -> Optional[str]:
+    """将元数据中的 create_time（Unix 时间戳）格式化为展示字符串
+
+    旧数据中已是格式化字符串的值原样返回
+    """
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+    return ts
+
+
+def _display_metadata(metadata: dict) -> dict:
+    """生成用于展示的元数据副本"""
+    if "create_time" not in metadata:
+        return metadata
+    display = dict(metadata)
+    display["create_time"] = format_create_time(metadata["create_time"])
+    return display
+
+
 # 延迟加载知识库
 _multi_kb = None
 
@@ -265,7 +285,7 @@ async def search(request: SearchRequest):
         "results": [
             {
                 "content": doc.page_content,
-                "metadata": doc.metadata,
+                "metadata": _display_metadata(doc.metadata),
                 "score": score,
             }
             for doc, score in results
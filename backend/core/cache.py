@@ -5,10 +5,12 @@
 import time
 import threading
 import math
-from typing import Any, Dict, Generic, Optional, TypeVar, Callable, List, Tuple
-from collections import OrderedDict
+import re
+from typing import Any, Dict, Generic, Iterator, Optional, TypeVar, Callable, List, Tuple
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from functools import wraps
+from itertools import islice
 
 K = TypeVar('K')
 V = TypeVar('V')
@@ -16,10 +18,10 @@ V = TypeVar('V')
 
 @dataclass
 class CacheEntry(Generic[V]):
-    """缓存条目"""
+    """缓存条目（时间戳取自单调时钟，仅用于计算存活时长）"""
     value: V
-    created_at: float = field(default_factory=time.time)
-    last_access: float = field(default_factory=time.time)
+    created_at: float = field(default_factory=time.monotonic)
+    last_access: float = field(default_factory=time.monotonic)
     access_count: int = 0
 
 
@@ -27,6 +29,8 @@ class LRUCache(Generic[K, V]):
     """
     线程安全的 LRU 缓存
 
+    基于 OrderedDict（C 实现的哈希表 + 双向链表），访问与淘汰均为 O(1)
+
     特性：
     - 固定容量，超出时淘汰最久未使用的条目
     - 支持 TTL（可选）
@@ -53,24 +57,25 @@ class LRUCache(Generic[K, V]):
     def get(self, key: K, default: V = None) -> Optional[V]:
         """获取缓存值"""
         with self._lock:
-            if key not in self._cache:
+            cache = self._cache
+            entry = cache.get(key)
+            if entry is None:
                 self._misses += 1
                 return default
 
-            entry = self._cache[key]
-
             # 检查 TTL
-            if self.ttl and (time.time() - entry.created_at) > self.ttl:
-                del self._cache[key]
+            now = time.monotonic()
+            if self.ttl and (now - entry.created_at) > self.ttl:
+                del cache[key]
                 self._misses += 1
                 return default
 
             # 更新访问信息
-            entry.last_access = time.time()
+            entry.last_access = now
             entry.access_count += 1
 
             # 移动到末尾（最近使用）
-            self._cache.move_to_end(key)
+            cache.move_to_end(key)
 
             self._hits += 1
             return entry.value
@@ -78,26 +83,26 @@ class LRUCache(Generic[K, V]):
     def set(self, key: K, value: V) -> None:
         """设置缓存值"""
         with self._lock:
-            if key in self._cache:
+            cache = self._cache
+            now = time.monotonic()
+            entry = cache.get(key)
+            if entry is not None:
                 # 更新现有条目
-                self._cache[key].value = value
-                self._cache[key].last_access = time.time()
-                self._cache.move_to_end(key)
+                entry.value = value
+                entry.last_access = now
+                cache.move_to_end(key)
             else:
                 # 检查容量
-                while len(self._cache) >= self.max_size:
-                    self._cache.popitem(last=False)  # 删除最旧的
+                while len(cache) >= self.max_size:
+                    cache.popitem(last=False)  # 删除最旧的
 
                 # 添加新条目
-                self._cache[key] = CacheEntry(value=value)
+                cache[key] = CacheEntry(value=value, created_at=now, last_access=now)
 
     def delete(self, key: K) -> bool:
         """删除缓存条目"""
         with self._lock:
-            if key in self._cache:
-                del self._cache[key]
-                return True
-            return False
+            return self._cache.pop(key, None) is not None
 
     def clear(self) -> None:
         """清空缓存"""
@@ -109,13 +114,13 @@ class LRUCache(Generic[K, V]):
     def contains(self, key: K) -> bool:
         """检查键是否存在"""
         with self._lock:
-            if key not in self._cache:
+            entry = self._cache.get(key)
+            if entry is None:
                 return False
 
             # 检查 TTL
             if self.ttl:
-                entry = self._cache[key]
-                if (time.time() - entry.created_at) > self.ttl:
+                if (time.monotonic() - entry.created_at) > self.ttl:
                     del self._cache[key]
                     return False
 
@@ -142,7 +147,7 @@ class LRUCache(Generic[K, V]):
             return 0
 
         with self._lock:
-            now = time.time()
+            now = time.monotonic()
             expired_keys = [
                 k for k, v in self._cache.items()
                 if (now - v.created_at) > self.ttl
@@ -163,18 +168,17 @@ class CircularBuffer(Generic[V]):
     循环缓冲区
 
     用于存储固定数量的历史记录，超出时自动覆盖最旧的
+    （基于 deque(maxlen)，覆盖由 C 层完成，append 为 O(1)）
     """
 
     def __init__(self, max_size: int = 1000):
         self.max_size = max_size
-        self._buffer: list = []
+        self._buffer: deque = deque(maxlen=max_size)
         self._lock = threading.Lock()
 
     def append(self, item: V) -> None:
         """添加条目"""
         with self._lock:
-            if len(self._buffer) >= self.max_size:
-                self._buffer.pop(0)
             self._buffer.append(item)
 
     def get_all(self) -> list:
@@ -185,7 +189,17 @@ class CircularBuffer(Generic[V]):
     def get_recent(self, n: int) -> list:
         """获取最近 n 条"""
         with self._lock:
-            return list(self._buffer[-n:])
+            return list(self.iter_recent(n))
+
+    def iter_recent(self, n: int) -> Iterator[V]:
+        """
+        按从旧到新的顺序迭代最近 n 条，不复制缓冲区
+
+        迭代期间若有其他线程写入，deque 会抛出 RuntimeError，
+        并发场景请使用 get_recent()
+        """
+        size = len(self._buffer)
+        return islice(self._buffer, max(0, size - n), size)
 
     def clear(self) -> None:
         """清空"""
@@ -199,6 +213,11 @@ class CircularBuffer(Generic[V]):
     def __len__(self) -> int:
         return self.size()
 
+    def __contains__(self, item: Any) -> bool:
+        """成员判断（在 deque 上直接查找，无需先 get_all() 复制）"""
+        with self._lock:
+            return item in self._buffer
+
 
 def lru_cache_method(max_size: int = 128, ttl: Optional[float] = None):
     """
@@ -288,6 +307,10 @@ def get_cache_manager() -> CacheManager:
 
 # === 专用缓存类 ===
 
+# 查询关键词：连续的中文或英文字符
+_QUERY_WORD_RE = re.compile(r'[\u4e00-\u9fa5]+|[a-zA-Z]+')
+
+
 class KnowledgeQueryCache:
     """
     知识库查询缓存
@@ -308,7 +331,8 @@ class KnowledgeQueryCache:
         """
         self._cache = LRUCache[str, dict](max_size=max_size, ttl=ttl)
         self._query_vectors: Dict[str, Dict] = {}  # 缓存键到查询向量的映射
-        self._keyword_index: Dict[str, set] = {}  # 关键词到缓存键的倒排索引
+        # (user_type, k, 关键词) 到缓存键的倒排索引，按作用域分桶，候选只来自同一 user_type/k
+        self._keyword_index: Dict[Tuple[str, int, str], set] = {}
         self._lock = threading.RLock()
         self.similarity_threshold = similarity_threshold
 
@@ -321,8 +345,7 @@ class KnowledgeQueryCache:
 
     def _extract_keywords(self, query: str) -> List[str]:
         """提取查询关键词"""
-        import re
-        words = re.findall(r'[\u4e00-\u9fa5]+|[a-zA-Z]+', query)
+        words = _QUERY_WORD_RE.findall(query)
         return [w for w in words if len(w) >= 2]
 
     def _compute_tf_vector(self, keywords: List[str]) -> Dict[str, float]:
@@ -337,17 +360,28 @@ class KnowledgeQueryCache:
                 tf[word] /= total
         return tf
 
-    def _cosine_similarity(self, vec1: Dict[str, float], vec2: Dict[str, float]) -> float:
-        """计算余弦相似度"""
+    @staticmethod
+    def _vector_norm(vec: Dict[str, float]) -> float:
+        """计算向量模长"""
+        return math.sqrt(sum(v * v for v in vec.values()))
+
+    def _cosine_similarity(self, vec1: Dict[str, float], vec2: Dict[str, float],
+                           norm1: float = None, norm2: float = None) -> float:
+        """计算余弦相似度（可传入预先计算的模长）"""
         if not vec1 or not vec2:
             return 0.0
 
-        # 计算点积
-        dot_product = sum(vec1.get(k, 0) * vec2.get(k, 0) for k in set(vec1) | set(vec2))
+        # 计算点积：只有共有的词有贡献，遍历较小的向量即可
+        if len(vec1) > len(vec2):
+            vec1, vec2 = vec2, vec1
+            norm1, norm2 = norm2, norm1
+        dot_product = sum(v * vec2[k] for k, v in vec1.items() if k in vec2)
 
         # 计算模长
-        norm1 = math.sqrt(sum(v * v for v in vec1.values()))
-        norm2 = math.sqrt(sum(v * v for v in vec2.values()))
+        if norm1 is None:
+            norm1 = self._vector_norm(vec1)
+        if norm2 is None:
+            norm2 = self._vector_norm(vec2)
 
         if norm1 == 0 or norm2 == 0:
             return 0.0
@@ -358,8 +392,9 @@ class KnowledgeQueryCache:
         """计算 Jaccard 相似度"""
         if not set1 or not set2:
             return 0.0
+        # |A ∪ B| = |A| + |B| - |A ∩ B|，无需再构造并集
         intersection = len(set1 & set2)
-        union = len(set1 | set2)
+        union = len(set1) + len(set2) - intersection
         return intersection / union if union > 0 else 0.0
 
     def _generate_cache_key(self, query: str, user_type: str, k: int) -> str:
@@ -415,14 +450,60 @@ class KnowledgeQueryCache:
             self._query_vectors[cache_key] = {
                 "keywords": set(keywords),
                 "tf_vector": tf_vector,
+                "tf_norm": self._vector_norm(tf_vector),
                 "user_type": user_type,
                 "k": k,
             }
             # 更新关键词倒排索引
             for kw in keywords:
-                if kw not in self._keyword_index:
-                    self._keyword_index[kw] = set()
-                self._keyword_index[kw].add(cache_key)
+                self._keyword_index.setdefault((user_type, k, kw), set()).add(cache_key)
+
+    def _scored_candidates(self, keywords: List[str], user_type: str,
+                           k: int) -> List[Tuple[float, str]]:
+        """
+        计算同一 user_type/k 作用域内候选缓存的综合相似度
+
+        不含任何共同关键词的缓存条目 Jaccard 与余弦相似度都为 0，
+        因此只需比较倒排索引召回的候选，无需遍历全部缓存。调用方需持有 self._lock
+
+        Returns:
+            [(综合相似度, 缓存键), ...]
+        """
+        index = self._keyword_index
+        candidate_keys = set()
+        for kw in keywords:
+            keys = index.get((user_type, k, kw))
+            if keys:
+                candidate_keys.update(keys)
+
+        if not candidate_keys:
+            return []
+
+        query_keywords_set = set(keywords)
+        query_tf_vector = self._compute_tf_vector(keywords)
+        query_norm = self._vector_norm(query_tf_vector)
+
+        scored = []
+        for cache_key in candidate_keys:
+            cached_info = self._query_vectors.get(cache_key)
+            if cached_info is None:
+                continue
+
+            # 计算综合相似度（Jaccard + Cosine 加权平均）
+            jaccard_sim = self._jaccard_similarity(
+                query_keywords_set,
+                cached_info["keywords"]
+            )
+            cosine_sim = self._cosine_similarity(
+                query_tf_vector,
+                cached_info["tf_vector"],
+                query_norm,
+                cached_info["tf_norm"],
+            )
+
+            # 加权平均（Jaccard 权重 0.4，Cosine 权重 0.6）
+            scored.append((0.4 * jaccard_sim + 0.6 * cosine_sim, cache_key))
+        return scored
 
     def find_similar(self, query: str, user_type: str, k: int = 5,
                      similarity_threshold: float = None) -> Optional[list]:
@@ -430,7 +511,7 @@ class KnowledgeQueryCache:
         查找相似查询的缓存结果（优化版）
 
         使用两阶段搜索：
-        1. 通过关键词倒排索引快速筛选候选
+        1. 通过按 user_type/k 分桶的关键词倒排索引快速筛选候选
         2. 对候选计算精确相似度
 
         Args:
@@ -454,48 +535,11 @@ class KnowledgeQueryCache:
         if not keywords:
             return None
 
-        query_keywords_set = set(keywords)
-        query_tf_vector = self._compute_tf_vector(keywords)
-
         with self._lock:
-            # 阶段1：通过倒排索引快速筛选候选
-            candidate_keys = set()
-            for kw in keywords:
-                if kw in self._keyword_index:
-                    candidate_keys.update(self._keyword_index[kw])
-
-            if not candidate_keys:
-                return None
-
-            # 阶段2：计算精确相似度
             best_match = None
             best_similarity = 0.0
 
-            for cache_key in candidate_keys:
-                if cache_key not in self._query_vectors:
-                    continue
-
-                cached_info = self._query_vectors[cache_key]
-
-                # 检查用户类型和 k 值
-                if cached_info["user_type"] != user_type:
-                    continue
-                if cached_info["k"] != k:
-                    continue
-
-                # 计算综合相似度（Jaccard + Cosine 加权平均）
-                jaccard_sim = self._jaccard_similarity(
-                    query_keywords_set,
-                    cached_info["keywords"]
-                )
-                cosine_sim = self._cosine_similarity(
-                    query_tf_vector,
-                    cached_info["tf_vector"]
-                )
-
-                # 加权平均（Jaccard 权重 0.4，Cosine 权重 0.6）
-                combined_sim = 0.4 * jaccard_sim + 0.6 * cosine_sim
-
+            for combined_sim, cache_key in self._scored_candidates(keywords, user_type, k):
                 if combined_sim > best_similarity and combined_sim >= threshold:
                     best_similarity = combined_sim
                     best_match = cache_key
@@ -526,40 +570,10 @@ class KnowledgeQueryCache:
         if not keywords:
             return []
 
-        query_keywords_set = set(keywords)
-        query_tf_vector = self._compute_tf_vector(keywords)
-
         similarities = []
 
         with self._lock:
-            # 通过倒排索引筛选候选
-            candidate_keys = set()
-            for kw in keywords:
-                if kw in self._keyword_index:
-                    candidate_keys.update(self._keyword_index[kw])
-
-            for cache_key in candidate_keys:
-                if cache_key not in self._query_vectors:
-                    continue
-
-                cached_info = self._query_vectors[cache_key]
-
-                if cached_info["user_type"] != user_type:
-                    continue
-                if cached_info["k"] != k:
-                    continue
-
-                # 计算相似度
-                jaccard_sim = self._jaccard_similarity(
-                    query_keywords_set,
-                    cached_info["keywords"]
-                )
-                cosine_sim = self._cosine_similarity(
-                    query_tf_vector,
-                    cached_info["tf_vector"]
-                )
-                combined_sim = 0.4 * jaccard_sim + 0.6 * cosine_sim
-
+            for combined_sim, cache_key in self._scored_candidates(keywords, user_type, k):
                 entry = self._cache.get(cache_key)
                 if entry:
                     similarities.append((combined_sim, entry["results"]))
@@ -615,24 +629,21 @@ class LLMResponseCache:
         # 注册到缓存管理器
         get_cache_manager().register("llm_response", self._cache)
 
-    def _generate_cache_key(self, message: str, context_hash: str = "") -> str:
-        """生成缓存键"""
-        import hashlib
+    def _generate_cache_key(self, message: str, context_key: str = "") -> str:
+        """
+        生成缓存键
+
+        缓存只在进程内使用，直接以标准化消息和上下文键拼接作为键，
+        无需摘要（字符串哈希由 dict 计算并缓存在对象上）
+        """
         normalized = message.strip().lower()
-        key_str = f"{normalized}:{context_hash}"
-        return hashlib.md5(key_str.encode()).hexdigest()
+        return f"{normalized}\x00{context_key}"
 
-    def _hash_context(self, context: Dict) -> str:
-        """计算上下文哈希"""
-        import hashlib
-        import json
-        # 只使用关键上下文信息
-        key_context = {
-            "user_type": context.get("user_type", ""),
-            "has_knowledge": bool(context.get("knowledge")),
-            "has_tools": bool(context.get("tool_results")),
-        }
-        return hashlib.md5(json.dumps(key_context, sort_keys=True).encode()).hexdigest()[:8]
+    def _context_key(self, context: Dict) -> str:
+        """计算上下文键（只使用关键上下文信息）"""
+        return (f"{context.get('user_type', '')}"
+                f"|{int(bool(context.get('knowledge')))}"
+                f"|{int(bool(context.get('tool_results')))}")
 
     def get(self, message: str, context: Dict = None) -> Optional[Dict]:
         """
@@ -645,8 +656,8 @@ class LLMResponseCache:
         Returns:
             缓存的响应，未命中返回 None
         """
-        context_hash = self._hash_context(context) if context else ""
-        cache_key = self._generate_cache_key(message, context_hash)
+        context_key = self._context_key(context) if context else ""
+        cache_key = self._generate_cache_key(message, context_key)
         return self._cache.get(cache_key)
 
     def set(self, message: str, response: str, context: Dict = None,
@@ -660,8 +671,8 @@ class LLMResponseCache:
             context: 上下文信息
             metadata: 额外元数据
         """
-        context_hash = self._hash_context(context) if context else ""
-        cache_key = self._generate_cache_key(message, context_hash)
+        context_key = self._context_key(context) if context else ""
+        cache_key = self._generate_cache_key(message, context_key)
 
         cache_entry = {
             "response": response,
@@ -6,10 +6,12 @@ LLM Function Calling 模块
 import json
 import re
 import asyncio
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 
 from backend.core.tools import get_tool_registry, ToolResult, ToolDefinition
+from backend.core.keyword_matcher import build_keyword_matcher, find_keywords
 from backend.core.logging_config import get_logger
 
 logger = get_logger("function_calling")
@@ -33,7 +35,7 @@ except ImportError:
     logger.warning("LangChain Tools 未安装，原生 Function Calling 不可用")
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionCall:
     """函数调用结果"""
     name: str
@@ -42,7 +44,7 @@ class FunctionCall:
     error: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionCallingResult:
     """Function Calling 执行结果"""
     calls: List[FunctionCall] = field(default_factory=list)
@@ -50,23 +52,37 @@ class FunctionCallingResult:
     thinking: List[str] = field(default_factory=list)
 
 
+# LLM 响应中 ```json ... ``` 代码块
+_JSON_BLOCK_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+
+
 class ParameterExtractor:
     """智能参数提取器"""
 
+    # 以下模式均在类定义时预编译，避免每次提取都经过 re 模块的模式缓存查找
+
     # 金额提取模式
     AMOUNT_PATTERNS = [
-        (r'(\d+(?:\.\d+)?)\s*万\s*[元块]?', 10000),  # X万
-        (r'(\d+(?:\.\d+)?)\s*[元块]', 1),            # X元/块
-        (r'(\d{4,}(?:\.\d+)?)', 1),                   # 4位以上数字
-        (r'(\d+(?:,\d{3})+(?:\.\d+)?)', 1),          # 带逗号的数字
+        (re.compile(r'(\d+(?:\.\d+)?)\s*万\s*[元块]?'), 10000),  # X万
+        (re.compile(r'(\d+(?:\.\d+)?)\s*[元块]'), 1),            # X元/块
+        (re.compile(r'(\d{4,}(?:\.\d+)?)'), 1),                   # 4位以上数字
+        (re.compile(r'(\d+(?:,\d{3})+(?:\.\d+)?)'), 1),          # 带逗号的数字
     ]
 
     # 面积提取模式
     AREA_PATTERNS = [
-        r'(\d+(?:\.\d+)?)\s*[平㎡]',
-        r'(\d+(?:\.\d+)?)\s*平米',
-        r'(\d+(?:\.\d+)?)\s*平方',
-        r'(\d+(?:\.\d+)?)\s*m2',
+        re.compile(r'(\d+(?:\.\d+)?)\s*[平㎡]', re.IGNORECASE),
+        re.compile(r'(\d+(?:\.\d+)?)\s*平米', re.IGNORECASE),
+        re.compile(r'(\d+(?:\.\d+)?)\s*平方', re.IGNORECASE),
+        re.compile(r'(\d+(?:\.\d+)?)\s*m2', re.IGNORECASE),
+    ]
+
+    # 统计周期提取模式（数字 × 天数）
+    PERIOD_PATTERNS = [
+        (re.compile(r'(\d+)\s*天'), 1),
+        (re.compile(r'(\d+)\s*周'), 7),
+        (re.compile(r'(\d+)\s*[个]?月'), 30),
+        (re.compile(r'(\d+)\s*年'), 365),
     ]
 
     # 品类映射
@@ -89,6 +105,16 @@ class ParameterExtractor:
     # 装修风格
     STYLES = ["现代简约", "北欧", "新中式", "轻奢", "欧式", "美式", "日式", "工业风", "地中海"]
 
+    # 风格简化关键词 -> 标准风格
+    STYLE_KEYWORDS = {
+        "现代": "现代简约", "简约": "现代简约",
+        "北欧": "北欧", "欧式": "欧式",
+        "中式": "新中式", "中国风": "新中式",
+        "轻奢": "轻奢", "奢华": "轻奢",
+        "日式": "日式", "和风": "日式",
+        "工业": "工业风", "loft": "工业风",
+    }
+
     @classmethod
     def extract_amount(cls, text: str, context_keyword: str = None) -> Optional[float]:
         """
@@ -102,27 +128,27 @@ class ParameterExtractor:
             提取的金额（元）
         """
         # 如果有上下文关键词，优先在关键词附近提取
-        if context_keyword and context_keyword in text:
-            # 在关键词后20个字符内查找
+        if context_keyword:
             idx = text.find(context_keyword)
-            search_text = text[idx:idx+30]
-        else:
-            search_text = text
+            if idx != -1:
+                # 在关键词后30个字符内查找
+                amount = cls._first_amount(text[idx:idx+30])
+                if amount is not None:
+                    return amount
+            # 回退到全文搜索
 
+        return cls._first_amount(text)
+
+    @classmethod
+    def _first_amount(cls, text: str) -> Optional[float]:
+        """按模式优先级返回第一个匹配到的金额（元）"""
         for pattern, multiplier in cls.AMOUNT_PATTERNS:
-            matches = re.findall(pattern, search_text)
-            if matches:
-                amount_str = matches[0].replace(',', '')
+            match = pattern.search(text)
+            if match:
+                amount_str = match.group(1)
+                if ',' in amount_str:
+                    amount_str = amount_str.replace(',', '')
                 return float(amount_str) * multiplier
-
-        # 回退到全文搜索
-        if context_keyword:
-            for pattern, multiplier in cls.AMOUNT_PATTERNS:
-                matches = re.findall(pattern, text)
-                if matches:
-                    amount_str = matches[0].replace(',', '')
-                    return float(amount_str) * multiplier
-
         return None
 
     @classmethod
@@ -130,8 +156,7 @@ class ParameterExtractor:
         """提取文本中的所有金额"""
         amounts = []
         for pattern, multiplier in cls.AMOUNT_PATTERNS:
-            matches = re.findall(pattern, text)
-            for match in matches:
+            for match in pattern.findall(text):
                 amount_str = match.replace(',', '')
                 amounts.append(float(amount_str) * multiplier)
         return sorted(set(amounts))
@@ -140,9 +165,9 @@ class ParameterExtractor:
     def extract_area(cls, text: str) -> Optional[float]:
         """提取面积"""
         for pattern in cls.AREA_PATTERNS:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                return float(matches[0])
+            match = pattern.search(text)
+            if match:
+                return float(match.group(1))
         return None
 
     @classmethod
@@ -176,35 +201,212 @@ class ParameterExtractor:
             if style in text:
                 return style
         # 简化匹配
-        style_keywords = {
-            "现代": "现代简约", "简约": "现代简约",
-            "北欧": "北欧", "欧式": "欧式",
-            "中式": "新中式", "中国风": "新中式",
-            "轻奢": "轻奢", "奢华": "轻奢",
-            "日式": "日式", "和风": "日式",
-            "工业": "工业风", "loft": "工业风",
-        }
-        for keyword, style in style_keywords.items():
-            if keyword in text.lower():
+        lowered = text.lower()
+        for keyword, style in cls.STYLE_KEYWORDS.items():
+            if keyword in lowered:
                 return style
         return "现代简约"  # 默认风格
 
     @classmethod
     def extract_period_days(cls, text: str) -> int:
         """提取统计周期（天数）"""
-        patterns = [
-            (r'(\d+)\s*天', 1),
-            (r'(\d+)\s*周', 7),
-            (r'(\d+)\s*[个]?月', 30),
-            (r'(\d+)\s*年', 365),
-        ]
-        for pattern, multiplier in patterns:
-            matches = re.findall(pattern, text)
-            if matches:
-                return int(matches[0]) * multiplier
+        for pattern, multiplier in cls.PERIOD_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                return int(match.group(1)) * multiplier
         return 30  # 默认30天
 
 
+# 各工具的触发关键词：消息命中任一关键词后才会进一步提取参数
+_TOOL_TRIGGER_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "subsidy_calculator": ("补贴", "能补多少", "返多少", "优惠", "返现", "补贴金额"),
+    "roi_calculator": ("ROI", "投入产出", "回报率", "收益率", "投资回报"),
+    "price_evaluator": ("贵不贵", "价格合理", "值不值", "性价比", "划算", "便宜", "价格怎么样"),
+    "decoration_timeline": ("多久", "工期", "多长时间", "装修时间", "需要几天", "几个月能装完"),
+    "budget_planner": ("预算", "怎么分配", "预算规划", "预算分配", "钱怎么花"),
+    "material_calculator": ("需要多少", "用量", "要买多少", "材料计算"),
+    "merchant_score_calculator": ("店铺评分", "商家评分", "我的评分", "评分多少"),
+    "conversion_rate_analyzer": ("转化率", "转化分析", "成交率", "咨询转化"),
+}
+
+
+def _build_trigger_keyword_tools() -> Dict[str, Tuple[str, ...]]:
+    """反转触发关键词表：关键词 -> 它触发的全部工具"""
+    targets: Dict[str, list] = {}
+    for tool_name, keywords in _TOOL_TRIGGER_KEYWORDS.items():
+        for kw in keywords:
+            targets.setdefault(kw, []).append(tool_name)
+    return {kw: tuple(tool_names) for kw, tool_names in targets.items()}
+
+
+_TRIGGER_KEYWORD_TOOLS = _build_trigger_keyword_tools()
+
+# 触发关键词匹配器（与任务分析共用同一套自动机/前瞻正则实现）
+_TRIGGER_MATCHER = build_keyword_matcher(_TRIGGER_KEYWORD_TOOLS)
+
+
+def _triggered_tools(message: str) -> set:
+    """
+    找出消息命中触发关键词的工具
+
+    单次扫描消息得到全部命中的关键词（含重叠与同一位置的前缀关键词），再映射到工具
+    """
+    triggered = set()
+    for kw in find_keywords(_TRIGGER_MATCHER, message):
+        triggered.update(_TRIGGER_KEYWORD_TOOLS[kw])
+    return triggered
+
+
+@lru_cache(maxsize=512)
+def _match_tool_intents(message: str) -> Tuple[Tuple[str, Dict], ...]:
+    """
+    使用 ParameterExtractor 进行规则意图检测（按消息缓存，重复提问不再重新扫描）
+
+    Returns:
+        ((工具名, 参数), ...)，参数字典为共享的缓存对象，不应修改
+    """
+    triggered = _triggered_tools(message)
+    if not triggered:
+        return ()
+
+    detected = []
+
+    # 补贴计算检测
+    if "subsidy_calculator" in triggered:
+        amount = ParameterExtractor.extract_amount(message)
+        category = ParameterExtractor.extract_category(message)
+
+        if amount and category:
+            detected.append({
+                "name": "subsidy_calculator",
+                "arguments": {"amount": amount, "category": category}
+            })
+
+    # ROI 计算检测
+    if "roi_calculator" in triggered:
+        # 尝试提取投入和收入
+        investment = ParameterExtractor.extract_amount(message, "投入")
+        if not investment:
+            investment = ParameterExtractor.extract_amount(message, "花")
+        if not investment:
+            investment = ParameterExtractor.extract_amount(message, "成本")
+
+        revenue = ParameterExtractor.extract_amount(message, "收入")
+        if not revenue:
+            revenue = ParameterExtractor.extract_amount(message, "赚")
+        if not revenue:
+            revenue = ParameterExtractor.extract_amount(message, "营收")
+
+        # 如果只找到一个金额，尝试提取所有金额
+        if not (investment and revenue):
+            amounts = ParameterExtractor.extract_multiple_amounts(message)
+            if len(amounts) >= 2:
+                investment = amounts[0]
+                revenue = amounts[1]
+
+        if investment and revenue:
+            period_days = ParameterExtractor.extract_period_days(message)
+            detected.append({
+                "name": "roi_calculator",
+                "arguments": {
+                    "investment": investment,
+                    "revenue": revenue,
+                    "period_days": period_days
+                }
+            })
+
+    # 价格评估检测
+    if "price_evaluator" in triggered:
+        price = ParameterExtractor.extract_amount(message)
+        item = ParameterExtractor.extract_specific_item(message)
+
+        if price and item:
+            area = ParameterExtractor.extract_area(message)
+            detected.append({
+                "name": "price_evaluator",
+                "arguments": {
+                    "category": item,
+                    "price": price,
+                    **({"area": area} if area else {})
+                }
+            })
+
+    # 工期估算检测
+    if "decoration_timeline" in triggered:
+        area = ParameterExtractor.extract_area(message)
+
+        if area:
+            style = ParameterExtractor.extract_style(message)
+            detected.append({
+                "name": "decoration_timeline",
+                "arguments": {"house_area": area, "style": style}
+            })
+
+    # 预算规划检测
+    if "budget_planner" in triggered:
+        budget = ParameterExtractor.extract_amount(message)
+        area = ParameterExtractor.extract_area(message)
+
+        if budget and area:
+            style = ParameterExtractor.extract_style(message)
+            detected.append({
+                "name": "budget_planner",
+                "arguments": {
+                    "total_budget": budget,
+                    "house_area": area,
+                    "style": style
+                }
+            })
+
+    # 材料用量计算检测
+    material_types = ["瓷砖", "地板", "乳胶漆", "墙纸", "水泥", "沙子", "电线", "水管"]
+    if "material_calculator" in triggered:
+        area = ParameterExtractor.extract_area(message)
+        material_type = None
+        for mt in material_types:
+            if mt in message:
+                material_type = mt
+                break
+
+        if area and material_type:
+            detected.append({
+                "name": "material_calculator",
+                "arguments": {
+                    "material_type": material_type,
+                    "area": area
+                }
+            })
+
+    # 商家评分计算检测（B端）
+    if "merchant_score_calculator" in triggered:
+        # 尝试从消息中提取数据
+        amounts = ParameterExtractor.extract_multiple_amounts(message)
+        if len(amounts) >= 2:
+            detected.append({
+                "name": "merchant_score_calculator",
+                "arguments": {
+                    "monthly_orders": int(amounts[0]) if amounts else 50,
+                    "good_rate": 0.95,  # 默认值
+                    "response_time": 10,  # 默认值
+                }
+            })
+
+    # 转化率分析检测（B端）
+    if "conversion_rate_analyzer" in triggered:
+        amounts = ParameterExtractor.extract_multiple_amounts(message)
+        if len(amounts) >= 3:
+            detected.append({
+                "name": "conversion_rate_analyzer",
+                "arguments": {
+                    "visitors": int(amounts[0]),
+                    "inquiries": int(amounts[1]),
+                    "orders": int(amounts[2])
+                }
+            })
+
+    return tuple((d["name"], d["arguments"]) for d in detected)
+
+
 class FunctionCallingEngine:
     """
     Function Calling 引擎
@@ -513,160 +715,20 @@ class FunctionCallingEngine:
         """
         使用智能参数提取器检测工具调用意图
 
-        使用 ParameterExtractor 进行更准确的参数提取
+        检测结果只取决于消息文本，按消息缓存（见 _match_tool_intents），
+        这里返回副本，调用方修改参数不会影响缓存
         """
-        detected = []
-
-        # 补贴计算检测
-        subsidy_keywords = ["补贴", "能补多少", "返多少", "优惠", "返现", "补贴金额"]
-        if any(kw in message for kw in subsidy_keywords):
-            amount = ParameterExtractor.extract_amount(message)
-            category = ParameterExtractor.extract_category(message)
-
-            if amount and category:
-                detected.append({
-                    "name": "subsidy_calculator",
-                    "arguments": {"amount": amount, "category": category}
-                })
-
-        # ROI 计算检测
-        roi_keywords = ["ROI", "投入产出", "回报率", "收益率", "投资回报"]
-        if any(kw in message for kw in roi_keywords):
-            # 尝试提取投入和收入
-            investment = ParameterExtractor.extract_amount(message, "投入")
-            if not investment:
-                investment = ParameterExtractor.extract_amount(message, "花")
-            if not investment:
-                investment = ParameterExtractor.extract_amount(message, "成本")
-
-            revenue = ParameterExtractor.extract_amount(message, "收入")
-            if not revenue:
-                revenue = ParameterExtractor.extract_amount(message, "赚")
-            if not revenue:
-                revenue = ParameterExtractor.extract_amount(message, "营收")
-
-            # 如果只找到一个金额，尝试提取所有金额
-            if not (investment and revenue):
-                amounts = ParameterExtractor.extract_multiple_amounts(message)
-                if len(amounts) >= 2:
-                    investment = amounts[0]
-                    revenue = amounts[1]
-
-            if investment and revenue:
-                period_days = ParameterExtractor.extract_period_days(message)
-                detected.append({
-                    "name": "roi_calculator",
-                    "arguments": {
-                        "investment": investment,
-                        "revenue": revenue,
-                        "period_days": period_days
-                    }
-                })
-
-        # 价格评估检测
-        price_keywords = ["贵不贵", "价格合理", "值不值", "性价比", "划算", "便宜", "价格怎么样"]
-        if any(kw in message for kw in price_keywords):
-            price = ParameterExtractor.extract_amount(message)
-            item = ParameterExtractor.extract_specific_item(message)
-
-            if price and item:
-                area = ParameterExtractor.extract_area(message)
-                detected.append({
-                    "name": "price_evaluator",
-                    "arguments": {
-                        "category": item,
-                        "price": price,
-                        **({"area": area} if area else {})
-                    }
-                })
-
-        # 工期估算检测
-        timeline_keywords = ["多久", "工期", "多长时间", "装修时间", "需要几天", "几个月能装完"]
-        if any(kw in message for kw in timeline_keywords):
-            area = ParameterExtractor.extract_area(message)
-
-            if area:
-                style = ParameterExtractor.extract_style(message)
-                detected.append({
-                    "name": "decoration_timeline",
-                    "arguments": {"house_area": area, "style": style}
-                })
-
-        # 预算规划检测
-        budget_keywords = ["预算", "怎么分配", "预算规划", "预算分配", "钱怎么花"]
-        if any(kw in message for kw in budget_keywords):
-            budget = ParameterExtractor.extract_amount(message)
-            area = ParameterExtractor.extract_area(message)
-
-            if budget and area:
-                style = ParameterExtractor.extract_style(message)
-                detected.append({
-                    "name": "budget_planner",
-                    "arguments": {
-                        "total_budget": budget,
-                        "house_area": area,
-                        "style": style
-                    }
-                })
-
-        # 材料用量计算检测
-        material_keywords = ["需要多少", "用量", "要买多少", "材料计算"]
-        material_types = ["瓷砖", "地板", "乳胶漆", "墙纸", "水泥", "沙子", "电线", "水管"]
-        if any(kw in message for kw in material_keywords):
-            area = ParameterExtractor.extract_area(message)
-            material_type = None
-            for mt in material_types:
-                if mt in message:
-                    material_type = mt
-                    break
-
-            if area and material_type:
-                detected.append({
-                    "name": "material_calculator",
-                    "arguments": {
-                        "material_type": material_type,
-                        "area": area
-                    }
-                })
-
-        # 商家评分计算检测（B端）
-        merchant_score_keywords = ["店铺评分", "商家评分", "我的评分", "评分多少"]
-        if any(kw in message for kw in merchant_score_keywords):
-            # 尝试从消息中提取数据
-            amounts = ParameterExtractor.extract_multiple_amounts(message)
-            if len(amounts) >= 2:
-                detected.append({
-                    "name": "merchant_score_calculator",
-                    "arguments": {
-                        "monthly_orders": int(amounts[0]) if amounts else 50,
-                        "good_rate": 0.95,  # 默认值
-                        "response_time": 10,  # 默认值
-                    }
-                })
-
-        # 转化率分析检测（B端）
-        conversion_keywords = ["转化率", "转化分析", "成交率", "咨询转化"]
-        if any(kw in message for kw in conversion_keywords):
-            amounts = ParameterExtractor.extract_multiple_amounts(message)
-            if len(amounts) >= 3:
-                detected.append({
-                    "name": "conversion_rate_analyzer",
-                    "arguments": {
-                        "visitors": int(amounts[0]),
-                        "inquiries": int(amounts[1]),
-                        "orders": int(amounts[2])
-                    }
-                })
-
-        return detected
+        return [
+            {"name": name, "arguments": dict(arguments)}
+            for name, arguments in _match_tool_intents(message)
+        ]
 
     def _parse_tool_calls(self, response: str) -> List[FunctionCall]:
         """解析 LLM 响应中的工具调用"""
         calls = []
 
         # 尝试提取 JSON 格式的工具调用
-        json_pattern = r'```json\s*(.*?)\s*```'
-        matches = re.findall(json_pattern, response, re.DOTALL)
+        matches = _JSON_BLOCK_RE.findall(response)
 
         for match in matches:
             try:
@@ -0,0 +1,53 @@
+"""
+关键词匹配工具
+单次扫描文本找出出现的全部关键词，供任务分析、工具触发检测等模块共用
+"""
+import re
+from typing import Any, Iterable
+
+# Aho-Corasick 多模式匹配（可选，未安装时回退到合并正则的单次扫描）
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+def build_keyword_matcher(keywords: Iterable[str]) -> Any:
+    """
+    构建关键词匹配器：安装 pyahocorasick 时为自动机，否则为合并后的前瞻正则
+
+    零宽前瞻让每个位置都参与匹配，相互重叠的关键词也不会漏掉；
+    同一位置正则只取最长的关键词，因此正则模式附带"关键词 -> 其全部前缀关键词"的映射
+    （如"装修时间"命中即意味着"装修"也出现）
+    """
+    keywords = set(keywords)
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for kw in keywords:
+            automaton.add_word(kw, kw)
+        automaton.make_automaton()
+        return automaton
+
+    pattern = re.compile(
+        "(?=(%s))" % "|".join(
+            re.escape(kw) for kw in sorted(keywords, key=len, reverse=True)
+        )
+    )
+    prefixes = {
+        kw: tuple(other for other in keywords if kw.startswith(other))
+        for kw in keywords
+    }
+    return pattern, prefixes
+
+
+def find_keywords(matcher: Any, text: str) -> set:
+    """用 build_keyword_matcher 构建的匹配器单次扫描文本，返回出现的全部关键词"""
+    if AHOCORASICK_AVAILABLE:
+        return {kw for _, kw in matcher.iter(text)}
+
+    pattern, prefixes = matcher
+    matched = set()
+    for match in pattern.finditer(text):
+        matched.update(prefixes[match.group(1)])
+    return matched
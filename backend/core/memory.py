@@ -6,6 +6,7 @@
 import json
 import time
 import hashlib
+import heapq
 import os
 import sqlite3
 from typing import Any, Dict, List, Optional, Tuple
@@ -992,16 +993,48 @@ class SQLiteMemoryStore(MemoryStore):
     CREATE INDEX IF NOT EXISTS idx_importance ON memories(importance DESC);
     """
 
-    def __init__(self, db_path: str, max_size: int = 100000):
+    # PRAGMA synchronous / journal_mode 的合法取值（会直接拼入 PRAGMA 语句）
+    SYNCHRONOUS_MODES = frozenset({"OFF", "NORMAL", "FULL", "EXTRA", "0", "1", "2", "3"})
+    JOURNAL_MODES = frozenset({"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"})
+
+    # 插入或更新单条记忆，参数行由 _item_row 生成
+    INSERT_SQL = """
+        INSERT OR REPLACE INTO memories
+        (id, content, memory_type, importance, timestamp,
+         access_count, last_access, metadata, user_id, session_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def __init__(self, db_path: str, max_size: int = 100000,
+                 synchronous: str = "NORMAL", journal_mode: str = "WAL"):
         """
         初始化 SQLite 存储
 
         Args:
-            db_path: 数据库文件路径
+            db_path: 数据库文件路径；":memory:" 表示进程内共享的内存数据库（不落盘，
+                     各线程的连接看到同一份数据），也可直接传入 "file:" 开头的 URI
             max_size: 最大条目数
+            synchronous: PRAGMA synchronous 取值（测试等无需崩溃持久性的场景可用 "OFF"）
+            journal_mode: PRAGMA journal_mode 取值（默认 WAL，无需并发持久化时可用 "MEMORY"）
+
+        Raises:
+            ValueError: synchronous 或 journal_mode 不是 SQLite 支持的取值
         """
+        synchronous = str(synchronous).upper()
+        journal_mode = str(journal_mode).upper()
+        if synchronous not in self.SYNCHRONOUS_MODES:
+            raise ValueError(f"无效的 synchronous 取值: {synchronous}")
+        if journal_mode not in self.JOURNAL_MODES:
+            raise ValueError(f"无效的 journal_mode 取值: {journal_mode}")
+
+        if db_path == ":memory:":
+            # 每个线程单独连接 ":memory:" 会得到互不相通的数据库，改用共享缓存的命名内存库
+            db_path = f"file:memory_{os.urandom(8).hex()}?mode=memory&cache=shared"
+        self._uri = db_path.startswith("file:")
         self.db_path = db_path
         self.max_size = max_size
+        self.synchronous = synchronous
+        self.journal_mode = journal_mode
         self._lock = threading.RLock()
         self._local = threading.local()
 
@@ -1010,9 +1043,11 @@ class SQLiteMemoryStore(MemoryStore):
         self._misses = 0
 
         # 确保目录存在
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not self._uri:
+            os.makedirs(db_dir, exist_ok=True)
 
-        # 初始化数据库
+        # 初始化数据库（内存库在首个连接关闭前一直存在）
         self._init_db()
 
         logger.info(f"SQLite 记忆存储初始化完成: {db_path}")
@@ -1024,12 +1059,13 @@ class SQLiteMemoryStore(MemoryStore):
             self._local.conn = sqlite3.connect(
                 self.db_path,
                 check_same_thread=False,
-                timeout=30.0
+                timeout=30.0,
+                uri=self._uri
             )
             self._local.conn.row_factory = sqlite3.Row
-            # 启用 WAL 模式，提高并发性能
-            self._local.conn.execute("PRAGMA journal_mode=WAL")
-            self._local.conn.execute("PRAGMA synchronous=NORMAL")
+            # 默认启用 WAL 模式，提高并发性能
+            self._local.conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self._local.conn.execute(f"PRAGMA synchronous={self.synchronous}")
             self._local.conn.execute("PRAGMA cache_size=10000")
 
         try:
@@ -1044,55 +1080,82 @@ class SQLiteMemoryStore(MemoryStore):
             conn.executescript(self.CREATE_TABLE_SQL)
             conn.commit()
 
+    @staticmethod
+    def _item_row(item: MemoryItem, now: float) -> tuple:
+        """将记忆项转换为 INSERT_SQL 的参数行"""
+        return (
+            item.id,
+            json.dumps(item.content, ensure_ascii=False),
+            item.memory_type.value,
+            item.importance,
+            item.timestamp,
+            item.access_count,
+            item.last_access,
+            json.dumps(item.metadata, ensure_ascii=False),
+            item.metadata.get("user_id"),
+            item.metadata.get("session_id"),
+            now,
+        )
+
+    def _evict_for(self, conn: sqlite3.Connection, incoming: int):
+        """为即将写入的 incoming 条数据腾出空间：删除最旧且重要性最低的数据，至少 10%"""
+        count = conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+        overflow = count + incoming - self.max_size
+        if overflow > 0:
+            conn.execute("""
+                DELETE FROM memories WHERE id IN (
+                    SELECT id FROM memories
+                    ORDER BY importance ASC, timestamp ASC
+                    LIMIT ?
+                )
+            """, (max(overflow, self.max_size // 10),))
+
     def save(self, item: MemoryItem) -> bool:
         """保存记忆项"""
         with self._lock:
             try:
                 with self._get_connection() as conn:
                     # 检查容量，需要时清理旧数据
-                    cursor = conn.execute("SELECT COUNT(*) FROM memories")
-                    count = cursor.fetchone()[0]
-
-                    if count >= self.max_size:
-                        # 删除最旧且重要性最低的 10% 数据
-                        delete_count = max(1, self.max_size // 10)
-                        conn.execute("""
-                            DELETE FROM memories WHERE id IN (
-                                SELECT id FROM memories
-                                ORDER BY importance ASC, timestamp ASC
-                                LIMIT ?
-                            )
-                        """, (delete_count,))
-
-                    # 提取 user_id 和 session_id
-                    user_id = item.metadata.get("user_id")
-                    session_id = item.metadata.get("session_id")
-
+                    self._evict_for(conn, 1)
                     # 插入或更新
-                    conn.execute("""
-                        INSERT OR REPLACE INTO memories
-                        (id, content, memory_type, importance, timestamp,
-                         access_count, last_access, metadata, user_id, session_id, created_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        item.id,
-                        json.dumps(item.content, ensure_ascii=False),
-                        item.memory_type.value,
-                        item.importance,
-                        item.timestamp,
-                        item.access_count,
-                        item.last_access,
-                        json.dumps(item.metadata, ensure_ascii=False),
-                        user_id,
-                        session_id,
-                        time.time()
-                    ))
+                    conn.execute(self.INSERT_SQL, self._item_row(item, time.time()))
                     conn.commit()
                     return True
             except Exception as e:
                 logger.error(f"SQLite 保存失败: {e}")
                 return False
 
+    def save_many(self, items: List[MemoryItem]) -> int:
+        """
+        批量保存记忆项（单个事务，只提交一次）
+
+        与 save 相同，写入前按重要性和时间淘汰旧数据腾出空间；
+        批量本身超过 max_size 时只写入其中重要性最高、最新的 max_size 条
+
+        Returns:
+            实际写入的条目数，失败返回 0
+        """
+        if not items:
+            return 0
+
+        if len(items) > self.max_size:
+            items = heapq.nlargest(
+                self.max_size, items, key=lambda item: (item.importance, item.timestamp)
+            )
+        now = time.time()
+        rows = [self._item_row(item, now) for item in items]
+
+        with self._lock:
+            try:
+                with self._get_connection() as conn:
+                    self._evict_for(conn, len(rows))
+                    conn.executemany(self.INSERT_SQL, rows)
+                    conn.commit()
+                    return len(rows)
+            except Exception as e:
+                logger.error(f"SQLite 批量保存失败: {e}")
+                return 0
+
     def get(self, item_id: str) -> Optional[MemoryItem]:
         """获取记忆项"""
         with self._lock:
@@ -1211,6 +1274,18 @@ class SQLiteMemoryStore(MemoryStore):
                 logger.error(f"SQLite 会话删除失败: {e}")
                 return 0
 
+    def clear(self):
+        """清空存储"""
+        with self._lock:
+            try:
+                with self._get_connection() as conn:
+                    conn.execute("DELETE FROM memories")
+                    conn.commit()
+            except Exception as e:
+                logger.error(f"SQLite 清空失败: {e}")
+            self._hits = 0
+            self._misses = 0
+
     def _row_to_item(self, row: sqlite3.Row) -> MemoryItem:
         """将数据库行转换为 MemoryItem"""
         return MemoryItem(
@@ -9,6 +9,20 @@ from typing import Any, Dict, List, Optional, Union
 from dataclasses import dataclass, asdict
 from datetime import datetime
 
+# 流式事件每个 token 都要序列化一次，优先使用 orjson，未安装时回退到标准库 json
+try:
+    import orjson
+
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+
+    def to_json_line(obj: Any) -> str:
+        """序列化为一行 NDJSON（含结尾换行）"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode("utf-8")
+except ImportError:
+    def to_json_line(obj: Any) -> str:
+        """序列化为一行 NDJSON（含结尾换行）"""
+        return json.dumps(obj, ensure_ascii=False) + "\n"
+
 
 class OutputType(str, Enum):
     """输出类型枚举"""
@@ -155,7 +169,7 @@ class OutputFormatter:
             "data": self._serialize(data),
             "timestamp": datetime.now().isoformat(),
         }
-        return json.dumps(output, ensure_ascii=False) + "\n"
+        return to_json_line(output)
 
     def _serialize(self, data: Any) -> Any:
         """序列化数据"""
@@ -182,7 +196,7 @@ class OutputFormatter:
         }
         if reasoning_type:
             output["reasoning_type"] = reasoning_type
-        return json.dumps(output, ensure_ascii=False) + "\n"
+        return to_json_line(output)
 
     def answer(self, content: str) -> str:
         """回答内容输出（流式，兼容前端格式）"""
@@ -191,7 +205,7 @@ class OutputFormatter:
             "type": "answer",
             "content": content,
         }
-        return json.dumps(output, ensure_ascii=False) + "\n"
+        return to_json_line(output)
 
     def error(self, message: str, code: str = "UNKNOWN") -> str:
         """错误输出"""
@@ -240,7 +254,7 @@ class OutputFormatter:
             "type": "expert_debug",
             "data": data,
         }
-        return json.dumps(output, ensure_ascii=False) + "\n"
+        return to_json_line(output)
 
     # === 结构化数据输出方法 ===
 
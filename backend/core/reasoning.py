@@ -2,15 +2,18 @@
 高级推理系统
 支持思维链(CoT)、多步推理、自我反思、思维树(ToT)和ReAct模式
 """
+import heapq
 import json
+import re
 import time
-import asyncio
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Callable, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
-from abc import ABC, abstractmethod
 import threading
 
+from backend.core.keyword_matcher import build_keyword_matcher, find_keywords
+
 
 class ReasoningType(str, Enum):
     """推理类型"""
@@ -30,7 +33,26 @@ class TaskComplexity(str, Enum):
     EXPERT = "expert"       # 专家级
 
 
-@dataclass
+# 推理步骤类型的图标与日志前缀
+_STEP_ICONS = {
+    "think": "💭",
+    "act": "🔧",
+    "observe": "👁️",
+    "reflect": "🔄",
+    "plan": "📋",
+    "verify": "✅",
+}
+_STEP_LOG_PREFIXES = {
+    "think": "💭 思考",
+    "act": "🔧 执行",
+    "observe": "👁️ 观察",
+    "reflect": "🔄 反思",
+    "plan": "📋 规划",
+    "verify": "✅ 验证",
+}
+
+
+@dataclass(slots=True)
 class ReasoningStep:
     """推理步骤"""
     step_id: int
@@ -66,23 +88,26 @@ class ReasoningChain:
         self.steps.append(step)
         return step
 
+    def reset(self, query: str, reasoning_type: ReasoningType = None):
+        """重置为新查询的空推理链（复用对象，保留 chain_id）"""
+        self.query = query
+        if reasoning_type is not None:
+            self.reasoning_type = reasoning_type
+        self.steps.clear()
+        self.final_answer = None
+        self.confidence = 0.0
+        self.start_time = time.time()
+        self.end_time = None
+
     def get_thinking_log(self) -> List[str]:
         """获取思考日志"""
-        logs = []
-        for step in self.steps:
-            prefix = {
-                "think": "💭 思考",
-                "act": "🔧 执行",
-                "observe": "👁️ 观察",
-                "reflect": "🔄 反思",
-                "plan": "📋 规划",
-                "verify": "✅ 验证",
-            }.get(step.step_type, "📝")
-            logs.append(f"{prefix}: {step.content}")
-        return logs
+        return [
+            f"{_STEP_LOG_PREFIXES.get(step.step_type, '📝')}: {step.content}"
+            for step in self.steps
+        ]
 
 
-@dataclass
+@dataclass(slots=True)
 class Plan:
     """执行计划"""
     plan_id: str
@@ -117,14 +142,14 @@ class Plan:
             self.current_step += 1
 
 
-@dataclass
+@dataclass(slots=True)
 class ThoughtNode:
     """思维树节点"""
     node_id: str
     content: str
     parent_id: Optional[str] = None
     children: List[str] = field(default_factory=list)
-    score: float = 0.0  # 评估分数
+    score: float = 0.0  # 评估分数，加入思维树后通过 ThoughtTree.update_score 修改
     depth: int = 0
     is_terminal: bool = False
     metadata: Dict = field(default_factory=dict)
@@ -140,15 +165,40 @@ class ThoughtTree:
     best_path: List[str] = field(default_factory=list)
     max_depth: int = 3
     branching_factor: int = 3
+    # 叶子候选堆：(-分数, 插入序号, 节点ID)，有子节点或分数过期的条目在读取时惰性丢弃
+    _leaf_heap: List[Tuple[float, int, str]] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+    # 按插入序号（即 node_{序号} 中的整数）索引的节点与父节点序号（-1 表示无父节点）
+    _node_list: List[ThoughtNode] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+    _parent_seqs: List[int] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        """由构造时传入的节点表建立内部索引和叶子候选堆"""
+        seqs = {node_id: seq for seq, node_id in enumerate(self.nodes)}
+        for seq, (node_id, node) in enumerate(self.nodes.items()):
+            self._node_list.append(node)
+            self._parent_seqs.append(seqs.get(node.parent_id, -1))
+            if not node.children:
+                self._leaf_heap.append((-node.score, seq, node_id))
+        heapq.heapify(self._leaf_heap)
 
     def add_node(self, content: str, parent_id: str = None,
                  score: float = 0.0) -> ThoughtNode:
         """添加节点"""
-        node_id = f"node_{len(self.nodes)}"
+        seq = len(self.nodes)
+        node_id = f"node_{seq}"
         depth = 0
+        parent_seq = -1
         if parent_id and parent_id in self.nodes:
-            depth = self.nodes[parent_id].depth + 1
-            self.nodes[parent_id].children.append(node_id)
+            parent = self.nodes[parent_id]
+            depth = parent.depth + 1
+            parent.children.append(node_id)
+            parent_seq = self._insert_seq(parent_id)
 
         node = ThoughtNode(
             node_id=node_id,
@@ -158,10 +208,63 @@ class ThoughtTree:
             depth=depth,
         )
         self.nodes[node_id] = node
+        self._node_list.append(node)
+        self._parent_seqs.append(parent_seq)
+        heapq.heappush(self._leaf_heap, (-score, seq, node_id))
         return node
 
+    def _node_seq(self, node_id: str) -> Optional[int]:
+        """
+        解析节点ID中的插入序号
+
+        节点表被外部直接修改过（与内部列表不一致）或ID不是本树生成的，返回 None
+        """
+        if len(self._node_list) != len(self.nodes) or not node_id.startswith("node_"):
+            return None
+        try:
+            seq = int(node_id[5:])
+        except ValueError:
+            return None
+        if 0 <= seq < len(self._node_list) and self._node_list[seq].node_id == node_id:
+            return seq
+        return None
+
+    def _insert_seq(self, node_id: str) -> int:
+        """获取节点在节点表中的插入序号，ID 不是本树生成的时按字典顺序查找"""
+        seq = self._node_seq(node_id)
+        if seq is None:
+            seq = list(self.nodes).index(node_id)
+        return seq
+
+    def update_score(self, node_id: str, score: float):
+        """
+        更新节点分数（同步维护叶子候选堆）
+
+        叶子候选堆只在这里和 add_node 中更新，树中节点的分数必须通过本方法修改，
+        直接给 node.score 赋值不会被 get_best_leaf 察觉
+        """
+        node = self.nodes.get(node_id)
+        if node is None:
+            return
+        node.score = score
+        if not node.children:
+            heapq.heappush(self._leaf_heap, (-score, self._insert_seq(node_id), node_id))
+
     def get_path_to_node(self, node_id: str) -> List[str]:
         """获取从根到指定节点的路径"""
+        seq = self._node_seq(node_id)
+        if seq is not None:
+            # 快速路径：沿父节点序号回溯，不再逐跳查询节点字典
+            path = []
+            while seq >= 0:
+                node = self._node_list[seq]
+                path.append(node.node_id)
+                seq = self._parent_seqs[seq]
+            if node.parent_id:
+                # 父节点不在树中：与字典回溯一样保留其ID后停止
+                path.append(node.parent_id)
+            return path[::-1]
+
         path = []
         current_id = node_id
         while current_id:
@@ -171,11 +274,24 @@ class ThoughtTree:
         return list(reversed(path))
 
     def get_best_leaf(self) -> Optional[ThoughtNode]:
-        """获取最佳叶子节点"""
-        leaves = [n for n in self.nodes.values() if not n.children]
-        if not leaves:
-            return None
-        return max(leaves, key=lambda n: n.score)
+        """
+        获取最佳叶子节点（分数相同时取最早加入的节点）
+
+        从叶子候选堆顶读取，摊还 O(log N)。堆以 update_score 写入的分数为准，
+        绕过它直接修改的分数不保证生效
+        """
+        heap = self._leaf_heap
+        while heap:
+            neg_score, seq, node_id = heap[0]
+            node = self.nodes.get(node_id)
+            if node is None or node.children:
+                heapq.heappop(heap)
+            elif node.score != -neg_score:
+                # 堆顶条目分数已过期：按当前分数重新入堆
+                heapq.heapreplace(heap, (-node.score, seq, node_id))
+            else:
+                return node
+        return None
 
     def get_thinking_log(self) -> List[str]:
         """获取思维树的思考日志"""
@@ -189,7 +305,7 @@ class ThoughtTree:
         return logs
 
 
-@dataclass
+@dataclass(slots=True)
 class ReActStep:
     """ReAct 步骤"""
     step_id: int
@@ -200,6 +316,25 @@ class ReActStep:
     timestamp: float = field(default_factory=time.time)
 
 
+# 数字匹配（复杂度评估中的计算类特征）
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+# 子问题分隔符（中英文问号、逗号、分号与顿号）
+_SUB_QUESTION_SEP_RE = re.compile(r'[？?，,；;、]')
+
+# LLM 返回中的 JSON 对象
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# 复杂度评估中的结构特征词
+_CONJUNCTIONS = ("和", "以及", "还有", "另外", "同时", "并且")
+_CONDITIONALS = ("如果", "假设", "假如", "要是", "万一")
+_AMOUNT_UNITS = ("万", "元", "块", "平米", "㎡")
+_TIME_WORDS = ("多久", "什么时候", "几天", "几个月", "多长时间")
+
+# 各分析器类的关键词匹配器（首次使用时构建，子类覆盖关键词表时各自独立）
+_KEYWORD_MATCHERS: Dict[type, Any] = {}
+
+
 class TaskAnalyzer:
     """任务分析器"""
 
@@ -272,16 +407,40 @@ class TaskAnalyzer:
         Returns:
             TaskComplexity: 任务复杂度等级
         """
+        return _cached_complexity(cls, query)
+
+    @classmethod
+    def _match_keywords(cls, query: str) -> set:
+        """
+        单次扫描找出查询中出现的全部关键词（去重）
+
+        覆盖复杂/简单/领域/工具关键词表与结构特征词，
+        各评分维度只需对这个集合做成员判断，不再逐个关键词扫描查询
+        """
+        matcher = _KEYWORD_MATCHERS.get(cls)
+        if matcher is None:
+            keywords = set(cls.COMPLEX_KEYWORDS) | set(cls.SIMPLE_KEYWORDS) | set(cls.DOMAIN_COMPLEXITY)
+            for tool_keywords in cls.TOOL_KEYWORDS.values():
+                keywords.update(tool_keywords)
+            keywords.update(_CONJUNCTIONS + _CONDITIONALS + _AMOUNT_UNITS + _TIME_WORDS)
+            matcher = _KEYWORD_MATCHERS[cls] = build_keyword_matcher(keywords)
+
+        return find_keywords(matcher, query)
+
+    @classmethod
+    def _compute_complexity(cls, query: str) -> TaskComplexity:
+        """计算任务复杂度（未缓存版本，见 analyze_complexity）"""
         score = 0.0
+        matched = cls._match_keywords(query)
 
-        # 1. 复杂关键词匹配（带权重）
+        # 1. 复杂关键词匹配（带权重，按关键词表顺序累加）
         for keyword, weight in cls.COMPLEX_KEYWORDS.items():
-            if keyword in query:
+            if keyword in matched:
                 score += weight
 
         # 2. 简单关键词匹配（负权重）
         for keyword, weight in cls.SIMPLE_KEYWORDS.items():
-            if keyword in query:
+            if keyword in matched:
                 score += weight  # weight 已经是负数
 
         # 3. 问题结构分析
@@ -302,31 +461,27 @@ class TaskAnalyzer:
             score += 1
 
         # 3.3 并列结构检测（包含"和"、"以及"、"还有"等）
-        conjunctions = ["和", "以及", "还有", "另外", "同时", "并且"]
-        conjunction_count = sum(1 for c in conjunctions if c in query)
+        conjunction_count = sum(1 for c in _CONJUNCTIONS if c in matched)
         score += conjunction_count * 0.5
 
         # 3.4 条件结构检测（包含"如果"、"假设"等）
-        conditionals = ["如果", "假设", "假如", "要是", "万一"]
-        if any(c in query for c in conditionals):
+        if any(c in matched for c in _CONDITIONALS):
             score += 1.5
 
         # 4. 领域复杂度评估
         for domain, weight in cls.DOMAIN_COMPLEXITY.items():
-            if domain in query:
+            if domain in matched:
                 score += weight
 
         # 5. 数字和金额检测（通常需要计算）
-        import re
-        numbers = re.findall(r'\d+(?:\.\d+)?', query)
+        numbers = _NUMBER_RE.findall(query)
         if len(numbers) >= 2:
             score += 1  # 多个数字可能需要比较或计算
-        if any(unit in query for unit in ["万", "元", "块", "平米", "㎡"]):
+        if any(unit in matched for unit in _AMOUNT_UNITS):
             score += 0.5
 
         # 6. 时间范围检测（涉及规划）
-        time_words = ["多久", "什么时候", "几天", "几个月", "多长时间"]
-        if any(tw in query for tw in time_words):
+        if any(tw in matched for tw in _TIME_WORDS):
             score += 0.5
 
         # 根据综合评分确定复杂度
@@ -366,16 +521,17 @@ class TaskAnalyzer:
             "total_score": 0,
             "complexity": None,
         }
+        matched = cls._match_keywords(query)
 
         # 复杂关键词
         for keyword, weight in cls.COMPLEX_KEYWORDS.items():
-            if keyword in query:
+            if keyword in matched:
                 details["scores"]["complex_keywords"] += weight
                 details["matched_keywords"].append(f"+{keyword}({weight})")
 
         # 简单关键词
         for keyword, weight in cls.SIMPLE_KEYWORDS.items():
-            if keyword in query:
+            if keyword in matched:
                 details["scores"]["simple_keywords"] += weight
                 details["matched_keywords"].append(f"{keyword}({weight})")
 
@@ -396,25 +552,22 @@ class TaskAnalyzer:
             details["scores"]["questions"] = 1
 
         # 并列结构
-        conjunctions = ["和", "以及", "还有", "另外", "同时", "并且"]
-        details["scores"]["conjunctions"] = sum(0.5 for c in conjunctions if c in query)
+        details["scores"]["conjunctions"] = sum(0.5 for c in _CONJUNCTIONS if c in matched)
 
         # 条件结构
-        conditionals = ["如果", "假设", "假如", "要是", "万一"]
-        if any(c in query for c in conditionals):
+        if any(c in matched for c in _CONDITIONALS):
             details["scores"]["conditionals"] = 1.5
 
         # 领域复杂度
         for domain, weight in cls.DOMAIN_COMPLEXITY.items():
-            if domain in query:
+            if domain in matched:
                 details["scores"]["domain"] += weight
 
         # 数字
-        import re
-        numbers = re.findall(r'\d+(?:\.\d+)?', query)
+        numbers = _NUMBER_RE.findall(query)
         if len(numbers) >= 2:
             details["scores"]["numbers"] += 1
-        if any(unit in query for unit in ["万", "元", "块", "平米", "㎡"]):
+        if any(unit in matched for unit in _AMOUNT_UNITS):
             details["scores"]["numbers"] += 0.5
 
         # 计算总分
@@ -448,8 +601,7 @@ class TaskAnalyzer:
         try:
             response = await llm_caller(prompt)
             # 解析 JSON
-            import re
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(response)
             if json_match:
                 data = json.loads(json_match.group())
                 complexity_str = data.get("complexity", "moderate")
@@ -464,9 +616,8 @@ class TaskAnalyzer:
                                complexity: TaskComplexity) -> ReasoningType:
         """选择推理类型"""
         # 检查是否需要工具（使用 ReAct 模式）
-        for tool, keywords in cls.TOOL_KEYWORDS.items():
-            if any(kw in query for kw in keywords):
-                return ReasoningType.REACT
+        if cls.detect_required_tools(query):
+            return ReasoningType.REACT
 
         if complexity == TaskComplexity.SIMPLE:
             return ReasoningType.DIRECT
@@ -479,10 +630,16 @@ class TaskAnalyzer:
 
     @classmethod
     def detect_required_tools(cls, query: str) -> List[str]:
-        """检测问题需要的工具"""
+        """检测问题需要的工具（按查询缓存，返回新列表，可自由修改）"""
+        return list(_cached_required_tools(cls, query))
+
+    @classmethod
+    def _compute_required_tools(cls, query: str) -> List[str]:
+        """检测问题需要的工具（未缓存版本）"""
+        matched = cls._match_keywords(query)
         required_tools = []
         for tool, keywords in cls.TOOL_KEYWORDS.items():
-            if any(kw in query for kw in keywords):
+            if any(kw in matched for kw in keywords):
                 required_tools.append(tool)
         return required_tools
 
@@ -492,13 +649,7 @@ class TaskAnalyzer:
         sub_questions = []
 
         # 按标点分割
-        separators = ["？", "?", "，", ",", "；", ";", "、"]
-        parts = [query]
-        for sep in separators:
-            new_parts = []
-            for part in parts:
-                new_parts.extend(part.split(sep))
-            parts = new_parts
+        parts = _SUB_QUESTION_SEP_RE.split(query)
 
         # 过滤有效问题
         for part in parts:
@@ -509,6 +660,20 @@ class TaskAnalyzer:
         return sub_questions if len(sub_questions) > 1 else [query]
 
 
+# 规则分析只依赖查询文本与分析器类上的关键词表，按 (类, 查询) 缓存，
+# 子类覆盖关键词表时不会命中父类的缓存结果
+@lru_cache(maxsize=1024)
+def _cached_complexity(analyzer: type, query: str) -> TaskComplexity:
+    """缓存的任务复杂度评估"""
+    return analyzer._compute_complexity(query)
+
+
+@lru_cache(maxsize=1024)
+def _cached_required_tools(analyzer: type, query: str) -> Tuple[str, ...]:
+    """缓存的工具需求检测（元组，避免调用方修改共享结果）"""
+    return tuple(analyzer._compute_required_tools(query))
+
+
 class ReasoningEngine:
     """推理引擎"""
 
@@ -705,8 +870,7 @@ class ReasoningEngine:
 
         try:
             response = await self.llm_caller(prompt)
-            import re
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(response)
             if json_match:
                 data = json.loads(json_match.group())
                 thoughts = data.get("thoughts", [])
@@ -757,12 +921,11 @@ class ReasoningEngine:
 
         try:
             response = await self.llm_caller(prompt)
-            import re
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(response)
             if json_match:
                 data = json.loads(json_match.group())
                 score = float(data.get("score", 0.5))
-                node.score = score
+                tree.update_score(node_id, score)
                 return score
         except Exception:
             pass
@@ -986,14 +1149,7 @@ class ReasoningFormatter:
                 {
                     "step_id": step.step_id,
                     "type": step.step_type,
-                    "type_icon": {
-                        "think": "💭",
-                        "act": "🔧",
-                        "observe": "👁️",
-                        "reflect": "🔄",
-                        "plan": "📋",
-                        "verify": "✅",
-                    }.get(step.step_type, "📝"),
+                    "type_icon": _STEP_ICONS.get(step.step_type, "📝"),
                     "content": step.content,
                     "confidence": step.confidence,
                 }
@@ -1018,14 +1174,7 @@ class ReasoningFormatter:
         lines.append("")
 
         for step in chain.steps:
-            icon = {
-                "think": "💭",
-                "act": "🔧",
-                "observe": "👁️",
-                "reflect": "🔄",
-                "plan": "📋",
-                "verify": "✅",
-            }.get(step.step_type, "📝")
+            icon = _STEP_ICONS.get(step.step_type, "📝")
 
             lines.append(f"{icon} **{step.step_type}**: {step.content}")
 
@@ -4,6 +4,7 @@
 """
 import json
 import time
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
@@ -12,6 +13,13 @@ from backend.core.logging_config import get_logger
 
 logger = get_logger("stage_reasoning")
 
+# Aho-Corasick 多模式匹配（可选，未安装时回退到逐关键词子串查找）
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 
 # ============ 阶段定义 ============
 
@@ -405,6 +413,107 @@ B_END_STAGE_TRANSITIONS = {
 }
 
 
+# 关键词类别 → (权重, 日志标签)：显式关键词权重最高，隐式次之，问题类型最低
+_KEYWORD_WEIGHTS = (
+    ("explicit", 3.0, "显式"),
+    ("implicit", 2.0, "隐式"),
+    ("questions", 1.5, "问题"),
+)
+
+# 按用户类型缓存的 Aho-Corasick 自动机
+_KEYWORD_AUTOMATA: Dict[str, Any] = {}
+
+
+def _get_keyword_automaton(keywords_map: dict, user_type: str):
+    """构建（或获取已构建的）关键词自动机，每个关键词映射到它所属的全部 (阶段, 权重, 标签)"""
+    automaton = _KEYWORD_AUTOMATA.get(user_type)
+    if automaton is None:
+        targets: Dict[str, list] = {}
+        for stage, keywords in keywords_map.items():
+            for category, weight, label in _KEYWORD_WEIGHTS:
+                for kw in keywords.get(category, []):
+                    targets.setdefault(kw, []).append((stage, weight, label))
+
+        automaton = ahocorasick.Automaton()
+        for kw, kw_targets in targets.items():
+            automaton.add_word(kw, (kw, tuple(kw_targets)))
+        automaton.make_automaton()
+        _KEYWORD_AUTOMATA[user_type] = automaton
+    return automaton
+
+
+def _score_keywords(query: str, keywords_map: dict, user_type: str) -> Tuple[Dict[str, float], List[str]]:
+    """
+    计算各阶段的关键词得分（每个关键词出现即计分一次，与出现次数无关）
+
+    安装 pyahocorasick 时单次扫描问题即可得到全部命中，否则逐个关键词做子串查找
+
+    Returns:
+        (阶段得分, 命中详情)
+    """
+    scores: Dict[str, float] = {}
+    matched_keywords = []
+
+    if AHOCORASICK_AVAILABLE:
+        seen = set()
+        for _, (kw, kw_targets) in _get_keyword_automaton(keywords_map, user_type).iter(query):
+            if kw in seen:
+                continue
+            seen.add(kw)
+            for stage, weight, label in kw_targets:
+                scores[stage] = scores.get(stage, 0.0) + weight
+                matched_keywords.append(f"[{label}]{kw}→{stage}")
+        return scores, matched_keywords
+
+    for stage, keywords in keywords_map.items():
+        score = 0.0
+        for category, weight, label in _KEYWORD_WEIGHTS:
+            for kw in keywords.get(category, []):
+                if kw in query:
+                    score += weight
+                    matched_keywords.append(f"[{label}]{kw}→{stage}")
+        scores[stage] = score
+
+    return scores, matched_keywords
+
+
+@lru_cache(maxsize=512)
+def _keyword_classify(query: str, user_type: str) -> Tuple[str, float]:
+    """
+    基于关键词的阶段检测（结果只取决于问题和用户类型，按二者缓存）
+
+    Returns:
+        (阶段, 置信度)
+    """
+    keywords_map = C_END_STAGE_KEYWORDS if user_type == "c_end" else B_END_STAGE_KEYWORDS
+    default_stage = "准备" if user_type == "c_end" else "入驻"
+
+    scores, matched_keywords = _score_keywords(query, keywords_map, user_type)
+
+    # 按阶段定义顺序取最高分，同分时保留靠前的阶段
+    best_stage = default_stage
+    best_score = 0.0
+    for stage in keywords_map:
+        score = scores.get(stage, 0.0)
+        if score > best_score:
+            best_score = score
+            best_stage = stage
+
+    # 计算置信度（归一化）
+    confidence = min(1.0, best_score / 6.0) if best_score > 0 else 0.3
+
+    if matched_keywords:
+        logger.debug("关键词匹配详情", extra={
+            "query": query[:100],
+            "matched_keywords": matched_keywords,
+            "best_stage": best_stage,
+            "best_score": best_score,
+            "confidence": confidence,
+        })
+
+    return best_stage, confidence
+
+
 # ============ 阶段理解类 ============
 
 class StageUnderstanding:
@@ -485,51 +594,7 @@ class StageUnderstanding:
         Returns:
             (阶段, 置信度)
         """
-        keywords_map = C_END_STAGE_KEYWORDS if user_type == "c_end" else B_END_STAGE_KEYWORDS
-        default_stage = "准备" if user_type == "c_end" else "入驻"
-
-        best_stage = default_stage
-        best_score = 0.0
-        matched_keywords = []
-
-        for stage, keywords in keywords_map.items():
-            score = 0.0
-
-            # 显式关键词权重最高
-            for kw in keywords.get("explicit", []):
-                if kw in query:
-                    score += 3.0
-                    matched_keywords.append(f"[显式]{kw}→{stage}")
-
-            # 隐式关键词次之
-            for kw in keywords.get("implicit", []):
-                if kw in query:
-                    score += 2.0
-                    matched_keywords.append(f"[隐式]{kw}→{stage}")
-
-            # 问题类型关键词
-            for kw in keywords.get("questions", []):
-                if kw in query:
-                    score += 1.5
-                    matched_keywords.append(f"[问题]{kw}→{stage}")
-
-            if score > best_score:
-                best_score = score
-                best_stage = stage
-
-        # 计算置信度（归一化）
-        confidence = min(1.0, best_score / 6.0) if best_score > 0 else 0.3
-
-        if matched_keywords:
-            logger.debug("关键词匹配详情", extra={
-                "query": query[:100],
-                "matched_keywords": matched_keywords,
-                "best_stage": best_stage,
-                "best_score": best_score,
-                "confidence": confidence,
-            })
-
-        return best_stage, confidence
+        return _keyword_classify(query, user_type)
 
     async def _llm_stage_analysis(
         self,
@@ -852,6 +917,45 @@ class ExpertRoleManager:
             return role.system_prompt
         return ""
 
+    def build_system_prompt(
+        self,
+        expert: Optional[ExpertRole],
+        context: StageContext = None
+    ) -> str:
+        """
+        基于已确定的专家角色构建系统提示词（可根据上下文定制）
+
+        Args:
+            expert: 专家角色（通常来自 analyze_and_get_expert，无需再按阶段查找）
+            context: 阶段上下文（可选，用于定制提示词）
+
+        Returns:
+            系统提示词
+        """
+        base_prompt = expert.system_prompt if expert else ""
+
+        if context:
+            # 根据上下文添加额外指导
+            additions = []
+
+            if context.emotional_state == "焦虑":
+                additions.append("\n## 特别注意\n用户当前比较焦虑，请先安抚情绪，再给出建议。语气要温和、有耐心。")
+            elif context.emotional_state == "困惑":
+                additions.append("\n## 特别注意\n用户当前比较困惑，请用简单易懂的语言解释，避免专业术语。")
+            elif context.emotional_state == "不满":
+                additions.append("\n## 特别注意\n用户当前有不满情绪，请先表示理解，再帮助分析问题和解决方案。")
+
+            if context.focus_points:
+                additions.append(f"\n## 用户关注重点\n{', '.join(context.focus_points)}")
+
+            if context.potential_needs:
+                additions.append(f"\n## 可能的潜在需求\n{', '.join(context.potential_needs)}")
+
+            if additions:
+                base_prompt += "\n" + "\n".join(additions)
+
+        return base_prompt
+
     def get_all_experts(self, user_type: str = "c_end") -> Dict[str, ExpertRole]:
         """获取所有专家角色"""
         return self.c_end_experts if user_type == "c_end" else self.b_end_experts
@@ -926,29 +1030,8 @@ class StageAwareReasoning:
         Returns:
             系统提示词
         """
-        base_prompt = self.expert_manager.get_expert_prompt(stage, user_type)
-
-        if context:
-            # 根据上下文添加额外指导
-            additions = []
-
-            if context.emotional_state == "焦虑":
-                additions.append("\n## 特别注意\n用户当前比较焦虑，请先安抚情绪，再给出建议。语气要温和、有耐心。")
-            elif context.emotional_state == "困惑":
-                additions.append("\n## 特别注意\n用户当前比较困惑，请用简单易懂的语言解释，避免专业术语。")
-            elif context.emotional_state == "不满":
-                additions.append("\n## 特别注意\n用户当前有不满情绪，请先表示理解，再帮助分析问题和解决方案。")
-
-            if context.focus_points:
-                additions.append(f"\n## 用户关注重点\n{', '.join(context.focus_points)}")
-
-            if context.potential_needs:
-                additions.append(f"\n## 可能的潜在需求\n{', '.join(context.potential_needs)}")
-
-            if additions:
-                base_prompt += "\n" + "\n".join(additions)
-
-        return base_prompt
+        expert = self.expert_manager.get_expert_role(stage, user_type)
+        return self.expert_manager.build_system_prompt(expert, context)
 
 
 # ============ 全局实例 ============
@@ -58,7 +58,7 @@ class ToolParameter:
         return True, ""
 
 
-@dataclass
+@dataclass(slots=True)
 class ToolResult:
     """工具执行结果"""
     success: bool
@@ -134,6 +134,22 @@ class ToolRegistry:
             self.tools[tool.name] = tool
             return True
 
+    def register_many(self, tools: List[ToolDefinition]) -> int:
+        """
+        批量注册工具（只获取一次锁），已存在的同名工具跳过
+
+        Returns:
+            新注册的工具数量
+        """
+        registered = 0
+        with self._lock:
+            for tool in tools:
+                if tool.name in self.tools:
+                    continue
+                self.tools[tool.name] = tool
+                registered += 1
+        return registered
+
     def unregister(self, name: str) -> bool:
         """注销工具"""
         with self._lock:
@@ -247,19 +263,25 @@ class ToolRegistry:
         Raises:
             TimeoutError: 执行超时
         """
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(handler, **kwargs)
-            try:
-                return future.result(timeout=timeout)
-            except concurrent.futures.TimeoutError:
-                # 尝试取消任务
-                future.cancel()
-                raise TimeoutError(f"执行超时（{timeout}秒）")
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(handler, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            # 尝试取消任务
+            future.cancel()
+            raise TimeoutError(f"执行超时（{timeout}秒）")
+        finally:
+            # 不等待仍在运行的处理函数：线程无法强制终止，超时后立即返回，任务结束后线程自行退出
+            executor.shutdown(wait=False)
 
     async def call_async(self, name: str, timeout: float = 30.0, **kwargs) -> ToolResult:
         """
         异步调用工具（带超时控制）
 
+        协程处理函数（async def）直接在事件循环中执行，超时时协作式取消；
+        同步处理函数放入线程池执行
+
         Args:
             name: 工具名称
             timeout: 超时时间（秒），默认30秒
@@ -285,12 +307,13 @@ class ToolRegistry:
         # 异步执行工具（带超时控制）
         start_time = time.time()
         try:
-            # 在线程池中执行同步函数
-            loop = asyncio.get_event_loop()
-            result = await asyncio.wait_for(
-                loop.run_in_executor(None, lambda: tool.handler(**kwargs)),
-                timeout=timeout
-            )
+            if inspect.iscoroutinefunction(tool.handler):
+                awaitable = tool.handler(**kwargs)
+            else:
+                # 在线程池中执行同步函数
+                loop = asyncio.get_running_loop()
+                awaitable = loop.run_in_executor(None, lambda: tool.handler(**kwargs))
+            result = await asyncio.wait_for(awaitable, timeout=timeout)
             execution_time = time.time() - start_time
 
             # 更新统计
@@ -3,15 +3,15 @@
 支持按用户类型（C端/B端）进行差异化检索
 """
 import os
-import sys
+import atexit
 import hashlib
+import heapq
+import queue
 import threading
-from datetime import datetime
+import time
+from operator import itemgetter
 from typing import Optional, Set
 
-# 添加父目录到路径以导入config
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
 from langchain_chroma import Chroma
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -25,27 +25,73 @@ except ImportError:
     import logging
     logger = logging.getLogger(__name__)
 
+from backend.core.cache import LRUCache
+
 try:
     from PyPDF2 import PdfReader
     PDF_SUPPORT = True
 except ImportError:
     PDF_SUPPORT = False
 
+try:
+    from pybloom_live import ScalableBloomFilter
+    BLOOM_SUPPORT = True
+except ImportError:
+    BLOOM_SUPPORT = False
+
+try:
+    import orjson
+
+    def _dump_record(record: dict) -> bytes:
+        return orjson.dumps(record)
+
+    _load_record = orjson.loads
+except ImportError:
+    import json
+
+    def _dump_record(record: dict) -> bytes:
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    _load_record = json.loads
+
+
+# (Document, score) 元组的排序键
+_SCORE_KEY = itemgetter(1)
+
 
 class MD5Store:
     """
     MD5 存储管理器
 
     使用内存 Set 加速查询，同时持久化到文件
-    线程安全
+    文件每行一条记录：纯 MD5 字符串，或带元数据的 JSON 对象（{"md5": ..., ...}）
+    安装 pybloom_live 时在 Set 前加一层布隆过滤器，快速排除未出现过的 MD5
+    线程安全：锁内只做内存操作，文件追加由后台写线程完成；
+    写线程异常退出或已 close() 后，add() 改为同步追加，写入失败时直接抛出异常
     """
 
+    # 布隆过滤器初始容量下限、相对已加载记录数的余量倍数与误判率
+    # （误判只会回落到 Set 精确判断，不会漏判；超出容量时可扩展过滤器自动追加分片）
+    BLOOM_MIN_CAPACITY = 100_000
+    BLOOM_HEADROOM = 2
+    BLOOM_ERROR_RATE = 1e-4
+
     def __init__(self, file_path: str):
         self.file_path = file_path
         self._md5_set: Set[str] = set()
-        self._lock = threading.RLock()
-        self._dirty = False
+        self._lock = threading.Lock()
+        # 同步追加文件时使用（写线程不可用后才会走同步路径）
+        self._file_lock = threading.Lock()
         self._load()
+        self._bloom = self._build_bloom() if BLOOM_SUPPORT else None
+
+        # 后台写线程：add() 只入队，磁盘 IO 不占用锁
+        self._write_queue: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="md5-store-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
 
     def _load(self):
         """从文件加载 MD5 集合"""
@@ -53,24 +99,75 @@ class MD5Store:
             return
 
         try:
-            with open(self.file_path, "r", encoding="utf-8") as f:
+            with open(self.file_path, "rb") as f:
                 for line in f:
-                    md5 = line.strip()
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if line.startswith(b"{"):
+                        md5 = _load_record(line).get("md5")
+                    else:
+                        md5 = line.decode("utf-8")
                     if md5:
                         self._md5_set.add(md5)
             logger.info(f"加载 {len(self._md5_set)} 条 MD5 记录")
         except Exception as e:
             logger.error(f"加载 MD5 文件失败: {e}")
 
+    def _build_bloom(self) -> "ScalableBloomFilter":
+        """按已加载的记录数（留出余量）创建布隆过滤器并填充"""
+        capacity = max(self.BLOOM_MIN_CAPACITY, len(self._md5_set) * self.BLOOM_HEADROOM)
+        bloom = ScalableBloomFilter(initial_capacity=capacity, error_rate=self.BLOOM_ERROR_RATE)
+        for md5 in self._md5_set:
+            bloom.add(md5)
+        return bloom
+
+    def _write_loop(self):
+        """持续从队列取出记录追加到文件，收到 None 时退出"""
+        record = None
+        try:
+            with open(self.file_path, "ab") as f:
+                for record in iter(self._write_queue.get, None):
+                    f.write(record)
+                    record = None
+                    # 队列暂时清空时刷盘，批量写入时减少 flush 次数
+                    if self._write_queue.empty():
+                        f.flush()
+        except Exception as e:
+            logger.error(f"MD5 写线程异常退出，后续记录改为同步写入: {e}")
+            # 未写成功的记录放回队列，由同步写入路径补写
+            if record is not None:
+                self._write_queue.put(record)
+
+    def _append_sync(self, record: Optional[bytes] = None):
+        """同步追加记录到文件，先补写写线程退出时遗留在队列中的记录"""
+        with self._file_lock:
+            with open(self.file_path, "ab") as f:
+                while True:
+                    try:
+                        pending = self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if pending is not None:
+                        f.write(pending)
+                if record is not None:
+                    f.write(record)
+
     def contains(self, md5_str: str) -> bool:
         """检查 MD5 是否存在（O(1) 复杂度）"""
         with self._lock:
+            if self._bloom is not None and md5_str not in self._bloom:
+                return False
             return md5_str in self._md5_set
 
-    def add(self, md5_str: str) -> bool:
+    def add(self, md5_str: str, metadata: Optional[dict] = None) -> bool:
         """
         添加 MD5（线程安全）
 
+        Args:
+            md5_str: MD5 字符串
+            metadata: 随记录一起持久化的元数据（可选）
+
         Returns:
             True 如果是新增，False 如果已存在
         """
@@ -79,17 +176,33 @@ class MD5Store:
                 return False
 
             self._md5_set.add(md5_str)
-            self._dirty = True
+            if self._bloom is not None:
+                self._bloom.add(md5_str)
 
-            # 立即追加到文件
+        # 交给写线程异步追加到文件
+        if metadata:
+            record = _dump_record({"md5": md5_str, **metadata}) + b"\n"
+        else:
+            record = md5_str.encode("utf-8") + b"\n"
+        if self._writer.is_alive():
+            self._write_queue.put(record)
+        else:
+            # 写线程已退出（异常或已 close）：同步写入，失败时向调用方抛出
+            self._append_sync(record)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """停止写线程，等待队列中的记录全部落盘"""
+        if self._writer.is_alive():
+            self._write_queue.put(None)
+            self._writer.join(timeout)
+        if not self._writer.is_alive() and not self._write_queue.empty():
+            # 写线程异常退出时遗留的记录
             try:
-                with open(self.file_path, "a", encoding="utf-8") as f:
-                    f.write(md5_str + "\n")
+                self._append_sync()
             except Exception as e:
                 logger.error(f"保存 MD5 失败: {e}")
 
-            return True
-
     def size(self) -> int:
         """获取记录数量"""
         return len(self._md5_set)
@@ -102,20 +215,35 @@ class MultiCollectionKB:
     _md5_store: Optional[MD5Store] = None
     _md5_lock = threading.Lock()
 
+    # 类级别的文本分割器（只读，可跨实例、跨线程共享）
+    _splitter: Optional[RecursiveCharacterTextSplitter] = None
+    _splitter_lock = threading.Lock()
+
     def __init__(self):
         os.makedirs(config.persist_directory, exist_ok=True)
         self.embedding = DashScopeEmbeddings(model=config.embedding_model_name)
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.chunk_size,
-            chunk_overlap=config.chunk_overlap,
-            separators=config.separators,
-            length_function=len,
-        )
+        self.splitter = self._get_splitter()
         self._collections: dict[str, Chroma] = {}
         self._collection_lock = threading.RLock()
+        # 查询向量缓存：同一查询在多个集合间只做一次 embedding
+        self._query_embedding_cache = LRUCache[str, list](max_size=1024, ttl=60)
         self._init_collections()
         self._init_md5_store()
 
+    @classmethod
+    def _get_splitter(cls) -> RecursiveCharacterTextSplitter:
+        """获取共享的文本分割器（单例）"""
+        if cls._splitter is None:
+            with cls._splitter_lock:
+                if cls._splitter is None:
+                    cls._splitter = RecursiveCharacterTextSplitter(
+                        chunk_size=config.chunk_size,
+                        chunk_overlap=config.chunk_overlap,
+                        separators=config.separators,
+                        length_function=len,
+                    )
+        return cls._splitter
+
     @classmethod
     def _init_md5_store(cls):
         """初始化 MD5 存储（单例）"""
@@ -201,11 +329,11 @@ class MultiCollectionKB:
         if self._check_md5(md5_hex):
             return "[跳过] 内容已存在于知识库中"
 
-        # 分割文本
-        if len(text) > config.max_split_char_number:
-            chunks = self.splitter.split_text(text)
+        # 分割文本：不超过单块长度的短文本直接作为一个块，完全跳过分割器
+        if len(text) <= max(config.max_split_char_number, config.chunk_size):
+            chunks = (text,)
         else:
-            chunks = [text]
+            chunks = self.splitter.split_text(text)
 
         # 构建元数据
         metadata = {
@@ -214,7 +342,7 @@ class MultiCollectionKB:
             "target_user": target_user,
             "priority": priority,
             "keywords": ",".join(keywords) if keywords else "",
-            "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "create_time": int(time.time()),  # Unix 时间戳，展示时再格式化
             "operator": operator,
         }
 
@@ -222,7 +350,7 @@ class MultiCollectionKB:
         collection = self._get_or_create_collection(collection_name)
         collection.add_texts(
             chunks,
-            metadatas=[metadata for _ in chunks],
+            metadatas=[metadata] * len(chunks),
         )
 
         self._save_md5(md5_hex)
@@ -283,6 +411,14 @@ class MultiCollectionKB:
         except Exception as e:
             return f"[错误] PDF解析失败: {str(e)}"
 
+    def _embed_query(self, query: str) -> list[float]:
+        """计算查询向量（带 TTL 缓存，热点查询只请求一次 embedding）"""
+        vector = self._query_embedding_cache.get(query)
+        if vector is None:
+            vector = self.embedding.embed_query(query)
+            self._query_embedding_cache.set(query, vector)
+        return vector
+
     def search(
         self,
         query: str,
@@ -304,7 +440,9 @@ class MultiCollectionKB:
         if not collection:
             return []
 
-        return collection.similarity_search_with_score(query, k=k)
+        return collection.similarity_search_by_vector_with_relevance_scores(
+            self._embed_query(query), k=k
+        )
 
     def search_by_user_type(
         self,
@@ -326,17 +464,25 @@ class MultiCollectionKB:
         collections = self.get_collections_for_user_type(user_type)
         all_results = []
 
+        # 查询向量只计算一次，在各集合间复用
+        query_vector = self._embed_query(query)
+
         for coll_name in collections:
-            results = self.search(query, coll_name, k=k)
+            collection = self.get_collection(coll_name)
+            if not collection:
+                continue
+            # 返回值为 (Document, L2距离)，与 similarity_search_with_score 一致
+            results = collection.similarity_search_by_vector_with_relevance_scores(
+                query_vector, k=k
+            )
             # 在文档元数据中添加集合来源
             for doc, score in results:
                 doc.metadata["collection"] = coll_name
                 all_results.append((doc, score))
 
-        # 按分数排序（L2距离越小越相关）
-        all_results.sort(key=lambda x: x[1])
-
-        return all_results[:k * 2]  # 返回前 k*2 个最相关结果
+        # 取前 k*2 个最相关结果（L2距离越小越相关）
+        # 部分排序 + C 实现的 itemgetter，避免全量排序和逐元素调用 lambda
+        return heapq.nsmallest(k * 2, all_results, key=_SCORE_KEY)
 
     def get_collection_stats(self, collection_name: str) -> dict:
         """获取集合统计信息"""
@@ -361,7 +507,7 @@ class MultiCollectionKB:
 
 
 if __name__ == "__main__":
-    # 测试代码
+    # 测试代码（在项目根目录执行: python -m backend.knowledge.multi_collection_kb）
     kb = MultiCollectionKB()
     print("可用集合:", kb.list_collections())
     print("C端可访问集合:", kb.get_collections_for_user_type("c_end"))
@@ -7,8 +7,10 @@ import sys
 import glob
 from typing import Optional
 
-# 添加项目根目录到路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# 推荐以模块方式运行: python -m backend.scripts.ingest_all
+# 仅在直接按文件路径执行时才把项目根目录加入路径
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from backend.core.singleton import get_knowledge_base
 from backend.crawlers.decoration_crawler import create_sample_decoration_data
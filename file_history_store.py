@@ -6,10 +6,32 @@ import json
 import os
 import time
 import threading
+import zlib
 from typing import Sequence, Optional, Dict
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
 
+# 优先使用 orjson（C 实现，直接输出 bytes），未安装时回退到标准库 json
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    _loads = json.loads
+
+# 尝试导入 MessagePack
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
 # 尝试导入 Redis
 try:
     import redis
@@ -25,6 +47,49 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 
+# 消息序列化格式：json / msgpack（msgpack 未安装时回退到 json）
+# 读取时按记录自动识别格式，切换格式不影响已有历史
+STORAGE_FORMAT = os.getenv("HISTORY_STORAGE_FORMAT", "json")
+USE_MSGPACK = STORAGE_FORMAT == "msgpack" and MSGPACK_AVAILABLE
+
+# MessagePack 历史文件的文件头
+_MSGPACK_MAGIC = b"MPK1"
+
+# Redis 中超过该字节数的消息使用 zlib(level=1) 压缩存储，0 表示不压缩
+REDIS_COMPRESS_MIN_BYTES = int(os.getenv("HISTORY_COMPRESS_MIN_BYTES", "1024"))
+# 压缩记录的前缀（JSON 记录以 '{' 开头、MessagePack 消息以 map 类型开头，不会冲突）
+_ZLIB_MAGIC = b"Z1"
+
+
+def _encode_record(record: dict) -> bytes:
+    """按配置的格式序列化单条消息"""
+    if USE_MSGPACK:
+        return msgpack.packb(record, use_bin_type=True)
+    return _dumps(record)
+
+
+def _compress_record(data: bytes) -> bytes:
+    """长消息压缩存储，短消息原样返回"""
+    if REDIS_COMPRESS_MIN_BYTES and len(data) >= REDIS_COMPRESS_MIN_BYTES:
+        return _ZLIB_MAGIC + zlib.compress(data, 1)
+    return data
+
+
+def _require_msgpack() -> None:
+    """读取已有的 MessagePack 数据前检查依赖，未安装时给出明确的错误"""
+    if not MSGPACK_AVAILABLE:
+        raise ImportError("历史记录为 MessagePack 格式，但 msgpack 未安装，请运行: pip install msgpack")
+
+
+def _decode_record(data: bytes) -> dict:
+    """反序列化单条消息（自动识别压缩；JSON 记录以 '{' 开头，否则视为 MessagePack）"""
+    if data[:2] == _ZLIB_MAGIC:
+        data = zlib.decompress(data[2:])
+    if data[:1] == b"{":
+        return _loads(data)
+    _require_msgpack()
+    return msgpack.unpackb(data, raw=False)
+
 
 def get_history(session_id: str) -> BaseChatMessageHistory:
     """
@@ -45,6 +110,16 @@ def get_history(session_id: str) -> BaseChatMessageHistory:
 
 
 class FileChatMessageHistory(BaseChatMessageHistory):
+    """
+    文件会话历史存储
+
+    新增消息只追加写入，不再读取并重写整个历史文件。支持两种文件格式：
+    - JSONL：每行一条序列化后的消息（默认）
+    - MessagePack：文件头 MPK1 后连续存放的 msgpack 对象（HISTORY_STORAGE_FORMAT=msgpack）
+    旧版 JSON 数组格式或与当前配置不同格式的文件，在首次读写时自动迁移。
+    已读取过的消息缓存在内存中，后续读取不再访问磁盘。
+    """
+
     def __init__(self, session_id, storage_path):
         self.session_id = session_id        # 会话id
         self.storage_path = storage_path    # 不同会话id的存储文件，所在的文件夹路径
@@ -54,38 +129,108 @@ class FileChatMessageHistory(BaseChatMessageHistory):
         # 确保文件夹是存在的
         os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
 
+        # 内存中的消息缓存，首次读取时加载
+        self._cache: Optional[list[BaseMessage]] = None
+        # 已确认文件格式与当前配置一致
+        self._format_checked = False
+
     def add_messages(self, messages: Sequence[BaseMessage]) -> None:
-        # Sequence序列 类似list、tuple
-        all_messages = list(self.messages)      # 已有的消息列表
-        all_messages.extend(messages)           # 新的和已有的融合成一个list
-
-        # 将数据同步写入到本地文件中
-        # 类对象写入文件 -> 一堆二进制
-        # 为了方便，可以将BaseMessage消息转为字典（借助json模块以json字符串写入文件）
-        # 官方message_to_dict：单个消息对象（BaseMessage类实例） -> 字典
-        # new_messages = []
-        # for message in all_messages:
-        #     d = message_to_dict(message)
-        #     new_messages.append(d)
-
-        new_messages = [message_to_dict(message) for message in all_messages]
-        # 将数据写入文件
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump(new_messages, f)
+        """批量追加消息
+
+        RunnableWithMessageHistory 每轮以 [用户消息, AI 消息] 调用一次；
+        写入路径只序列化新消息，从不读取已有历史。缓存未加载时保持未加载，
+        缓存已加载时原地扩展
+        """
+        self._ensure_file_format()
+
+        records = [message_to_dict(message) for message in messages]
+        with open(self.file_path, "ab") as f:
+            if USE_MSGPACK and f.tell() == 0:
+                f.write(_MSGPACK_MAGIC)
+            f.write(self._encode_records(records))
+
+        if self._cache is not None:
+            self._cache.extend(messages)
 
     @property       # @property装饰器将messages方法变成成员属性用
     def messages(self) -> list[BaseMessage]:
-        # 当前文件内： list[字典]
+        return list(self._ensure_loaded())
+
+    def _ensure_loaded(self) -> list[BaseMessage]:
+        """确保消息已载入内存缓存（已缓存时不访问存储）"""
+        if self._cache is None:
+            self._cache = self._load()
+        return self._cache
+
+    @staticmethod
+    def _encode_records(records: list[dict]) -> bytes:
+        """按配置的格式序列化一批消息"""
+        if USE_MSGPACK:
+            return b"".join(_encode_record(r) for r in records)
+        return b"".join(_dumps(r) + b"\n" for r in records)
+
+    def _read_records(self) -> tuple[list[dict], str]:
+        """读取文件中的全部消息
+
+        Returns:
+            (消息字典列表, 文件格式 msgpack|jsonl|legacy|empty)
+        """
         try:
-            with open(self.file_path, "r", encoding="utf-8") as f:
-                messages_data = json.load(f)    # 返回值就是：list[字典]
-                return messages_from_dict(messages_data)
+            with open(self.file_path, "rb") as f:
+                content = f.read()
         except FileNotFoundError:
-            return []
+            return [], "empty"
+
+        if content.startswith(_MSGPACK_MAGIC):
+            _require_msgpack()
+            unpacker = msgpack.Unpacker(raw=False)
+            unpacker.feed(content[len(_MSGPACK_MAGIC):])
+            return list(unpacker), "msgpack"
+        if content.lstrip().startswith(b"["):
+            # 旧版格式：整个文件是一个 JSON 数组
+            return _loads(content), "legacy"
+        records = [_loads(line) for line in content.splitlines() if line]
+        return records, "jsonl" if records else "empty"
+
+    def _ensure_file_format(self) -> None:
+        """确保文件格式与当前配置一致，不一致时整体迁移（每个实例只检查一次）"""
+        if self._format_checked:
+            return
+        self._format_checked = True
+
+        try:
+            with open(self.file_path, "rb") as f:
+                head = f.read(len(_MSGPACK_MAGIC))
+        except FileNotFoundError:
+            return
+        if not head:
+            return
+        if (head == _MSGPACK_MAGIC) == USE_MSGPACK and not head.lstrip().startswith(b"["):
+            return
+
+        records, _ = self._read_records()
+        self._rewrite(records)
+
+    def _load(self) -> list[BaseMessage]:
+        """从文件读取全部消息"""
+        records, file_format = self._read_records()
+        expected = "msgpack" if USE_MSGPACK else "jsonl"
+        if file_format not in (expected, "empty"):
+            self._rewrite(records)
+        self._format_checked = True
+        return messages_from_dict(records)
+
+    def _rewrite(self, messages_data: list[dict]) -> None:
+        """以当前配置的格式重写整个历史文件"""
+        with open(self.file_path, "wb") as f:
+            if USE_MSGPACK:
+                f.write(_MSGPACK_MAGIC)
+            f.write(self._encode_records(messages_data))
 
     def clear(self) -> None:
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump([], f)
+        # 截断文件
+        open(self.file_path, "w", encoding="utf-8").close()
+        self._cache = []
 
 
 class RedisChatMessageHistory(BaseChatMessageHistory):
@@ -93,6 +238,8 @@ class RedisChatMessageHistory(BaseChatMessageHistory):
     Redis 分布式会话历史存储
 
     支持多实例部署，会话数据在 Redis 中共享
+    每个会话存为一个 Redis LIST，每个元素是一条序列化后的消息，
+    追加消息只需一次 RPUSH + EXPIRE 的流水线请求
     """
 
     def __init__(self, session_id: str, host: str = "localhost",
@@ -114,6 +261,9 @@ class RedisChatMessageHistory(BaseChatMessageHistory):
         self.ttl = ttl
         self.key = f"{key_prefix}{session_id}"
 
+        # 内存中的消息缓存，首次读取时加载
+        self._cache: Optional[list[BaseMessage]] = None
+
         if not REDIS_AVAILABLE:
             raise ImportError("Redis 未安装，请运行: pip install redis")
 
@@ -122,7 +272,7 @@ class RedisChatMessageHistory(BaseChatMessageHistory):
             port=port,
             db=db,
             password=password,
-            decode_responses=True,
+            decode_responses=False,  # 消息可能是 MessagePack 二进制
         )
 
         # 测试连接
@@ -132,41 +282,68 @@ class RedisChatMessageHistory(BaseChatMessageHistory):
             raise ConnectionError(f"无法连接到 Redis: {e}")
 
     def add_messages(self, messages: Sequence[BaseMessage]) -> None:
-        """添加消息到历史"""
-        # 获取现有消息
-        all_messages = list(self.messages)
-        all_messages.extend(messages)
-
-        # 转换为字典列表
-        messages_data = [message_to_dict(msg) for msg in all_messages]
-
-        # 存储到 Redis
-        self._redis.set(
-            self.key,
-            json.dumps(messages_data, ensure_ascii=False),
-            ex=self.ttl
-        )
+        """添加消息到历史（单次往返，只写入新消息，从不读取已有历史）"""
+        if not messages:
+            return
+
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.rpush(self.key, *[
+            _compress_record(_encode_record(message_to_dict(msg))) for msg in messages
+        ])
+        pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+        if self._cache is not None:
+            self._cache.extend(messages)
 
     @property
     def messages(self) -> list[BaseMessage]:
         """获取所有消息"""
+        return list(self._ensure_loaded())
+
+    def _ensure_loaded(self) -> list[BaseMessage]:
+        """确保消息已载入内存缓存（已缓存时不访问存储）"""
+        if self._cache is None:
+            self._cache = self._load()
+        return self._cache
+
+    def _load(self) -> list[BaseMessage]:
+        """从 Redis 读取全部消息"""
         try:
-            data = self._redis.get(self.key)
-            if data:
-                messages_data = json.loads(data)
-                return messages_from_dict(messages_data)
-            return []
+            try:
+                items = self._redis.lrange(self.key, 0, -1)
+            except redis.ResponseError:
+                # 旧版格式：整个历史是一个 JSON 字符串，迁移为 LIST
+                return self._migrate_legacy()
+            return messages_from_dict([_decode_record(item) for item in items])
         except Exception:
             return []
 
+    def _migrate_legacy(self) -> list[BaseMessage]:
+        """将旧版 JSON 字符串格式的历史迁移为 LIST"""
+        data = self._redis.get(self.key)
+        messages_data = _loads(data) if data else []
+
+        pipe = self._redis.pipeline()
+        pipe.delete(self.key)
+        if messages_data:
+            pipe.rpush(self.key, *[_compress_record(_encode_record(d)) for d in messages_data])
+            pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+        return messages_from_dict(messages_data)
+
     def clear(self) -> None:
         """清空会话历史"""
         self._redis.delete(self.key)
+        self._cache = []
 
     def get_session_info(self) -> Dict:
         """获取会话信息"""
-        ttl = self._redis.ttl(self.key)
-        msg_count = len(self.messages)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.ttl(self.key)
+        pipe.llen(self.key)
+        ttl, msg_count = pipe.execute()
         return {
             "session_id": self.session_id,
             "message_count": msg_count,
@@ -219,9 +396,12 @@ class SessionManager:
     def list_sessions(self) -> list[str]:
         """列出所有会话 ID"""
         if self._redis:
-            # 从 Redis 获取所有会话键
-            keys = self._redis.keys("chat_history:*")
-            return [k.replace("chat_history:", "") for k in keys]
+            # 用 SCAN 增量遍历会话键，避免 KEYS 阻塞 Redis
+            prefix_len = len("chat_history:")
+            return [
+                k[prefix_len:]
+                for k in self._redis.scan_iter(match="chat_history:*", count=500)
+            ]
         else:
             # 从文件系统获取
             storage_path = "./chat_history"
@@ -254,12 +434,13 @@ class SessionManager:
         max_age_seconds = max_age_days * 86400
         now = time.time()
 
-        for filename in os.listdir(storage_path):
-            filepath = os.path.join(storage_path, filename)
-            if os.path.isfile(filepath):
-                mtime = os.path.getmtime(filepath)
-                if now - mtime > max_age_seconds:
-                    os.remove(filepath)
+        # scandir 在读取目录时即带回文件类型，stat 结果在 DirEntry 上缓存
+        with os.scandir(storage_path) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if now - entry.stat().st_mtime > max_age_seconds:
+                    os.remove(entry.path)
                     count += 1
 
         return count
@@ -550,7 +550,12 @@ function App() {
           const legacyResponse = await fetch('/chat_stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ message: messageToSend, enable_search: enableSearch, show_thinking: showThinking }),
+            body: JSON.stringify({
+              message: messageToSend,
+              session_id: `${userType}_${activeId}`,
+              enable_search: enableSearch,
+              show_thinking: showThinking
+            }),
             signal: controller.signal
           });
           if (!legacyResponse.ok) throw new Error('Server error');
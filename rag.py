@@ -1,6 +1,9 @@
 import os
+import asyncio
 import datetime
 import sys
+from itertools import takewhile
+from typing import Optional
 # Load env for DashScope
 from dotenv import load_dotenv
 load_dotenv()
@@ -11,22 +14,43 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bac
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 
-from langchain_core.runnables import RunnablePassthrough, RunnableWithMessageHistory, RunnableLambda
+from langchain_core.runnables import RunnablePassthrough, RunnableWithMessageHistory, RunnableLambda, RunnableConfig
 from file_history_store import get_history
 from vector_stores import VectorStoreService
 from langchain_community.embeddings import DashScopeEmbeddings
-import config_data as config
+import config_data as settings
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_community.chat_models.tongyi import ChatTongyi
 from langchain_community.tools import DuckDuckGoSearchRun
 
 # 尝试导入多集合知识库
 try:
-    from backend.knowledge.multi_collection_kb import MultiCollectionKB
+    from backend.knowledge.multi_collection_kb import MultiCollectionKB  # noqa: F401
+    from backend.core.singleton import get_knowledge_base
     MULTI_KB_AVAILABLE = True
 except ImportError:
     MULTI_KB_AVAILABLE = False
 
+# 尝试导入异步工具
+try:
+    from backend.core.async_utils import get_async_executor
+    ASYNC_UTILS_AVAILABLE = True
+except ImportError:
+    ASYNC_UTILS_AVAILABLE = False
+
+
+# 无检索结果时填入提示词的参考资料文本
+NO_REFERENCE_TEXT = "无相关参考资料"
+
+_now = datetime.datetime.now
+
+
+def _format_current_time() -> str:
+    """格式化当前时间为 YYYY-mm-dd HH:MM:SS（直接拼接字段，绕开 strftime 的 locale 处理）"""
+    now = _now()
+    return (f"{now.year:04d}-{now.month:02d}-{now.day:02d} "
+            f"{now.hour:02d}:{now.minute:02d}:{now.second:02d}")
+
 
 def print_prompt(prompt):
     print("="*20)
@@ -46,20 +70,20 @@ class RagService(object):
             user_type: 用户类型 (c_end|b_end|both)，用于多集合检索
         """
         # Ensure env var is set from config if not already
-        if not os.environ.get("DASHSCOPE_API_KEY") and config.dashscope_api_key:
-            os.environ["DASHSCOPE_API_KEY"] = config.dashscope_api_key
+        if not os.environ.get("DASHSCOPE_API_KEY") and settings.dashscope_api_key:
+            os.environ["DASHSCOPE_API_KEY"] = settings.dashscope_api_key
 
-        self.user_type = user_type
-
-        # 初始化多集合知识库（如果可用）
+        # 多集合知识库（如果可用），多个 RagService 实例共享同一个知识库单例
         if MULTI_KB_AVAILABLE:
-            self.multi_kb = MultiCollectionKB()
+            self.multi_kb = get_knowledge_base()
         else:
             self.multi_kb = None
 
+        self.user_type = user_type
+
         # 保留原有的单集合向量服务（向后兼容）
         self.vector_service = VectorStoreService(
-            embedding=DashScopeEmbeddings(model=config.embedding_model_name)
+            embedding=DashScopeEmbeddings(model=settings.embedding_model_name)
         )
 
 
@@ -76,30 +100,63 @@ class RagService(object):
             ]
         )
 
-        self.chat_model = ChatTongyi(model=config.chat_model_name)
+        self.chat_model = ChatTongyi(model=settings.chat_model_name)
         self.search_tool = DuckDuckGoSearchRun()
         
-        # UI Control Flags
+        # UI Control Flags（默认值，单次请求可通过 config["configurable"] 覆盖）
         self.enable_search = True
         self.show_thinking = True
 
         self.chain = self.__get_chain()
 
-    def __hybrid_retriever(self, query: str) -> list[Document]:
+    @property
+    def user_type(self) -> str:
+        return self._user_type
+
+    @user_type.setter
+    def user_type(self, value: str):
+        """设置用户类型，并预先计算该类型可检索的集合（供每次检索的日志复用）"""
+        self._user_type = value
+        self._collections_searched = (
+            self.multi_kb.get_collections_for_user_type(value) if self.multi_kb else []
+        )
+        self._collections_searched_str = ", ".join(self._collections_searched)
+
+    @staticmethod
+    def _filter_by_threshold(results: list[tuple[Document, float]]) -> tuple[float, list[Document]]:
+        """从按 L2 距离升序排列的检索结果中取出阈值内的文档
+
+        结果已排序，首个元素即最佳分数，遇到第一个超过阈值的结果即可停止
+
+        Returns:
+            (最佳分数, 相关文档列表)
+        """
+        if not results:
+            return float('inf'), []
+        threshold = settings.search_score_threshold
+        relevant_docs = [
+            doc for doc, _ in takewhile(lambda pair: pair[1] <= threshold, results)
+        ]
+        return results[0][1], relevant_docs
+
+    def __hybrid_retriever(self, query: str, config: Optional[RunnableConfig] = None) -> list[Document]:
         """混合检索策略：
         1. 优先使用多集合知识库（按用户类型检索）
         2. 回退到单集合检索
         3. 检查匹配分数 (L2距离)
         4. 如果所有文档的分数都高于阈值(search_score_threshold)，则触发联网搜索
+
+        是否允许联网搜索优先取调用时 config["configurable"]["enable_search"]，
+        多个并发请求共用同一个服务实例时互不影响；未指定时使用实例上的默认值
         """
+        configurable = (config or {}).get("configurable") or {}
+        enable_search = configurable.get("enable_search", self.enable_search)
+
         logs = []
         logs.append(f"正在检索: {query}")
         logs.append(f"用户类型: {self.user_type}")
         print(f"正在检索: {query} (用户类型: {self.user_type})")
 
-        relevant_docs = []
-        best_score = float('inf')
-
         # 1. 尝试多集合检索
         if self.multi_kb and self.user_type in ["c_end", "b_end", "both"]:
             logs.append(f"使用多集合检索模式")
@@ -108,16 +165,12 @@ class RagService(object):
             multi_results = self.multi_kb.search_by_user_type(
                 query,
                 self.user_type,
-                k=config.similarity_threshold
+                k=settings.similarity_threshold
             )
 
-            for doc, score in multi_results:
-                best_score = min(best_score, score)
-                if score <= config.search_score_threshold:
-                    relevant_docs.append(doc)
+            best_score, relevant_docs = self._filter_by_threshold(multi_results)
 
-            collections_searched = self.multi_kb.get_collections_for_user_type(self.user_type)
-            logs.append(f"已检索集合: {', '.join(collections_searched)}")
+            logs.append(f"已检索集合: {self._collections_searched_str}")
         else:
             # 2. 回退到单集合检索
             logs.append("使用单集合检索模式")
@@ -125,21 +178,18 @@ class RagService(object):
 
             local_results = self.vector_service.vector_store.similarity_search_with_score(
                 query,
-                k=config.similarity_threshold
+                k=settings.similarity_threshold
             )
 
-            for doc, score in local_results:
-                best_score = min(best_score, score)
-                if score <= config.search_score_threshold:
-                    relevant_docs.append(doc)
+            best_score, relevant_docs = self._filter_by_threshold(local_results)
 
-        log_msg = f"本地检索结果: {len(relevant_docs)} 个相关文档 (最佳分数: {best_score:.4f}, 阈值: {config.search_score_threshold})"
+        log_msg = f"本地检索结果: {len(relevant_docs)} 个相关文档 (最佳分数: {best_score:.4f}, 阈值: {settings.search_score_threshold})"
         logs.append(log_msg)
         print(log_msg)
 
         # 3. 判断是否需要联网
         if not relevant_docs:
-            if self.enable_search:
+            if enable_search:
                 logs.append("本地知识库无相关内容，触发联网搜索...")
                 print("本地知识库无相关内容，触发联网搜索...")
                 try:
@@ -166,22 +216,41 @@ class RagService(object):
 
         return relevant_docs
 
+    async def __ahybrid_retriever(self, query: str, config: Optional[RunnableConfig] = None) -> list[Document]:
+        """混合检索的异步版本
+
+        向量检索、embedding 请求和联网搜索都是阻塞 IO，放到线程池执行，
+        避免在流式接口中占用事件循环
+        """
+        if ASYNC_UTILS_AVAILABLE:
+            return await get_async_executor().run_in_thread(self.__hybrid_retriever, query, config)
+        return await asyncio.to_thread(self.__hybrid_retriever, query, config)
+
+    def warmup(self, query: str = "装修"):
+        """预热检索链路（embedding 客户端、向量库连接与查询缓存）
+
+        只执行一次本地检索，不调用大模型、不联网、不写入会话历史
+        """
+        if self.multi_kb and self.user_type in ["c_end", "b_end", "both"]:
+            self.multi_kb.search_by_user_type(query, self.user_type, k=1)
+        else:
+            self.vector_service.vector_store.similarity_search_with_score(query, k=1)
+
     def __get_chain(self):
         """获取最终的执行链"""
         
         # 使用自定义的混合检索器
-        retriever = RunnableLambda(self.__hybrid_retriever)
+        # 同步调用走 __hybrid_retriever，astream_events 等异步调用走线程池版本
+        retriever = RunnableLambda(self.__hybrid_retriever, afunc=self.__ahybrid_retriever)
 
         def format_document(docs: list[Document]):
             if not docs:
-                return "无相关参考资料"
-
-            formatted_str = ""
-            for doc in docs:
-                source = doc.metadata.get("source", "local")
-                formatted_str += f"[{source}] 文档片段：{doc.page_content}\n\n"
+                return NO_REFERENCE_TEXT
 
-            return formatted_str
+            return "".join(
+                f"[{doc.metadata.get('source', 'local')}] 文档片段：{doc.page_content}\n\n"
+                for doc in docs
+            )
 
         def format_for_retriever(value: dict) -> str:
             return value["input"]
@@ -192,7 +261,7 @@ class RagService(object):
             new_value["input"] = value["input"]["input"]
             new_value["context"] = value["context"]
             new_value["history"] = value["input"]["history"]
-            new_value["current_time"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            new_value["current_time"] = _format_current_time()
             return new_value
 
         # 生成链 (Answer Generation)
@@ -6,16 +6,51 @@ import uvicorn
 import sys
 import os
 import time
-import uuid
-from typing import List
+import asyncio
+import inspect
+import threading
+import heapq
+import re
+from collections import deque
+from typing import Dict, List
 from contextlib import asynccontextmanager
+from uuid import uuid4
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import Response, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import json
 
+# 优先使用 orjson（C 实现，直接输出 bytes），未安装时回退到标准库 json
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+
+    def json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    json_loads = orjson.loads
+except ImportError:
+    DefaultJSONResponse = JSONResponse
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    json_loads = json.loads
+
+
+# 流式事件的固定 JSON 前缀/后缀：每个事件只需序列化 content，无需构造字典
+_THINKING_PREFIX = b'{"type":"thinking","content":'
+_ANSWER_PREFIX = b'{"type":"answer","content":'
+_ERROR_PREFIX = b'{"type":"error","content":'
+_EVENT_SUFFIX = b'}\n'
+
+
+def _emit(prefix: bytes, content) -> bytes:
+    """生成一行 NDJSON 流式事件"""
+    return prefix + json_dumps(content) + _EVENT_SUFFIX
+
 # 添加backend目录到路径
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
 
@@ -74,113 +109,192 @@ ENV = os.getenv("ENV", "development")  # development / production
 DEBUG = os.getenv("DEBUG", "true").lower() == "true"
 
 # CORS 配置
-CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+def _parse_list_env(name: str, default: str) -> List[str]:
+    """解析逗号分隔的环境变量：去除空白与空项，去重并保持顺序"""
+    items = (item.strip() for item in os.getenv(name, default).split(","))
+    return list(dict.fromkeys(item for item in items if item))
+
+
+CORS_ORIGINS = _parse_list_env("CORS_ORIGINS", "*")
 if ENV == "production" and CORS_ORIGINS == ["*"]:
     # 生产环境默认只允许同源
     CORS_ORIGINS = []
 
 # 可信主机
-TRUSTED_HOSTS = os.getenv("TRUSTED_HOSTS", "*").split(",")
+TRUSTED_HOSTS = _parse_list_env("TRUSTED_HOSTS", "*")
+
+# uvicorn 运行参数：安装 uvicorn[standard] 时使用 uvloop + httptools，提升流式接口吞吐
+try:
+    import uvloop  # noqa: F401
+    UVICORN_LOOP = "uvloop"
+except ImportError:
+    UVICORN_LOOP = "asyncio"
+try:
+    import httptools  # noqa: F401
+    UVICORN_HTTP = "httptools"
+except ImportError:
+    UVICORN_HTTP = "h11"
+UVICORN_BACKLOG = int(os.getenv("UVICORN_BACKLOG", "2048"))
+UVICORN_KEEP_ALIVE = int(os.getenv("UVICORN_KEEP_ALIVE", "30"))  # HTTP/1.1 keep-alive 秒数
+
+# 启动时预热检索链路（每个工作进程各自预热），测试等场景可设置 WARMUP=0 关闭
+WARMUP = os.getenv("WARMUP", "1").lower() not in ("0", "false", "no")
+
+# 工作进程数：默认单进程，开发环境固定单进程（支持热重载），其他环境可通过 WEB_CONCURRENCY 开启多进程
+# 注意：Chroma 持久化目录、MD5 去重记录与会话历史文件都不是多进程安全的，
+# 每个进程各自打开并写入同一份数据，开启多进程前需确认这些存储已改为共享服务或只读；
+# 多进程下 request_metrics、限流计数等进程内状态也不会跨进程汇总
+if ENV == "development":
+    UVICORN_WORKERS = 1
+else:
+    UVICORN_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY") or "1"))
+
+# 会话 ID 用作历史记录文件名 / Redis 键，只允许字母、数字、下划线和短横线
+_SESSION_ID_RE = re.compile(r"[\w-]{1,128}")
+
+# CORS 允许的方法（不可变元组，中间件初始化时一次性生成响应头）
+CORS_ALLOW_METHODS = ("GET", "POST", "PUT", "DELETE", "OPTIONS")
 
 
 # === 性能监控 ===
 
 class RequestMetrics:
-    """请求性能指标收集器"""
+    """
+    请求性能指标收集器
+
+    写入路径无锁：每个请求只把 (端点, 耗时, 是否出错) 追加到待处理队列
+    （deque.append 在 GIL 下是原子操作），聚合推迟到读取时进行；
+    队列积压超过 _FLUSH_THRESHOLD 条时由写入方顺带合并一次，避免无人读取时无限增长
+    """
+
+    _FLUSH_THRESHOLD = 4096
 
     def __init__(self):
         self._metrics = {
             "total_requests": 0,
             "total_errors": 0,
-            "endpoint_stats": {},
-            "response_times": [],
-            "active_requests": 0,
         }
-        self._lock = __import__("threading").Lock()
+        # 仅在合并与读取时使用
+        self._lock = threading.Lock()
         self._max_response_times = 1000  # 保留最近1000个响应时间
+        # 有界队列：只保存响应时间（秒），超出容量时自动丢弃最旧记录，O(1)
+        self._durations: deque = deque(maxlen=self._max_response_times)
+        # 窗口内响应时间之和，用于 O(1) 计算平均值
+        self._recent_sum = 0.0
+        self._endpoint_stats: Dict[str, dict] = {}
+
+        # 待合并的请求记录
+        self._pending: deque = deque()
+
+        # 活跃请求数
+        self._active = 0
+        self._active_lock = threading.Lock()
 
     def record_request(self, path: str, method: str, duration: float,
                        status_code: int, request_id: str = None):
         """记录请求指标"""
+        pending = self._pending
+        pending.append((f"{method}:{path}", duration, status_code >= 400))
+        if len(pending) >= self._FLUSH_THRESHOLD:
+            self._flush()
+
+    def _flush(self):
+        """将待处理记录合并到聚合统计"""
+        pending = self._pending
         with self._lock:
-            self._metrics["total_requests"] += 1
-
-            if status_code >= 400:
-                self._metrics["total_errors"] += 1
-
-            # 端点统计
-            endpoint_key = f"{method}:{path}"
-            if endpoint_key not in self._metrics["endpoint_stats"]:
-                self._metrics["endpoint_stats"][endpoint_key] = {
-                    "count": 0,
-                    "errors": 0,
-                    "total_time": 0,
-                    "min_time": float("inf"),
-                    "max_time": 0,
-                }
+            metrics = self._metrics
+            endpoint_stats = self._endpoint_stats
+            durations = self._durations
+            max_len = self._max_response_times
+            recent_sum = self._recent_sum
+
+            while pending:
+                try:
+                    endpoint_key, duration, is_error = pending.popleft()
+                except IndexError:
+                    break
+
+                stats = endpoint_stats.get(endpoint_key)
+                if stats is None:
+                    stats = endpoint_stats[endpoint_key] = {
+                        "count": 0,
+                        "errors": 0,
+                        "total_time": 0,
+                        "min_time": float("inf"),
+                        "max_time": 0,
+                    }
 
-            stats = self._metrics["endpoint_stats"][endpoint_key]
-            stats["count"] += 1
-            stats["total_time"] += duration
-            stats["min_time"] = min(stats["min_time"], duration)
-            stats["max_time"] = max(stats["max_time"], duration)
-
-            if status_code >= 400:
-                stats["errors"] += 1
-
-            # 响应时间记录
-            self._metrics["response_times"].append({
-                "path": path,
-                "duration": duration,
-                "status": status_code,
-                "timestamp": time.time(),
-            })
+                stats["count"] += 1
+                stats["total_time"] += duration
+                if duration < stats["min_time"]:
+                    stats["min_time"] = duration
+                if duration > stats["max_time"]:
+                    stats["max_time"] = duration
+
+                metrics["total_requests"] += 1
+                if is_error:
+                    stats["errors"] += 1
+                    metrics["total_errors"] += 1
+
+                # 响应时间记录（窗口已满时先减去即将被挤出的最旧记录）
+                if len(durations) == max_len:
+                    recent_sum -= durations[0]
+                durations.append(duration)
+                recent_sum += duration
 
-            # 限制响应时间记录数量
-            if len(self._metrics["response_times"]) > self._max_response_times:
-                self._metrics["response_times"] = self._metrics["response_times"][-self._max_response_times:]
+            self._recent_sum = recent_sum
 
     def increment_active(self):
         """增加活跃请求数"""
-        with self._lock:
-            self._metrics["active_requests"] += 1
+        with self._active_lock:
+            self._active += 1
 
     def decrement_active(self):
         """减少活跃请求数"""
-        with self._lock:
-            self._metrics["active_requests"] -= 1
+        with self._active_lock:
+            self._active -= 1
 
     def get_stats(self) -> dict:
         """获取统计信息"""
+        self._flush()
+
         with self._lock:
-            # 计算平均响应时间
-            recent_times = [r["duration"] for r in self._metrics["response_times"][-100:]]
-            avg_response_time = sum(recent_times) / len(recent_times) if recent_times else 0
-
-            # 计算 P95 响应时间
-            sorted_times = sorted(recent_times)
-            p95_index = int(len(sorted_times) * 0.95)
-            p95_response_time = sorted_times[p95_index] if sorted_times else 0
-
-            return {
-                "total_requests": self._metrics["total_requests"],
-                "total_errors": self._metrics["total_errors"],
-                "error_rate": self._metrics["total_errors"] / self._metrics["total_requests"]
-                              if self._metrics["total_requests"] > 0 else 0,
-                "active_requests": self._metrics["active_requests"],
-                "avg_response_time_ms": avg_response_time * 1000,
-                "p95_response_time_ms": p95_response_time * 1000,
-                "endpoint_stats": {
-                    k: {
-                        **v,
-                        "avg_time_ms": (v["total_time"] / v["count"] * 1000) if v["count"] > 0 else 0,
-                        "min_time_ms": v["min_time"] * 1000 if v["min_time"] != float("inf") else 0,
-                        "max_time_ms": v["max_time"] * 1000,
-                    }
-                    for k, v in self._metrics["endpoint_stats"].items()
-                },
+            total_requests = self._metrics["total_requests"]
+            total_errors = self._metrics["total_errors"]
+            durations = self._durations
+            count = len(durations)
+
+            endpoint_stats = {
+                k: {
+                    **v,
+                    "avg_time_ms": (v["total_time"] / v["count"] * 1000) if v["count"] > 0 else 0,
+                    "min_time_ms": v["min_time"] * 1000 if v["min_time"] != float("inf") else 0,
+                    "max_time_ms": v["max_time"] * 1000,
+                }
+                for k, v in self._endpoint_stats.items()
             }
 
+            # 计算平均响应时间（基于窗口累计和）
+            avg_response_time = self._recent_sum / count if count else 0
+
+            # 计算 P95 响应时间：只取最大的 5% 部分排序，无需全量排序
+            if count:
+                p95_index = int(count * 0.95)
+                top = heapq.nlargest(count - p95_index, durations)
+                p95_response_time = top[-1]
+            else:
+                p95_response_time = 0
+
+        return {
+            "total_requests": total_requests,
+            "total_errors": total_errors,
+            "error_rate": total_errors / total_requests if total_requests > 0 else 0,
+            "active_requests": self._active,
+            "avg_response_time_ms": avg_response_time * 1000,
+            "p95_response_time_ms": p95_response_time * 1000,
+            "endpoint_stats": endpoint_stats,
+        }
+
 
 # 全局指标收集器
 request_metrics = RequestMetrics()
@@ -188,6 +302,17 @@ request_metrics = RequestMetrics()
 
 # === 应用生命周期 ===
 
+def _warn_duplicate_routes(app: FastAPI):
+    """检查重复注册的 (路径, 方法)：后注册的处理函数永远不会被匹配到"""
+    seen = set()
+    for route in app.routes:
+        for method in getattr(route, "methods", None) or ():
+            key = (route.path, method)
+            if key in seen:
+                logger.warning(f"路由重复注册: {method} {route.path}")
+            seen.add(key)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
@@ -197,6 +322,25 @@ async def lifespan(app: FastAPI):
         "debug": DEBUG,
         "cors_origins": CORS_ORIGINS,
     })
+
+    _warn_duplicate_routes(app)
+
+    # 预热默认 RAG 服务，避免首个请求承担完整的初始化耗时
+    try:
+        rag_service = await asyncio.to_thread(get_rag_service)
+        logger.info("RAG 服务预热完成")
+
+        # 执行一次检索，提前建立 embedding 与向量库连接
+        if WARMUP:
+            await asyncio.to_thread(rag_service.warmup)
+            logger.info("RAG 检索链路预热完成")
+
+        # 流式接口依赖原生异步迭代器；若退化为同步迭代，每个分块都会经过线程池中转
+        if not inspect.isasyncgenfunction(rag_service.chain.astream_events):
+            logger.warning("RAG 链的 astream_events 不是原生异步生成器，流式输出性能将下降")
+    except Exception as e:
+        logger.error(f"RAG 服务预热失败，将在首次请求时重试: {e}")
+
     yield
     # 关闭时
     logger.info("DecoPilot 服务关闭")
@@ -227,6 +371,7 @@ app = FastAPI(
     description="家居行业智能体API服务",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=DefaultJSONResponse,
     docs_url="/docs" if DEBUG else None,  # 生产环境禁用文档
     redoc_url="/redoc" if DEBUG else None,
 )
@@ -245,7 +390,7 @@ if NEW_API_AVAILABLE and SLOWAPI_AVAILABLE and limiter:
 if ENV == "production" and TRUSTED_HOSTS != ["*"]:
     app.add_middleware(
         TrustedHostMiddleware,
-        allowed_hosts=TRUSTED_HOSTS,
+        allowed_hosts=tuple(TRUSTED_HOSTS),
     )
 
 # CORS 中间件
@@ -253,7 +398,7 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS if CORS_ORIGINS != ["*"] else ["*"],
     allow_credentials=True if CORS_ORIGINS != ["*"] else False,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=CORS_ALLOW_METHODS,
     allow_headers=["*"],
     max_age=600,  # 预检请求缓存10分钟
 )
@@ -302,7 +447,9 @@ async def validate_request(request: Request, call_next):
             try:
                 body = await request.body()
                 if body:
-                    data = json.loads(body)
+                    data = json_loads(body)
+                    # 缓存解析结果，下游处理函数无需再次解析请求体
+                    request.state.parsed_json = data
                     # 验证 message 字段
                     if "message" in data:
                         result = sanitizer.sanitize(data["message"])
@@ -331,7 +478,7 @@ async def validate_request(request: Request, call_next):
 async def performance_monitoring(request: Request, call_next):
     """性能监控中间件"""
     # 生成请求 ID
-    request_id = str(uuid.uuid4())[:8]
+    request_id = os.urandom(4).hex()
     request.state.request_id = request_id
 
     # 记录开始时间
@@ -389,14 +536,20 @@ if NEW_API_AVAILABLE:
 
 # === 初始化 RAG 服务 ===
 
-# 延迟初始化，避免启动时阻塞
-_rag_service = None
+# 按用户类型缓存的 RAG 服务；默认服务在 lifespan 启动阶段预热
+_rag_services: Dict[str, RagService] = {}
+_rag_lock = threading.Lock()
 
-def get_rag_service():
-    global _rag_service
-    if _rag_service is None:
-        _rag_service = RagService()
-    return _rag_service
+
+def get_rag_service(user_type: str = "both") -> RagService:
+    """获取指定用户类型的 RAG 服务（线程安全，按需创建）"""
+    service = _rag_services.get(user_type)
+    if service is None:
+        with _rag_lock:
+            service = _rag_services.get(user_type)
+            if service is None:
+                service = _rag_services[user_type] = RagService(user_type=user_type)
+    return service
 
 
 # === 原有接口（向后兼容） ===
@@ -405,18 +558,30 @@ def get_rag_service():
 @log_execution("chat_stream")
 async def chat_stream(request: Request):
     """原有聊天接口（向后兼容）"""
-    data = await request.json()
+    # 优先复用验证中间件已解析的请求体
+    data = getattr(request.state, "parsed_json", None)
+    if data is None:
+        data = await request.json()
     message = data.get("message")
 
     if not message:
         raise HTTPException(status_code=400, detail="message 字段不能为空")
 
+    session_id = data.get("session_id")
+    if session_id and not (isinstance(session_id, str) and _SESSION_ID_RE.fullmatch(session_id)):
+        raise HTTPException(status_code=400, detail="session_id 格式无效")
+
     rag_service = get_rag_service()
-    rag_service.enable_search = data.get("enable_search", True)
-    rag_service.show_thinking = data.get("show_thinking", True)
+    show_thinking = data.get("show_thinking", True)
 
     async def event_generator():
-        session_config = {"configurable": {"session_id": "user_react_001"}}
+        # 请求级开关通过 config 传入检索链，不修改多个请求共享的 rag_service；
+        # 未携带会话 ID 的请求使用独立的随机会话，避免不同用户共用同一份历史
+        session_config = {"configurable": {
+            "session_id": session_id or f"user_{uuid4().hex}",
+            "enable_search": data.get("enable_search", True),
+            "show_thinking": show_thinking,
+        }}
         input_data = {"input": message}
 
         try:
@@ -424,64 +589,75 @@ async def chat_stream(request: Request):
                 kind = event["event"]
 
                 if kind == "on_retriever_end":
-                    if "output" in event["data"]:
+                    if show_thinking and "output" in event["data"]:
                         docs = event["data"]["output"]
                         if docs:
                             first_doc = docs[0]
                             if hasattr(first_doc, "metadata") and "thinking_log" in first_doc.metadata:
                                 logs = first_doc.metadata["thinking_log"]
-                                yield json.dumps({"type": "thinking", "content": logs}, ensure_ascii=False) + "\n"
+                                yield _emit(_THINKING_PREFIX, logs)
 
                 elif kind == "on_chat_model_stream":
                     chunk = event["data"]["chunk"]
                     if hasattr(chunk, "content") and chunk.content:
-                        yield json.dumps({"type": "answer", "content": chunk.content}, ensure_ascii=False) + "\n"
+                        yield _emit(_ANSWER_PREFIX, chunk.content)
 
         except Exception as e:
             logger.error(f"聊天流异常: {e}", exc_info=True)
-            yield json.dumps({"type": "error", "content": str(e)}, ensure_ascii=False) + "\n"
+            yield _emit(_ERROR_PREFIX, str(e))
 
     return StreamingResponse(event_generator(), media_type="application/x-ndjson")
 
 
 # === 系统接口 ===
 
+# / 与 /health 的内容在进程生命周期内不变，启动时序列化一次，请求时直接返回字节
+_ROOT_BODY = json_dumps({
+    "service": "DecoPilot API",
+    "version": "2.0.0",
+    "env": ENV,
+    "description": "家居行业智能体API服务",
+    "endpoints": {
+        "legacy": {
+            "/chat_stream": "原有聊天接口（向后兼容）",
+        },
+        "v1": {
+            "/api/v1/chat/stream": "通用聊天流式接口",
+            "/api/v1/chat/c-end": "C端专用聊天接口",
+            "/api/v1/chat/b-end": "B端专用聊天接口",
+            "/api/v1/knowledge/collections": "知识库集合列表",
+            "/api/v1/knowledge/search": "知识库搜索",
+            "/api/v1/merchant/recommend": "商家推荐",
+            "/api/v1/merchant/subsidy/calc": "补贴计算",
+            "/api/v1/merchant/roi/analyze": "ROI分析",
+        },
+    },
+    "docs": "/docs" if DEBUG else None,
+})
+
+_HEALTH_BODY = json_dumps({
+    "status": "healthy",
+    "service": "DecoPilot",
+    "version": "2.0.0",
+    "env": ENV,
+})
+
+
 @app.get("/")
 async def root():
     """API根路径，返回服务信息"""
-    return {
-        "service": "DecoPilot API",
-        "version": "2.0.0",
-        "env": ENV,
-        "description": "家居行业智能体API服务",
-        "endpoints": {
-            "legacy": {
-                "/chat_stream": "原有聊天接口（向后兼容）",
-            },
-            "v1": {
-                "/api/v1/chat/stream": "通用聊天流式接口",
-                "/api/v1/chat/c-end": "C端专用聊天接口",
-                "/api/v1/chat/b-end": "B端专用聊天接口",
-                "/api/v1/knowledge/collections": "知识库集合列表",
-                "/api/v1/knowledge/search": "知识库搜索",
-                "/api/v1/merchant/recommend": "商家推荐",
-                "/api/v1/merchant/subsidy/calc": "补贴计算",
-                "/api/v1/merchant/roi/analyze": "ROI分析",
-            },
-        },
-        "docs": "/docs" if DEBUG else None,
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
     """健康检查接口"""
-    return {
-        "status": "healthy",
-        "service": "DecoPilot",
-        "version": "2.0.0",
-        "env": ENV,
-    }
+    return Response(content=_HEALTH_BODY, media_type="application/json")
+
+
+# /metrics 聚合结果的最短重算间隔（秒），监控系统轮询时复用上一次的结果
+METRICS_MIN_INTERVAL = float(os.getenv("METRICS_MIN_INTERVAL", "5"))
+_metrics_cache = {"expires_at": 0.0, "result": None}
 
 
 @app.get("/metrics")
@@ -490,6 +666,10 @@ async def metrics():
     if ENV == "production":
         raise HTTPException(status_code=404, detail="Not Found")
 
+    now = time.monotonic()
+    if _metrics_cache["result"] is not None and now < _metrics_cache["expires_at"]:
+        return _metrics_cache["result"]
+
     result = {
         "request_metrics": request_metrics.get_stats(),
     }
@@ -532,6 +712,8 @@ async def metrics():
     if not result:
         return {"message": "指标模块未加载"}
 
+    _metrics_cache["result"] = result
+    _metrics_cache["expires_at"] = now + METRICS_MIN_INTERVAL
     return result
 
 
@@ -553,6 +735,11 @@ if __name__ == "__main__":
         "server:app",
         host="0.0.0.0",
         port=8000,
-        reload=DEBUG,
+        reload=DEBUG and UVICORN_WORKERS == 1,
+        workers=UVICORN_WORKERS,
         log_level="info" if DEBUG else "warning",
+        loop=UVICORN_LOOP,
+        http=UVICORN_HTTP,
+        backlog=UVICORN_BACKLOG,
+        timeout_keep_alive=UVICORN_KEEP_ALIVE,
     )
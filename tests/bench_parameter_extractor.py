@@ -0,0 +1,76 @@
+"""
+ParameterExtractor / 规则意图检测 — 微基准脚本
+
+与 test_function_calling.py 中的提取用例相同的调用，循环执行并输出单次耗时，
+用于对比正则热路径的改动前后（不依赖 pytest，也可配合 python -X perf 采样）
+
+用法:
+    python tests/bench_parameter_extractor.py                 # 默认每个用例 100000 次
+    python tests/bench_parameter_extractor.py --number 20000  # 指定循环次数
+    python tests/bench_parameter_extractor.py --warmup 0      # 跳过预热
+"""
+import os
+import sys
+import argparse
+import timeit
+from typing import Callable, List, Tuple
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.core.function_calling import ParameterExtractor, _match_tool_intents
+
+
+# (名称, 提取方法, 参数) —— 与单元测试中的提取用例保持一致
+EXTRACTOR_CASES: List[Tuple[str, Callable, tuple]] = [
+    ("amount_yuan", ParameterExtractor.extract_amount, ("我买了一套沙发花了5000元",)),
+    ("amount_wan", ParameterExtractor.extract_amount, ("装修预算大概10万元",)),
+    ("amount_with_context", ParameterExtractor.extract_amount, ("投入了5万，收入了15万", "投入")),
+    ("multiple_amounts", ParameterExtractor.extract_multiple_amounts, ("投入5万，收入15万，利润10万",)),
+    ("area", ParameterExtractor.extract_area, ("我家房子120平米",)),
+    ("area_sqm_symbol", ParameterExtractor.extract_area, ("客厅面积30㎡",)),
+    ("category", ParameterExtractor.extract_category, ("瓷砖价格怎么样",)),
+    ("specific_item", ParameterExtractor.extract_specific_item, ("这个沙发5000元贵不贵",)),
+    ("style", ParameterExtractor.extract_style, ("我喜欢北欧风格的装修",)),
+    ("style_default", ParameterExtractor.extract_style, ("我想装修房子",)),
+    ("period_days", ParameterExtractor.extract_period_days, ("最近30天的数据",)),
+    ("period_months", ParameterExtractor.extract_period_days, ("最近3个月的销售情况",)),
+]
+
+# 意图检测用例（绕过 lru_cache，测量实际的扫描与提取开销）
+INTENT_MESSAGES = [
+    "我买了2万元的建材，能补贴多少？",
+    "我投入5万做营销，收入20万，ROI怎么样？另外100平的房子装修要多久？",
+    "你好，请问装修有什么注意事项？",
+]
+
+
+def run(number: int, warmup: int) -> None:
+    detect = _match_tool_intents.__wrapped__
+    cases = list(EXTRACTOR_CASES)
+    cases += [(f"detect_intent[{i}]", detect, (msg,)) for i, msg in enumerate(INTENT_MESSAGES)]
+
+    print(f"{'用例':<24}{'单次耗时(µs)':>14}")
+    print("-" * 38)
+    total = 0.0
+    for name, func, args in cases:
+        # 预热：让解释器的自适应特化进入稳定状态
+        for _ in range(warmup):
+            func(*args)
+        elapsed = timeit.timeit(lambda: func(*args), number=number)
+        total += elapsed
+        print(f"{name:<24}{elapsed / number * 1e6:>14.3f}")
+    print("-" * 38)
+    print(f"{'合计(s)':<24}{total:>14.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ParameterExtractor 微基准")
+    parser.add_argument("--number", type=int, default=100000, help="每个用例的循环次数")
+    parser.add_argument("--warmup", type=int, default=1000, help="每个用例的预热次数")
+    args = parser.parse_args()
+    run(args.number, args.warmup)
+
+
+if __name__ == "__main__":
+    main()
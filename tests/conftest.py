@@ -0,0 +1,40 @@
+"""
+测试公共配置
+
+统一将项目根目录加入 sys.path（只插入一次），各测试模块无需各自修改；
+pytest >= 7 已由 pytest.ini 的 pythonpath 完成，这里只在旧版本下生效
+
+运行单个模块：pytest tests/test_cache.py -v
+
+每个测试结束后恢复全局工具注册中心中的工具表，测试之间不因注册顺序互相影响，
+可配合 pytest-randomly / pytest-xdist 以任意顺序运行
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = str(Path(__file__).resolve().parents[1])
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+@pytest.fixture(autouse=True)
+def _restore_global_tool_registry():
+    """
+    快照并恢复全局工具注册中心
+
+    测试前已存在的注册中心恢复其工具表；测试期间才创建的注册中心在结束后重置为 None，
+    下次使用时重新创建并只注册内置工具
+    """
+    tools_module = sys.modules.get("backend.core.tools")
+    registry = getattr(tools_module, "_tool_registry", None)
+    saved = dict(registry.tools) if registry is not None else None
+    yield
+    if saved is not None:
+        registry.tools.clear()
+        registry.tools.update(saved)
+        return
+    tools_module = sys.modules.get("backend.core.tools")
+    if tools_module is not None:
+        tools_module._tool_registry = None
@@ -7,12 +7,16 @@
     python tests/eval_expert_comparison.py                    # 运行所有对比测试
     python tests/eval_expert_comparison.py --case 0           # 只运行第0个测试
     python tests/eval_expert_comparison.py --custom "你的问题"  # 自定义问题
+    python tests/eval_expert_comparison.py --concurrency 4    # 限制并发用例数
 """
 import os
+import re
 import sys
 import asyncio
 import argparse
 import time
+from typing import Dict
+from collections import Counter
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -70,6 +74,13 @@ GENERIC_B_END_PROMPT = """你是一个平台商家助手，帮助商家解答经
 回答要专业、务实，注重数据和效果。"""
 
 
+# 命中任一关键词即按 B端（商家）问题处理
+_B_END_RE = re.compile("转化率|入驻|获客")
+
+# 没有匹配到专家时，专家一栏展示的占位文本
+NO_EXPERT_PROMPT_TEXT = "（无专家提示词）"
+
+
 # ============ 对比引擎 ============
 
 async def generate_response(llm, system_prompt: str, query: str) -> str:
@@ -91,7 +102,7 @@ async def run_comparison(llm, reasoning: StageAwareReasoning, query: str,
     width = 70
 
     # 1. 阶段分析
-    user_type = "b_end" if "转化率" in query or "入驻" in query or "获客" in query else "c_end"
+    user_type = "b_end" if _B_END_RE.search(query) else "c_end"
 
     context, expert, transition = await reasoning.analyze_and_get_expert(
         query=query,
@@ -102,47 +113,47 @@ async def run_comparison(llm, reasoning: StageAwareReasoning, query: str,
     )
 
     expert_name = expert.name if expert else "通用顾问"
-    expert_prompt = expert.system_prompt if expert else ""
-
-    # 如果有专家，获取定制化的提示词（包含情绪、关注点等）
-    if expert:
-        expert_prompt = reasoning.get_expert_system_prompt(
-            stage=context.stage,
-            user_type=user_type,
-            context=context,
-        )
+
+    # 如果有专家，基于已确定的专家角色定制提示词（包含情绪、关注点等）
+    expert_prompt = reasoning.expert_manager.build_system_prompt(expert, context) if expert else ""
 
     # 2. 确定通用提示词
     generic_prompt = GENERIC_SYSTEM_PROMPT if user_type == "c_end" else GENERIC_B_END_PROMPT
 
-    # 3. 并行生成两个回答
-    generic_response, expert_response = await asyncio.gather(
-        generate_response(llm, generic_prompt, query),
-        generate_response(llm, expert_prompt, query) if expert_prompt else asyncio.coroutine(lambda: "（无专家提示词）")(),
-    )
-
-    # 4. 输出对比结果
-    print("\n" + "━" * width)
-    print(f"📋 测试 #{index}: {description}")
-    print(f"🎯 检测阶段: {context.stage} (置信度: {context.stage_confidence:.0%})")
-    print(f"👤 专家角色: {expert_name}")
+    # 3. 并行生成两个回答（没有专家提示词时只调用一次 LLM）
+    if expert_prompt:
+        generic_response, expert_response = await asyncio.gather(
+            generate_response(llm, generic_prompt, query),
+            generate_response(llm, expert_prompt, query),
+        )
+    else:
+        generic_response = await generate_response(llm, generic_prompt, query)
+        expert_response = NO_EXPERT_PROMPT_TEXT
+
+    # 4. 格式化对比结果（并发执行时各用例输出会交错，由调用方统一按顺序打印）
+    lines = [
+        "\n" + "━" * width,
+        f"📋 测试 #{index}: {description}",
+        f"🎯 检测阶段: {context.stage} (置信度: {context.stage_confidence:.0%})",
+        f"👤 专家角色: {expert_name}",
+    ]
     if context.emotional_state and context.emotional_state != "平静":
-        print(f"💭 用户情绪: {context.emotional_state}")
+        lines.append(f"💭 用户情绪: {context.emotional_state}")
     if context.focus_points:
-        print(f"🔍 关注重点: {', '.join(context.focus_points)}")
-    print(f"\n💬 用户问题: {query}")
+        lines.append(f"🔍 关注重点: {', '.join(context.focus_points)}")
+    lines.append(f"\n💬 用户问题: {query}")
 
-    print(f"\n{'─' * width}")
-    print(f"【通用装修顾问的回答】")
-    print(f"{'─' * width}")
-    print(generic_response)
+    lines.append(f"\n{'─' * width}")
+    lines.append(f"【通用装修顾问的回答】")
+    lines.append(f"{'─' * width}")
+    lines.append(generic_response)
 
-    print(f"\n{'─' * width}")
-    print(f"【{expert_name}的回答】")
-    print(f"{'─' * width}")
-    print(expert_response)
+    lines.append(f"\n{'─' * width}")
+    lines.append(f"【{expert_name}的回答】")
+    lines.append(f"{'─' * width}")
+    lines.append(expert_response)
 
-    print("━" * width)
+    lines.append("━" * width)
 
     return {
         "query": query,
@@ -152,13 +163,23 @@ async def run_comparison(llm, reasoning: StageAwareReasoning, query: str,
         "expert": expert_name,
         "generic_length": len(generic_response),
         "expert_length": len(expert_response),
+        "report": "\n".join(lines),
     }
 
 
 # ============ 主函数 ============
 
-async def run_all_comparisons(cases: list, case_index: int = None):
-    """运行所有对比测试"""
+# 默认同时在途的对比用例数（每个用例并发发起 2 次 LLM 调用）
+DEFAULT_CONCURRENCY = 8
+
+
+async def run_all_comparisons(cases: list, case_index: int = None,
+                              concurrency: int = DEFAULT_CONCURRENCY):
+    """运行所有对比测试
+
+    各用例相互独立，并发执行并按用例顺序逐个输出报告，
+    用信号量限制同时在途的用例数，避免超出模型服务的 QPS 限制
+    """
     try:
         from langchain_community.chat_models import ChatTongyi
     except ImportError:
@@ -193,14 +214,39 @@ async def run_all_comparisons(cases: list, case_index: int = None):
     print(f"\n📊 共 {len(cases_to_run)} 个对比测试\n")
 
     start_time = time.time()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run_case(pos: int, idx: int, case: dict):
+        async with semaphore:
+            try:
+                return pos, await run_comparison(
+                    llm, reasoning,
+                    case["query"], case["description"], idx
+                )
+            except Exception as e:
+                return pos, e
+
+    # 按完成顺序收集结果，用重排缓冲区按用例顺序输出：
+    # 某个用例及其之前的用例都完成后立即写出报告并释放，不等全部用例结束
     results = []
-
-    for idx, case in cases_to_run:
-        result = await run_comparison(
-            llm, reasoning,
-            case["query"], case["description"], idx
-        )
-        results.append(result)
+    pending: Dict[int, object] = {}
+    next_pos = 0
+    for finished in asyncio.as_completed([
+        _run_case(pos, idx, case) for pos, (idx, case) in enumerate(cases_to_run)
+    ]):
+        pos, outcome = await finished
+        pending[pos] = outcome
+        while next_pos in pending:
+            outcome = pending.pop(next_pos)
+            idx, case = cases_to_run[next_pos]
+            next_pos += 1
+            if isinstance(outcome, BaseException):
+                sys.stdout.write(f"\n❌ 测试 #{idx} ({case['description']}) 失败: {outcome}\n")
+                continue
+            # 汇总只保留长度等统计字段，不常驻完整回答
+            sys.stdout.write(outcome.pop("report") + "\n")
+            results.append(outcome)
+        sys.stdout.flush()
 
     duration = time.time() - start_time
 
@@ -212,20 +258,27 @@ async def run_all_comparisons(cases: list, case_index: int = None):
         print(f"\n  ⏱️  总耗时: {duration:.1f}s")
         print(f"  📝 测试数量: {len(results)}")
 
-        avg_generic_len = sum(r["generic_length"] for r in results) / len(results)
-        avg_expert_len = sum(r["expert_length"] for r in results) / len(results)
+        # 单次遍历累计所有汇总指标
+        total_generic_len = total_expert_len = 0
+        total_confidence = 0.0
+        stage_counts = Counter()
+        for r in results:
+            total_generic_len += r["generic_length"]
+            total_expert_len += r["expert_length"]
+            total_confidence += r["confidence"]
+            stage_counts[r["stage"]] += 1
+
+        avg_generic_len = total_generic_len / len(results)
+        avg_expert_len = total_expert_len / len(results)
         print(f"\n  通用回答平均长度: {avg_generic_len:.0f} 字")
         print(f"  专家回答平均长度: {avg_expert_len:.0f} 字")
         print(f"  专家回答长度比: {avg_expert_len / avg_generic_len:.1%}")
 
         print(f"\n  阶段分布:")
-        stage_counts = {}
-        for r in results:
-            stage_counts[r["stage"]] = stage_counts.get(r["stage"], 0) + 1
-        for stage, count in sorted(stage_counts.items(), key=lambda x: -x[1]):
+        for stage, count in stage_counts.most_common():
             print(f"    {stage}: {count} 个")
 
-        avg_confidence = sum(r["confidence"] for r in results) / len(results)
+        avg_confidence = total_confidence / len(results)
         print(f"\n  平均置信度: {avg_confidence:.0%}")
         print("\n" + "━" * 70)
 
@@ -244,6 +297,12 @@ def main():
         default=None,
         help="自定义测试问题",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"同时运行的对比用例数上限 (默认 {DEFAULT_CONCURRENCY})",
+    )
     args = parser.parse_args()
 
     print("\n🔬 专家角色 A/B 对比工具")
@@ -254,9 +313,9 @@ def main():
 
     if args.custom:
         cases = [{"query": args.custom, "description": "自定义问题"}]
-        asyncio.run(run_all_comparisons(cases))
+        asyncio.run(run_all_comparisons(cases, concurrency=args.concurrency))
     else:
-        asyncio.run(run_all_comparisons(cases, args.case))
+        asyncio.run(run_all_comparisons(cases, args.case, args.concurrency))
 
 
 if __name__ == "__main__":
@@ -5,7 +5,9 @@
     python tests/eval_stage_expert.py --mode keyword    # 仅关键词匹配（快速，CI用）
     python tests/eval_stage_expert.py --mode llm        # 启用LLM深度分析（需要API key）
     python tests/eval_stage_expert.py --mode all         # 两种模式都跑
+    python tests/eval_stage_expert.py --concurrency 4   # 限制并发评估的用例数
 """
+import io
 import os
 import sys
 import asyncio
@@ -19,6 +21,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from backend.core.stage_reasoning import (
     StageAwareReasoning, StageUnderstanding, StageTransitionDetector,
     ExpertRoleManager, StageContext, ExpertRole, StageTransition,
+    _keyword_classify,
 )
 
 
@@ -221,23 +224,30 @@ async def evaluate_transition_case(
 
 # ============ 报告生成 ============
 
-def print_header(title: str):
+def _flush(out: io.StringIO):
+    """将缓冲的报告一次性写到标准输出"""
+    sys.stdout.write(out.getvalue())
+    sys.stdout.flush()
+
+
+def print_header(title: str, out):
     """打印报告标题"""
     width = 70
-    print("\n" + "━" * width)
-    print(f"  {title}")
-    print("━" * width)
+    print("\n" + "━" * width, file=out)
+    print(f"  {title}", file=out)
+    print("━" * width, file=out)
 
 
 def print_results(results: List[EvalResult], title: str):
     """打印评估结果"""
-    print_header(title)
+    out = io.StringIO()
+    print_header(title, out)
 
     passed = sum(1 for r in results if r.passed)
     total = len(results)
     accuracy = passed / total * 100 if total > 0 else 0
 
-    print(f"\n  📊 准确率: {passed}/{total} ({accuracy:.1f}%)\n")
+    print(f"\n  📊 准确率: {passed}/{total} ({accuracy:.1f}%)\n", file=out)
 
     # 置信度分布
     confidences = [r.confidence for r in results]
@@ -245,75 +255,84 @@ def print_results(results: List[EvalResult], title: str):
         avg_conf = sum(confidences) / len(confidences)
         min_conf = min(confidences)
         max_conf = max(confidences)
-        print(f"  📈 置信度: 平均 {avg_conf:.0%} | 最低 {min_conf:.0%} | 最高 {max_conf:.0%}\n")
+        print(f"  📈 置信度: 平均 {avg_conf:.0%} | 最低 {min_conf:.0%} | 最高 {max_conf:.0%}\n", file=out)
 
     # 详细结果
     for r in results:
         status = "✅" if r.passed else "❌"
-        print(f"  {status} [{r.description}]")
-        print(f"     输入: {r.query[:50]}...")
+        print(f"  {status} [{r.description}]", file=out)
+        print(f"     输入: {r.query[:50]}...", file=out)
         if r.passed:
-            print(f"     阶段: {r.actual_stage} | 专家: {r.actual_expert} | 置信度: {r.confidence:.0%}")
+            print(f"     阶段: {r.actual_stage} | 专家: {r.actual_expert} | 置信度: {r.confidence:.0%}", file=out)
         else:
-            print(f"     期望: {r.expected_stage}/{r.expected_expert}")
-            print(f"     实际: {r.actual_stage}/{r.actual_expert} | 置信度: {r.confidence:.0%}")
-        print()
+            print(f"     期望: {r.expected_stage}/{r.expected_expert}", file=out)
+            print(f"     实际: {r.actual_stage}/{r.actual_expert} | 置信度: {r.confidence:.0%}", file=out)
+        print(file=out)
 
+    _flush(out)
     return accuracy
 
 
 def print_transition_results(results: List[TransitionResult]):
     """打印阶段转换评估结果"""
-    print_header("阶段转换检测评估")
+    out = io.StringIO()
+    print_header("阶段转换检测评估", out)
 
     passed = sum(1 for r in results if r.passed)
     total = len(results)
     accuracy = passed / total * 100 if total > 0 else 0
 
-    print(f"\n  📊 准确率: {passed}/{total} ({accuracy:.1f}%)\n")
+    print(f"\n  📊 准确率: {passed}/{total} ({accuracy:.1f}%)\n", file=out)
 
     for r in results:
         status = "✅" if r.passed else "❌"
-        print(f"  {status} {r.name}")
-        print(f"     期望转换: {r.expected_transition[0]} → {r.expected_transition[1]}")
+        print(f"  {status} {r.name}", file=out)
+        print(f"     期望转换: {r.expected_transition[0]} → {r.expected_transition[1]}", file=out)
         if r.actual_transition:
-            print(f"     实际转换: {r.actual_transition[0]} → {r.actual_transition[1]}")
+            print(f"     实际转换: {r.actual_transition[0]} → {r.actual_transition[1]}", file=out)
         else:
-            print(f"     实际转换: 未检测到")
+            print(f"     实际转换: 未检测到", file=out)
 
         for turn in r.turn_results:
             turn_status = "✓" if turn["stage_match"] else "✗"
-            print(f"       {turn_status} \"{turn['query'][:40]}\" → {turn['actual_stage']} (期望: {turn['expected_stage']}, 置信度: {turn['confidence']:.0%})")
-        print()
+            print(f"       {turn_status} \"{turn['query'][:40]}\" → {turn['actual_stage']} (期望: {turn['expected_stage']}, 置信度: {turn['confidence']:.0%})", file=out)
+        print(file=out)
 
+    _flush(out)
     return accuracy
 
 
 def print_summary(c_end_acc: float, b_end_acc: float, transition_acc: float, mode: str, duration: float):
     """打印总结"""
-    print_header("评估总结")
-    print(f"\n  🔧 模式: {mode}")
-    print(f"  ⏱️  耗时: {duration:.2f}s")
-    print(f"\n  C端阶段检测准确率: {c_end_acc:.1f}%")
-    print(f"  B端阶段检测准确率: {b_end_acc:.1f}%")
-    print(f"  阶段转换检测准确率: {transition_acc:.1f}%")
+    out = io.StringIO()
+    print_header("评估总结", out)
+    print(f"\n  🔧 模式: {mode}", file=out)
+    print(f"  ⏱️  耗时: {duration:.2f}s", file=out)
+    print(f"\n  C端阶段检测准确率: {c_end_acc:.1f}%", file=out)
+    print(f"  B端阶段检测准确率: {b_end_acc:.1f}%", file=out)
+    print(f"  阶段转换检测准确率: {transition_acc:.1f}%", file=out)
 
     overall = (c_end_acc + b_end_acc + transition_acc) / 3
-    print(f"\n  📊 综合准确率: {overall:.1f}%")
+    print(f"\n  📊 综合准确率: {overall:.1f}%", file=out)
 
     if overall >= 80:
-        print("\n  🎉 系统表现良好！")
+        print("\n  🎉 系统表现良好！", file=out)
     elif overall >= 60:
-        print("\n  ⚠️  系统表现一般，建议优化关键词匹配或启用LLM分析")
+        print("\n  ⚠️  系统表现一般，建议优化关键词匹配或启用LLM分析", file=out)
     else:
-        print("\n  ❌ 系统表现较差，需要检查阶段检测逻辑")
+        print("\n  ❌ 系统表现较差，需要检查阶段检测逻辑", file=out)
 
-    print("\n" + "━" * 70)
+    print("\n" + "━" * 70, file=out)
+    _flush(out)
 
 
 # ============ 主函数 ============
 
-async def run_evaluation(mode: str = "keyword"):
+# 默认同时在途的评估用例数
+DEFAULT_CONCURRENCY = 8
+
+
+async def run_evaluation(mode: str = "keyword", concurrency: int = DEFAULT_CONCURRENCY):
     """运行评估"""
     start_time = time.time()
 
@@ -337,31 +356,47 @@ async def run_evaluation(mode: str = "keyword"):
 
     reasoning = StageAwareReasoning(llm_caller=llm_caller)
 
+    # 各用例互不依赖，并发执行；信号量限制同时在途的调用数（LLM 模式下受 QPS 限制）
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _bounded(coro):
+        async with semaphore:
+            return await coro
+
     # C端评估
-    c_end_results = []
-    for query, expected_stage, expected_expert, desc in C_END_CASES:
-        result = await evaluate_single_case(
+    c_end_results = await asyncio.gather(*(
+        _bounded(evaluate_single_case(
             reasoning, query, expected_stage, expected_expert, desc, "c_end"
-        )
-        c_end_results.append(result)
+        ))
+        for query, expected_stage, expected_expert, desc in C_END_CASES
+    ))
 
     c_end_acc = print_results(c_end_results, "C端阶段检测评估")
 
     # B端评估
-    b_end_results = []
-    for query, expected_stage, expected_expert, desc in B_END_CASES:
-        result = await evaluate_single_case(
+    b_end_results = await asyncio.gather(*(
+        _bounded(evaluate_single_case(
             reasoning, query, expected_stage, expected_expert, desc, "b_end"
-        )
-        b_end_results.append(result)
+        ))
+        for query, expected_stage, expected_expert, desc in B_END_CASES
+    ))
 
     b_end_acc = print_results(b_end_results, "B端阶段检测评估")
 
-    # 阶段转换评估
-    transition_results = []
-    for case in TRANSITION_CASES:
-        result = await evaluate_transition_case(reasoning, case)
-        transition_results.append(result)
+    # 阶段转换评估（同一用例内的多轮对话依赖上一轮阶段，只在用例之间并发）
+    # TaskGroup 中任一用例失败会取消其余用例，避免多轮 LLM 调用继续空跑
+    if hasattr(asyncio, "TaskGroup"):
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(_bounded(evaluate_transition_case(reasoning, case)))
+                for case in TRANSITION_CASES
+            ]
+        transition_results = [task.result() for task in tasks]
+    else:
+        transition_results = await asyncio.gather(*(
+            _bounded(evaluate_transition_case(reasoning, case))
+            for case in TRANSITION_CASES
+        ))
 
     transition_acc = print_transition_results(transition_results)
 
@@ -369,6 +404,9 @@ async def run_evaluation(mode: str = "keyword"):
     duration = time.time() - start_time
     print_summary(c_end_acc, b_end_acc, transition_acc, mode, duration)
 
+    cache_info = _keyword_classify.cache_info()
+    print(f"  🗂️  关键词检测缓存: 命中 {cache_info.hits} | 未命中 {cache_info.misses} | 条目 {cache_info.currsize}/{cache_info.maxsize}")
+
 
 def main():
     parser = argparse.ArgumentParser(description="阶段感知专家系统评估脚本")
@@ -378,6 +416,12 @@ def main():
         default="keyword",
         help="评估模式: keyword(仅关键词), llm(启用LLM), all(两种都跑)",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"同时运行的评估用例数上限 (默认 {DEFAULT_CONCURRENCY})",
+    )
     args = parser.parse_args()
 
     print("\n🔍 阶段感知专家系统 — 端到端评估")
@@ -385,12 +429,12 @@ def main():
 
     if args.mode == "all":
         print("\n📋 模式: keyword (关键词匹配)")
-        asyncio.run(run_evaluation("keyword"))
+        asyncio.run(run_evaluation("keyword", args.concurrency))
         print("\n\n📋 模式: llm (LLM深度分析)")
-        asyncio.run(run_evaluation("llm"))
+        asyncio.run(run_evaluation("llm", args.concurrency))
     else:
         print(f"\n📋 模式: {args.mode}")
-        asyncio.run(run_evaluation(args.mode))
+        asyncio.run(run_evaluation(args.mode, args.concurrency))
 
 
 if __name__ == "__main__":
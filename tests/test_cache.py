@@ -1,20 +1,20 @@
 """
 缓存系统单元测试
 测试 backend/core/cache.py 的核心功能
+
+KnowledgeQueryCache / LLMResponseCache 的 fixture 为模块级共享，
+同一类中的各测试使用互不相同的查询键，不依赖空缓存
 """
 import pytest
-import os
-import sys
-import time
-
-# 添加项目路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.core.cache import (
     LRUCache, CircularBuffer, KnowledgeQueryCache, LLMResponseCache,
     get_cache_manager, get_knowledge_cache, get_llm_cache
 )
 
+# pytest -n auto --dist=loadgroup 时本模块在同一进程中运行
+pytestmark = pytest.mark.xdist_group(name="caches")
+
 
 class TestLRUCache:
     """测试 LRUCache 类"""
@@ -60,13 +60,16 @@ class TestLRUCache:
         assert cache.get("key3") == "value3"
         assert cache.get("key4") == "value4"
 
-    def test_ttl_expiration(self):
-        """测试 TTL 过期"""
+    def test_ttl_expiration(self, monkeypatch):
+        """测试 TTL 过期（替换单调时钟，无需真实等待）"""
+        current = [1000.0]
+        monkeypatch.setattr("backend.core.cache.time.monotonic", lambda: current[0])
+
         cache = LRUCache(max_size=10, ttl=0.1)  # 0.1秒过期
         cache.set("key1", "value1")
         assert cache.get("key1") == "value1"
 
-        time.sleep(0.15)  # 等待过期
+        current[0] += 0.2  # 时钟前进，超过 TTL
         assert cache.get("key1") is None
 
     def test_delete(self):
@@ -124,6 +127,8 @@ class TestCircularBuffer:
         assert len(items) == 3
         assert "item1" not in items
         assert "item4" in items
+        assert "item1" not in buffer
+        assert "item4" in buffer
 
     def test_get_recent(self):
         """测试获取最近的项"""
@@ -135,6 +140,15 @@ class TestCircularBuffer:
         assert len(recent) == 3
         assert recent[-1] == "item4"
 
+    def test_iter_recent(self):
+        """测试不复制地迭代最近的项"""
+        buffer = CircularBuffer(max_size=3)
+        for i in range(5):
+            buffer.append(f"item{i}")
+
+        assert list(buffer.iter_recent(2)) == ["item3", "item4"]
+        assert list(buffer.iter_recent(10)) == ["item2", "item3", "item4"]
+
     def test_clear(self):
         """测试清空"""
         buffer = CircularBuffer(max_size=5)
@@ -146,7 +160,7 @@ class TestCircularBuffer:
 class TestKnowledgeQueryCache:
     """测试 KnowledgeQueryCache 类"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def cache(self):
         """创建测试用的缓存"""
         return KnowledgeQueryCache(max_size=100, similarity_threshold=0.8)
@@ -206,11 +220,27 @@ class TestKnowledgeQueryCache:
         # 注意：相似度匹配可能因实现而异
         # 这里主要测试方法是否正常工作
 
+    def test_find_similar_scoped_by_user_type(self, cache):
+        """测试相似查询只在相同用户类型内匹配"""
+        results = [{"content": "瓷砖选购内容"}]
+        cache.set(
+            query="瓷砖 选购 技巧",
+            user_type="c_end",
+            k=5,
+            results=results
+        )
+
+        similar = cache.find_similar(query="选购 瓷砖 技巧", user_type="c_end", k=5)
+        assert similar == results
+
+        assert cache.find_similar(query="选购 瓷砖 技巧", user_type="b_end", k=5) is None
+        assert cache.find_top_similar(query="选购 瓷砖 技巧", user_type="b_end", k=5) == []
+
 
 class TestLLMResponseCache:
     """测试 LLMResponseCache 类"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def cache(self):
         """创建测试用的缓存"""
         return LLMResponseCache(max_size=100, ttl=7200)
@@ -270,12 +300,13 @@ class TestCacheManager:
         assert cache is not None
         assert isinstance(cache, LLMResponseCache)
 
-    def test_singleton_pattern(self):
-        """测试单例模式"""
+    def test_singleton_pattern(self, monkeypatch):
+        """测试单例模式（首次创建后不再构造新实例）"""
         cache1 = get_knowledge_cache()
-        cache2 = get_knowledge_cache()
-        assert cache1 is cache2
 
+        def fail_init(*args, **kwargs):
+            raise AssertionError("单例不应被重复创建")
 
-if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
+        monkeypatch.setattr("backend.core.cache.KnowledgeQueryCache", fail_init)
+        cache2 = get_knowledge_cache()
+        assert cache1 is cache2
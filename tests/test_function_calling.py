@@ -1,40 +1,46 @@
 """
 Function Calling 模块单元测试
 测试 backend/core/function_calling.py 的核心功能
+
+engine fixture 为模块级共享：测试只做意图检测和工具调用，不修改引擎状态
 """
 import pytest
-import os
-import sys
-
-# 添加项目路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.core.function_calling import (
     ParameterExtractor, FunctionCall, FunctionCallingResult,
-    FunctionCallingEngine, get_function_calling_engine
+    FunctionCallingEngine, get_function_calling_engine, _match_tool_intents
 )
 
+# pytest -n auto --dist=loadgroup 时本模块在同一进程中运行
+pytestmark = pytest.mark.xdist_group(name="function_calling")
 
-class TestParameterExtractor:
-    """测试 ParameterExtractor 类"""
 
-    def test_extract_amount_yuan(self):
-        """测试提取元为单位的金额"""
-        text = "我买了一套沙发花了5000元"
-        amount = ParameterExtractor.extract_amount(text)
-        assert amount == 5000.0
+# (提取方法, 文本, 上下文, 期望值)
+EXTRACTOR_CASES = [
+    pytest.param("extract_amount", "我买了一套沙发花了5000元", None, 5000.0, id="amount_yuan"),
+    pytest.param("extract_amount", "装修预算大概10万元", None, 100000.0, id="amount_wan"),
+    pytest.param("extract_amount", "投入了5万，收入了15万", "投入", 50000.0, id="amount_with_context"),
+    pytest.param("extract_area", "我家房子120平米", None, 120.0, id="area"),
+    pytest.param("extract_area", "客厅面积30㎡", None, 30.0, id="area_sqm_symbol"),
+    pytest.param("extract_category", "我想买一套沙发", None, "家具", id="category_furniture"),
+    pytest.param("extract_category", "瓷砖价格怎么样", None, "建材", id="category_building_material"),
+    pytest.param("extract_specific_item", "这个沙发5000元贵不贵", None, "沙发", id="specific_item"),
+    pytest.param("extract_style", "我喜欢北欧风格的装修", None, "北欧", id="style"),
+    pytest.param("extract_style", "我想装修房子", None, "现代简约", id="style_default"),
+    pytest.param("extract_period_days", "最近30天的数据", None, 30, id="period_days"),
+    pytest.param("extract_period_days", "最近3个月的销售情况", None, 90, id="period_months"),
+]
 
-    def test_extract_amount_wan(self):
-        """测试提取万为单位的金额"""
-        text = "装修预算大概10万元"
-        amount = ParameterExtractor.extract_amount(text)
-        assert amount == 100000.0
 
-    def test_extract_amount_with_context(self):
-        """测试带上下文的金额提取"""
-        text = "投入了5万，收入了15万"
-        investment = ParameterExtractor.extract_amount(text, "投入")
-        assert investment == 50000.0
+class TestParameterExtractor:
+    """测试 ParameterExtractor 类"""
+
+    @pytest.mark.parametrize("method,text,context,expected", EXTRACTOR_CASES)
+    def test_extract(self, method, text, context, expected):
+        """测试各类参数提取"""
+        extract = getattr(ParameterExtractor, method)
+        args = (text,) if context is None else (text, context)
+        assert extract(*args) == expected
 
     def test_extract_multiple_amounts(self):
         """测试提取多个金额"""
@@ -44,60 +50,6 @@ class TestParameterExtractor:
         assert 50000.0 in amounts
         assert 150000.0 in amounts
 
-    def test_extract_area(self):
-        """测试提取面积"""
-        text = "我家房子120平米"
-        area = ParameterExtractor.extract_area(text)
-        assert area == 120.0
-
-    def test_extract_area_sqm_symbol(self):
-        """测试提取面积（㎡符号）"""
-        text = "客厅面积30㎡"
-        area = ParameterExtractor.extract_area(text)
-        assert area == 30.0
-
-    def test_extract_category_furniture(self):
-        """测试提取家具品类"""
-        text = "我想买一套沙发"
-        category = ParameterExtractor.extract_category(text)
-        assert category == "家具"
-
-    def test_extract_category_building_material(self):
-        """测试提取建材品类"""
-        text = "瓷砖价格怎么样"
-        category = ParameterExtractor.extract_category(text)
-        assert category == "建材"
-
-    def test_extract_specific_item(self):
-        """测试提取具体商品"""
-        text = "这个沙发5000元贵不贵"
-        item = ParameterExtractor.extract_specific_item(text)
-        assert item == "沙发"
-
-    def test_extract_style(self):
-        """测试提取装修风格"""
-        text = "我喜欢北欧风格的装修"
-        style = ParameterExtractor.extract_style(text)
-        assert style == "北欧"
-
-    def test_extract_style_default(self):
-        """测试默认装修风格"""
-        text = "我想装修房子"
-        style = ParameterExtractor.extract_style(text)
-        assert style == "现代简约"
-
-    def test_extract_period_days(self):
-        """测试提取周期天数"""
-        text = "最近30天的数据"
-        days = ParameterExtractor.extract_period_days(text)
-        assert days == 30
-
-    def test_extract_period_months(self):
-        """测试提取周期月数"""
-        text = "最近3个月的销售情况"
-        days = ParameterExtractor.extract_period_days(text)
-        assert days == 90
-
 
 class TestFunctionCall:
     """测试 FunctionCall 类"""
@@ -162,7 +114,7 @@ class TestFunctionCallingResult:
 class TestFunctionCallingEngine:
     """测试 FunctionCallingEngine 类"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def engine(self):
         """创建测试用的引擎"""
         return FunctionCallingEngine(llm=None)
@@ -184,58 +136,39 @@ class TestFunctionCallingEngine:
         assert "description" in tool
         assert "parameters" in tool
 
-    def test_detect_subsidy_intent(self, engine):
-        """测试检测补贴计算意图"""
-        message = "我买了1万元的家具，能补贴多少钱？"
-        detected = engine._detect_tool_intent(message)
-        assert len(detected) > 0
-        assert detected[0]["name"] == "subsidy_calculator"
-        assert detected[0]["arguments"]["amount"] == 10000.0
-        assert detected[0]["arguments"]["category"] == "家具"
-
-    def test_detect_roi_intent(self, engine):
-        """测试检测 ROI 计算意图"""
-        message = "我投入了5万，收入了15万，ROI是多少？"
-        detected = engine._detect_tool_intent(message)
-        assert len(detected) > 0
-        assert detected[0]["name"] == "roi_calculator"
-        assert detected[0]["arguments"]["investment"] == 50000.0
-        assert detected[0]["arguments"]["revenue"] == 150000.0
-
-    def test_detect_price_eval_intent(self, engine):
-        """测试检测价格评估意图"""
-        message = "这个沙发8000元贵不贵？"
+    @pytest.mark.parametrize("message,tool_name,expected_args", [
+        pytest.param(
+            "我买了1万元的家具，能补贴多少钱？", "subsidy_calculator",
+            {"amount": 10000.0, "category": "家具"}, id="subsidy",
+        ),
+        pytest.param(
+            "我投入了5万，收入了15万，ROI是多少？", "roi_calculator",
+            {"investment": 50000.0, "revenue": 150000.0}, id="roi",
+        ),
+        pytest.param(
+            "这个沙发8000元贵不贵？", "price_evaluator",
+            {"category": "沙发", "price": 8000.0}, id="price_eval",
+        ),
+        pytest.param(
+            "100平米的房子装修需要多久？", "decoration_timeline",
+            {"house_area": 100.0}, id="timeline",
+        ),
+        pytest.param(
+            "我有20万预算，100平米的房子，预算怎么分配？", "budget_planner",
+            {"total_budget": 200000.0, "house_area": 100.0}, id="budget",
+        ),
+        pytest.param(
+            "50平米的客厅需要多少瓷砖？", "material_calculator",
+            {"material_type": "瓷砖", "area": 50.0}, id="material",
+        ),
+    ])
+    def test_detect_intent(self, engine, message, tool_name, expected_args):
+        """测试检测各工具的调用意图及参数"""
         detected = engine._detect_tool_intent(message)
         assert len(detected) > 0
-        assert detected[0]["name"] == "price_evaluator"
-        assert detected[0]["arguments"]["category"] == "沙发"
-        assert detected[0]["arguments"]["price"] == 8000.0
-
-    def test_detect_timeline_intent(self, engine):
-        """测试检测工期估算意图"""
-        message = "100平米的房子装修需要多久？"
-        detected = engine._detect_tool_intent(message)
-        assert len(detected) > 0
-        assert detected[0]["name"] == "decoration_timeline"
-        assert detected[0]["arguments"]["house_area"] == 100.0
-
-    def test_detect_budget_intent(self, engine):
-        """测试检测预算规划意图"""
-        message = "我有20万预算，100平米的房子，预算怎么分配？"
-        detected = engine._detect_tool_intent(message)
-        assert len(detected) > 0
-        assert detected[0]["name"] == "budget_planner"
-        assert detected[0]["arguments"]["total_budget"] == 200000.0
-        assert detected[0]["arguments"]["house_area"] == 100.0
-
-    def test_detect_material_intent(self, engine):
-        """测试检测材料计算意图"""
-        message = "50平米的客厅需要多少瓷砖？"
-        detected = engine._detect_tool_intent(message)
-        assert len(detected) > 0
-        assert detected[0]["name"] == "material_calculator"
-        assert detected[0]["arguments"]["material_type"] == "瓷砖"
-        assert detected[0]["arguments"]["area"] == 50.0
+        assert detected[0]["name"] == tool_name
+        for key, value in expected_args.items():
+            assert detected[0]["arguments"][key] == value
 
     def test_detect_no_intent(self, engine):
         """测试无工具调用意图"""
@@ -243,6 +176,17 @@ class TestFunctionCallingEngine:
         detected = engine._detect_tool_intent(message)
         assert len(detected) == 0
 
+    def test_detect_intent_cached(self, engine):
+        """测试相同消息的意图检测命中缓存，且返回的参数互不影响"""
+        message = "我买了5000元的沙发，能补贴多少？"
+        first = engine._detect_tool_intent(message)
+        hits = _match_tool_intents.cache_info().hits
+
+        first[0]["arguments"]["amount"] = 0
+        second = engine._detect_tool_intent(message)
+        assert _match_tool_intents.cache_info().hits == hits + 1
+        assert second[0]["arguments"]["amount"] == 5000.0
+
     def test_process_with_tools_sync(self, engine):
         """测试同步工具处理"""
         message = "我买了2万元的建材，能补贴多少？"
@@ -304,7 +248,3 @@ class TestFunctionCallingAsync:
         message = "我买了1万元的软装，能补贴多少？"
         result = await engine.process_with_tools(message)
         assert isinstance(result, FunctionCallingResult)
-
-
-if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
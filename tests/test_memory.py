@@ -3,23 +3,39 @@
 测试 backend/core/memory.py 的核心功能
 """
 import pytest
-import os
-import sys
-import tempfile
-import shutil
-import time
-import uuid
-
-# 添加项目路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import itertools
 
 from backend.core.memory import (
     MemoryItem, MemoryType, UserProfile,
     InMemoryStore, PersistentMemoryStore, SQLiteMemoryStore,
-    MemoryManager, get_memory_manager
+    MemoryManager,
 )
 
 
+# 测试内唯一 ID 的序号（各测试的存储相互独立，只需进程内不重复，无需随机数）
+_id_counter = itertools.count()
+
+
+def _unique_id(prefix: str) -> str:
+    """生成带前缀的测试唯一 ID"""
+    return f"{prefix}_{next(_id_counter):08d}"
+
+
+def _long_term_item(item_id: str, content: str, **overrides) -> MemoryItem:
+    """构造长期记忆项（循环批量写入用，只需给出 id 和内容）"""
+    return MemoryItem(id=item_id, content=content, memory_type=MemoryType.LONG_TERM, **overrides)
+
+
+@pytest.fixture(scope="module")
+def memory_manager(tmp_path_factory):
+    """
+    模块内共享的记忆管理器（纯内存实例，不读写全局数据目录）
+
+    使用它的测试都以 _unique_id 生成的用户 / 会话 ID 读写，互不干扰
+    """
+    return MemoryManager(storage_dir=str(tmp_path_factory.mktemp("memory")), use_persistence=False)
+
+
 class TestMemoryItem:
     """测试 MemoryItem 类"""
 
@@ -116,44 +132,47 @@ class TestUserProfile:
 class TestInMemoryStore:
     """测试 InMemoryStore 类"""
 
-    def test_save_and_get(self):
-        """测试保存和获取"""
-        store = InMemoryStore(max_size=100)
-        item = MemoryItem(
+    @pytest.fixture(scope="class")
+    def shared_store(self):
+        """类内共享的内存存储"""
+        return InMemoryStore(max_size=100)
+
+    @pytest.fixture
+    def store(self, shared_store):
+        """清空后写入一条 item_001 的共享存储"""
+        shared_store.clear()
+        shared_store.save(MemoryItem(
             id="item_001",
             content="测试内容",
             memory_type=MemoryType.SHORT_TERM,
             importance=0.8
-        )
-        store.save(item)
-
-        retrieved = store.get("item_001")
-        assert retrieved is not None
-        assert retrieved.content == "测试内容"
-
-    def test_get_nonexistent(self):
-        """测试获取不存在的项"""
-        store = InMemoryStore()
-        item = store.get("nonexistent")
-        assert item is None
-
-    def test_delete(self):
-        """测试删除"""
-        store = InMemoryStore()
-        item = MemoryItem(
-            id="item_002",
-            content="测试内容",
-            memory_type=MemoryType.SHORT_TERM
-        )
-        store.save(item)
-
-        result = store.delete("item_002")
-        assert result is True
-        assert store.get("item_002") is None
-
-    def test_search(self):
+        ))
+        return shared_store
+
+    # (操作, 读取的键, 操作后读取到的内容)
+    @pytest.mark.parametrize("op,key,expected_content", [
+        pytest.param(None, "item_001", "测试内容", id="save_and_get"),
+        pytest.param(None, "nonexistent", None, id="get_nonexistent"),
+        pytest.param("delete", "item_001", None, id="delete"),
+        pytest.param("clear", "item_001", None, id="clear"),
+    ])
+    def test_crud(self, store, op, key, expected_content):
+        """测试保存后读取，以及删除 / 清空后的读取结果"""
+        if op == "delete":
+            assert store.delete(key) is True
+        elif op == "clear":
+            store.clear()
+            assert store.stats()["size"] == 0
+
+        retrieved = store.get(key)
+        if expected_content is None:
+            assert retrieved is None
+        else:
+            assert retrieved is not None
+            assert retrieved.content == expected_content
+
+    def test_search(self, store):
         """测试搜索"""
-        store = InMemoryStore()
         store.save(MemoryItem(
             id="item_003",
             content="现代简约风格装修",
@@ -185,22 +204,8 @@ class TestInMemoryStore:
         stats = store.stats()
         assert stats["size"] <= 5
 
-    def test_clear(self):
-        """测试清空"""
-        store = InMemoryStore()
-        store.save(MemoryItem(
-            id="item_005",
-            content="测试",
-            memory_type=MemoryType.SHORT_TERM
-        ))
-        store.clear()
-
-        stats = store.stats()
-        assert stats["size"] == 0
-
-    def test_stats(self):
+    def test_stats(self, store):
         """测试统计信息"""
-        store = InMemoryStore(max_size=100)
         store.save(MemoryItem(
             id="item_006",
             content="测试",
@@ -223,17 +228,9 @@ class TestInMemoryStore:
 class TestPersistentMemoryStore:
     """测试 PersistentMemoryStore 类"""
 
-    @pytest.fixture
-    def temp_storage_path(self):
-        """创建临时存储路径"""
-        temp_dir = tempfile.mkdtemp()
-        storage_path = os.path.join(temp_dir, "test_memory.json")
-        yield storage_path
-        shutil.rmtree(temp_dir, ignore_errors=True)
-
-    def test_save_and_get(self, temp_storage_path):
+    def test_save_and_get(self, tmp_path):
         """测试保存和获取"""
-        store = PersistentMemoryStore(storage_path=temp_storage_path)
+        store = PersistentMemoryStore(storage_path=str(tmp_path / "test_memory.json"))
         item = MemoryItem(
             id="persist_001",
             content="持久化测试",
@@ -246,9 +243,9 @@ class TestPersistentMemoryStore:
         assert retrieved is not None
         assert retrieved.content == "持久化测试"
 
-    def test_search(self, temp_storage_path):
+    def test_search(self, tmp_path):
         """测试搜索"""
-        store = PersistentMemoryStore(storage_path=temp_storage_path)
+        store = PersistentMemoryStore(storage_path=str(tmp_path / "test_memory.json"))
         store.save(MemoryItem(
             id="persist_002",
             content="装修预算规划",
@@ -262,14 +259,9 @@ class TestPersistentMemoryStore:
 class TestMemoryManager:
     """测试 MemoryManager 类"""
 
-    @pytest.fixture
-    def memory_manager(self):
-        """创建测试用的记忆管理器"""
-        return get_memory_manager()
-
     def test_working_memory(self, memory_manager):
         """测试工作记忆"""
-        session_id = f"test_session_{uuid.uuid4().hex[:8]}"
+        session_id = _unique_id("test_session")
 
         memory_manager.set_working_memory(session_id, "current_task", "装修咨询")
         value = memory_manager.get_working_memory(session_id, "current_task")
@@ -277,7 +269,7 @@ class TestMemoryManager:
 
     def test_get_or_create_profile(self, memory_manager):
         """测试获取或创建用户画像"""
-        user_id = f"test_user_{uuid.uuid4().hex[:8]}"
+        user_id = _unique_id("test_user")
 
         profile = memory_manager.get_or_create_profile(user_id, "c_end")
         assert profile is not None
@@ -286,7 +278,7 @@ class TestMemoryManager:
 
     def test_update_profile(self, memory_manager):
         """测试更新用户画像"""
-        user_id = f"test_user_{uuid.uuid4().hex[:8]}"
+        user_id = _unique_id("test_user")
 
         profile = memory_manager.get_or_create_profile(user_id, "c_end")
         profile.update_interest("现代简约", 0.5)
@@ -297,10 +289,10 @@ class TestMemoryManager:
 
     def test_short_term_memory(self, memory_manager):
         """测试短期记忆"""
-        session_id = f"test_session_{uuid.uuid4().hex[:8]}"
+        session_id = _unique_id("test_session")
 
         item = MemoryItem(
-            id=f"short_{uuid.uuid4().hex[:8]}",
+            id=_unique_id("short"),
             content="用户询问了装修风格",
             memory_type=MemoryType.SHORT_TERM,
             importance=0.7
@@ -314,11 +306,11 @@ class TestMemoryManager:
 class TestMemoryIntegration:
     """集成测试"""
 
-    def test_full_workflow(self):
+    def test_full_workflow(self, memory_manager):
         """测试完整工作流程"""
-        manager = get_memory_manager()
-        user_id = f"integration_user_{uuid.uuid4().hex[:8]}"
-        session_id = f"integration_session_{uuid.uuid4().hex[:8]}"
+        manager = memory_manager
+        user_id = _unique_id("integration_user")
+        session_id = _unique_id("integration_session")
 
         # 1. 创建用户画像
         profile = manager.get_or_create_profile(user_id, "c_end")
@@ -331,7 +323,7 @@ class TestMemoryIntegration:
 
         # 3. 添加短期记忆
         item = MemoryItem(
-            id=f"msg_{uuid.uuid4().hex[:8]}",
+            id=_unique_id("msg"),
             content="用户想了解现代简约风格的装修方案",
             memory_type=MemoryType.SHORT_TERM,
             importance=0.8
@@ -344,19 +336,27 @@ class TestMemoryIntegration:
 
 
 class TestSQLiteMemoryStore:
-    """测试 SQLiteMemoryStore 类"""
+    """测试 SQLiteMemoryStore 类
+
+    大部分测试共用一个类级别的内存库 store（只建一次库），每个测试前清空数据；
+    需要特殊参数或多线程连接的测试仍使用独立的数据库文件
+    """
+
+    @pytest.fixture(scope="class")
+    def shared_store(self):
+        """类内共享的 SQLite 存储（只测表操作，不验证落盘，使用内存库）"""
+        store = SQLiteMemoryStore(db_path=":memory:")
+        yield store
+        store.close()
 
     @pytest.fixture
-    def temp_db_path(self):
-        """创建临时数据库路径"""
-        temp_dir = tempfile.mkdtemp()
-        db_path = os.path.join(temp_dir, "test_memory.db")
-        yield db_path
-        shutil.rmtree(temp_dir, ignore_errors=True)
-
-    def test_save_and_get(self, temp_db_path):
+    def store(self, shared_store):
+        """清空后的共享存储"""
+        shared_store.clear()
+        return shared_store
+
+    def test_save_and_get(self, store):
         """测试保存和获取"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
         item = MemoryItem(
             id="sqlite_001",
             content="SQLite 测试内容",
@@ -371,15 +371,13 @@ class TestSQLiteMemoryStore:
         assert retrieved.content == "SQLite 测试内容"
         assert retrieved.importance == 0.9
 
-    def test_get_nonexistent(self, temp_db_path):
+    def test_get_nonexistent(self, store):
         """测试获取不存在的项"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
         item = store.get("nonexistent")
         assert item is None
 
-    def test_delete(self, temp_db_path):
+    def test_delete(self, store):
         """测试删除"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
         item = MemoryItem(
             id="sqlite_002",
             content="待删除内容",
@@ -391,9 +389,8 @@ class TestSQLiteMemoryStore:
         assert result is True
         assert store.get("sqlite_002") is None
 
-    def test_search(self, temp_db_path):
+    def test_search(self, store):
         """测试搜索"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
         store.save(MemoryItem(
             id="sqlite_003",
             content="现代简约风格装修方案",
@@ -409,9 +406,8 @@ class TestSQLiteMemoryStore:
         assert len(results) >= 1
         assert any("现代简约" in r.content for r in results)
 
-    def test_search_by_user(self, temp_db_path):
+    def test_search_by_user(self, store):
         """测试按用户搜索"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
         store.save(MemoryItem(
             id="sqlite_005",
             content="用户A的装修偏好",
@@ -429,10 +425,9 @@ class TestSQLiteMemoryStore:
         assert len(results) >= 1
         assert all(r.metadata.get("user_id") == "user_a" for r in results)
 
-    def test_search_by_session(self, temp_db_path):
+    def test_search_by_session(self, store):
         """测试按会话搜索"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
-        session_id = f"session_{uuid.uuid4().hex[:8]}"
+        session_id = _unique_id("session")
 
         store.save(MemoryItem(
             id="sqlite_007",
@@ -450,10 +445,9 @@ class TestSQLiteMemoryStore:
         results = store.search_by_session(session_id)
         assert len(results) == 2
 
-    def test_delete_by_session(self, temp_db_path):
+    def test_delete_by_session(self, store):
         """测试按会话删除"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
-        session_id = f"session_{uuid.uuid4().hex[:8]}"
+        session_id = _unique_id("session")
 
         store.save(MemoryItem(
             id="sqlite_009",
@@ -472,24 +466,42 @@ class TestSQLiteMemoryStore:
         assert deleted_count == 2
         assert len(store.search_by_session(session_id)) == 0
 
-    def test_max_size_eviction(self, temp_db_path):
+    def test_max_size_eviction(self, tmp_path):
         """测试容量限制和淘汰"""
-        store = SQLiteMemoryStore(db_path=temp_db_path, max_size=10)
+        store = SQLiteMemoryStore(db_path=str(tmp_path / "test_memory.db"), max_size=10)
 
         for i in range(20):
-            store.save(MemoryItem(
-                id=f"sqlite_evict_{i}",
-                content=f"内容 {i}",
-                memory_type=MemoryType.LONG_TERM,
-                importance=0.1 * (i % 10)
-            ))
+            store.save(_long_term_item(f"sqlite_evict_{i}", f"内容 {i}", importance=0.1 * (i % 10)))
 
         stats = store.stats()
         assert stats["size"] <= 10
 
-    def test_stats(self, temp_db_path):
+    def test_save_many(self, store):
+        """测试批量保存"""
+        items = [_long_term_item(f"sqlite_batch_{i}", f"批量内容 {i}") for i in range(5)]
+        assert store.save_many(items) == 5
+        assert store.get("sqlite_batch_4").content == "批量内容 4"
+        assert store.stats()["size"] == 5
+
+    def test_save_many_eviction(self, tmp_path):
+        """测试批量保存超出容量时的淘汰"""
+        store = SQLiteMemoryStore(db_path=str(tmp_path / "test_memory.db"), max_size=10)
+        assert store.save_many([
+            _long_term_item(f"sqlite_batch_evict_{i}", f"内容 {i}", importance=0.1 * (i % 10))
+            for i in range(20)
+        ]) == 10
+        assert store.stats()["size"] == 10
+
+        # 容量已满时写入的低重要性批次不会被随后的淘汰删掉
+        assert store.save_many([
+            _long_term_item(f"sqlite_batch_new_{i}", f"新内容 {i}", importance=0.0)
+            for i in range(3)
+        ]) == 3
+        assert store.stats()["size"] <= 10
+        assert all(store.get(f"sqlite_batch_new_{i}") is not None for i in range(3))
+
+    def test_stats(self, store):
         """测试统计信息"""
-        store = SQLiteMemoryStore(db_path=temp_db_path)
         store.save(MemoryItem(
             id="sqlite_stats_001",
             content="测试",
@@ -507,91 +519,107 @@ class TestSQLiteMemoryStore:
         assert stats["hits"] >= 1
         assert stats["misses"] >= 1
 
-    def test_concurrent_access(self, temp_db_path):
-        """测试并发访问"""
+    def test_clear(self, store):
+        """测试清空"""
+        store.save(MemoryItem(
+            id="sqlite_clear_001",
+            content="待清空内容",
+            memory_type=MemoryType.LONG_TERM
+        ))
+        store.get("sqlite_clear_001")
+
+        store.clear()
+        stats = store.stats()
+        assert stats["size"] == 0
+        assert stats["hits"] == 0
+        assert store.get("sqlite_clear_001") is None
+
+    @pytest.mark.parametrize("kwargs", [
+        pytest.param({"synchronous": "NORMAL; DROP TABLE memories"}, id="synchronous"),
+        pytest.param({"journal_mode": "FAST"}, id="journal_mode"),
+    ])
+    def test_invalid_pragma_values(self, tmp_path, kwargs):
+        """测试非法的 PRAGMA 取值在初始化时被拒绝"""
+        with pytest.raises(ValueError):
+            SQLiteMemoryStore(db_path=str(tmp_path / "test_memory.db"), **kwargs)
+
+    def test_memory_db_shared_across_threads(self):
+        """测试 :memory: 库在不同线程的连接之间共享数据"""
         import threading
 
-        store = SQLiteMemoryStore(db_path=temp_db_path)
-        errors = []
+        store = SQLiteMemoryStore(db_path=":memory:", journal_mode="MEMORY")
+        store.save(MemoryItem(
+            id="sqlite_mem_001",
+            content="主线程写入",
+            memory_type=MemoryType.LONG_TERM
+        ))
+
+        found = []
+        thread = threading.Thread(target=lambda: found.append(store.get("sqlite_mem_001")))
+        thread.start()
+        thread.join()
+
+        assert found[0] is not None
+        assert found[0].content == "主线程写入"
+
+    def test_concurrent_access(self, tmp_path):
+        """测试并发访问"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        store = SQLiteMemoryStore(db_path=str(tmp_path / "test_memory.db"))
 
         def writer(thread_id):
-            try:
-                for i in range(10):
-                    store.save(MemoryItem(
-                        id=f"concurrent_{thread_id}_{i}",
-                        content=f"线程 {thread_id} 消息 {i}",
-                        memory_type=MemoryType.LONG_TERM
-                    ))
-            except Exception as e:
-                errors.append(e)
+            # 单条写入与批量写入各一半（写入失败时 save 返回 False，不抛异常）
+            for i in range(5):
+                assert store.save(
+                    _long_term_item(f"concurrent_{thread_id}_{i}", f"线程 {thread_id} 消息 {i}")
+                )
+            assert store.save_many([
+                _long_term_item(f"concurrent_{thread_id}_{i}", f"线程 {thread_id} 消息 {i}")
+                for i in range(5, 10)
+            ]) == 5
 
         def reader(thread_id):
-            try:
-                for i in range(10):
-                    store.search(f"线程")
-            except Exception as e:
-                errors.append(e)
+            # 限制返回条数：只验证并发读取，不需要随写入增长反序列化全部匹配行
+            for i in range(10):
+                assert len(store.search("线程", limit=5)) <= 5
 
-        threads = []
-        for i in range(3):
-            threads.append(threading.Thread(target=writer, args=(i,)))
-            threads.append(threading.Thread(target=reader, args=(i,)))
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            futures = [executor.submit(writer, i) for i in range(3)]
+            futures += [executor.submit(reader, i) for i in range(3)]
+            # result() 会在主线程重新抛出工作线程中的异常
+            for future in futures:
+                future.result()
 
-        for t in threads:
-            t.start()
-        for t in threads:
-            t.join()
-
-        assert len(errors) == 0, f"并发访问出错: {errors}"
+        assert store.stats()["size"] == 30
 
 
 class TestMemoryManagerBackends:
     """测试 MemoryManager 不同后端"""
 
-    @pytest.fixture
-    def temp_storage_dir(self):
-        """创建临时存储目录"""
-        temp_dir = tempfile.mkdtemp()
-        yield temp_dir
-        shutil.rmtree(temp_dir, ignore_errors=True)
-
-    def test_sqlite_backend(self, temp_storage_dir):
-        """测试 SQLite 后端"""
-        manager = MemoryManager(
-            storage_dir=temp_storage_dir,
-            use_persistence=True,
-            backend="sqlite"
-        )
-        assert manager.backend == "sqlite"
-        assert isinstance(manager.long_term, SQLiteMemoryStore)
-
-    def test_file_backend(self, temp_storage_dir):
-        """测试文件后端"""
+    @pytest.mark.parametrize("backend,use_persistence,store_cls", [
+        pytest.param("sqlite", True, SQLiteMemoryStore, id="sqlite"),
+        pytest.param("file", True, PersistentMemoryStore, id="file"),
+        pytest.param("memory", False, InMemoryStore, id="memory"),
+    ])
+    def test_backend_selection(self, tmp_path, backend, use_persistence, store_cls):
+        """测试按 backend 选择长期记忆存储"""
         manager = MemoryManager(
-            storage_dir=temp_storage_dir,
-            use_persistence=True,
-            backend="file"
+            storage_dir=str(tmp_path),
+            use_persistence=use_persistence,
+            backend=backend
         )
-        assert manager.backend == "file"
-        assert isinstance(manager.long_term, PersistentMemoryStore)
+        assert manager.backend == backend
+        assert isinstance(manager.long_term, store_cls)
 
-    def test_memory_backend(self, temp_storage_dir):
-        """测试内存后端"""
-        manager = MemoryManager(
-            storage_dir=temp_storage_dir,
-            use_persistence=False,
-            backend="memory"
-        )
-        assert isinstance(manager.long_term, InMemoryStore)
-
-    def test_add_and_retrieve_long_term(self, temp_storage_dir):
+    def test_add_and_retrieve_long_term(self, tmp_path):
         """测试添加和检索长期记忆"""
         manager = MemoryManager(
-            storage_dir=temp_storage_dir,
+            storage_dir=str(tmp_path),
             use_persistence=True,
             backend="sqlite"
         )
-        user_id = f"test_user_{uuid.uuid4().hex[:8]}"
+        user_id = _unique_id("test_user")
 
         # 添加长期记忆
         item_id = manager.add_to_long_term(
@@ -605,6 +633,3 @@ class TestMemoryManagerBackends:
         results = manager.search_long_term(user_id, "现代简约")
         assert len(results) >= 1
 
-
-if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
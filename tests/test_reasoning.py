@@ -3,12 +3,6 @@
 测试 backend/core/reasoning.py 的核心功能
 """
 import pytest
-import os
-import sys
-import time
-
-# 添加项目路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.core.reasoning import (
     ReasoningType, TaskComplexity, ReasoningStep, ReasoningChain,
@@ -16,6 +10,7 @@ from backend.core.reasoning import (
     TaskAnalyzer, ReasoningEngine, get_reasoning_engine,
     get_reasoning_prompt
 )
+from backend.core.keyword_matcher import build_keyword_matcher, find_keywords
 
 
 class TestReasoningStep:
@@ -79,6 +74,29 @@ class TestReasoningChain:
         assert "执行" in logs[1]
         assert "观察" in logs[2]
 
+    def test_reset(self):
+        """测试重置推理链"""
+        chain = ReasoningChain(
+            chain_id="test_chain",
+            query="测试问题",
+            reasoning_type=ReasoningType.DIRECT
+        )
+        chain.add_step("think", "分析问题")
+        chain.final_answer = "答案"
+        chain.confidence = 0.9
+        chain.end_time = chain.start_time
+
+        chain.reset("新问题")
+        assert chain.chain_id == "test_chain"
+        assert chain.query == "新问题"
+        assert chain.steps == []
+        assert chain.final_answer is None
+        assert chain.confidence == 0.0
+        assert chain.end_time is None
+
+        # 重置后步骤编号从 1 重新开始
+        assert chain.add_step("think", "再次分析").step_id == 1
+
 
 class TestPlan:
     """测试 Plan 类"""
@@ -179,60 +197,85 @@ class TestThoughtTree:
         assert best.node_id == "node_2"
         assert best.score == 0.9
 
+    def test_get_best_leaf_after_update(self):
+        """测试更新分数与扩展节点后的最佳叶子"""
+        tree = ThoughtTree(
+            tree_id="tree_1",
+            query="测试问题",
+            root_id="node_0"
+        )
+        tree.add_node("根节点", score=0.5)
+        tree.add_node("子节点1", parent_id="node_0", score=0.6)
+        tree.add_node("子节点2", parent_id="node_0", score=0.9)
+
+        tree.update_score("node_1", 0.95)
+        assert tree.get_best_leaf().node_id == "node_1"
+
+        # node_1 有了子节点后不再是叶子
+        tree.add_node("孙节点", parent_id="node_1", score=0.3)
+        assert tree.get_best_leaf().node_id == "node_2"
+
+        # 非堆顶叶子的分数提升也能被察觉
+        tree.update_score("node_3", 0.99)
+        assert tree.get_best_leaf().node_id == "node_3"
+
+    def test_get_best_leaf_with_initial_nodes(self):
+        """测试构造时传入节点表（含非 add_node 生成的ID）"""
+        nodes = {
+            "root": ThoughtNode(node_id="root", content="根节点", children=["a", "b"]),
+            "a": ThoughtNode(node_id="a", content="思路A", parent_id="root", score=0.6, depth=1),
+            "b": ThoughtNode(node_id="b", content="思路B", parent_id="root", score=0.3, depth=1),
+        }
+        tree = ThoughtTree(tree_id="tree_1", query="测试问题", root_id="root", nodes=nodes)
+        assert tree.get_best_leaf().node_id == "a"
+
+        tree.update_score("b", 0.9)
+        assert tree.get_best_leaf().node_id == "b"
+
+        child = tree.add_node("思路B的细化", parent_id="b", score=0.1)
+        assert tree.get_best_leaf().node_id == "a"
+        assert tree.get_path_to_node(child.node_id) == ["root", "b", child.node_id]
+
 
 class TestTaskAnalyzer:
     """测试 TaskAnalyzer 类"""
 
-    def test_analyze_simple_complexity(self):
-        """测试简单问题复杂度分析"""
-        complexity = TaskAnalyzer.analyze_complexity("什么是现代简约风格？")
-        assert complexity == TaskComplexity.SIMPLE
-
-    def test_analyze_simple_location_query(self):
-        """测试简单位置查询"""
-        complexity = TaskAnalyzer.analyze_complexity("店铺在哪里？")
-        assert complexity == TaskComplexity.SIMPLE
-
-    def test_analyze_simple_contact_query(self):
-        """测试简单联系方式查询"""
-        complexity = TaskAnalyzer.analyze_complexity("客服电话是多少？")
-        assert complexity == TaskComplexity.SIMPLE
-
-    def test_analyze_moderate_complexity(self):
-        """测试中等问题复杂度分析"""
-        complexity = TaskAnalyzer.analyze_complexity("如何选择适合我的装修风格？")
-        assert complexity in [TaskComplexity.MODERATE, TaskComplexity.COMPLEX]
-
-    def test_analyze_complex_with_budget(self):
-        """测试涉及预算的复杂问题"""
-        complexity = TaskAnalyzer.analyze_complexity(
+    @pytest.mark.parametrize("query, expected", [
+        pytest.param("什么是现代简约风格？", {TaskComplexity.SIMPLE}, id="simple"),
+        pytest.param("店铺在哪里？", {TaskComplexity.SIMPLE}, id="simple_location"),
+        pytest.param("客服电话是多少？", {TaskComplexity.SIMPLE}, id="simple_contact"),
+        pytest.param(
+            "如何选择适合我的装修风格？",
+            {TaskComplexity.MODERATE, TaskComplexity.COMPLEX},
+            id="moderate",
+        ),
+        pytest.param(
             "我有100平米的房子，预算20万，想要现代简约风格，"
             "请帮我分析一下应该如何规划装修流程，选择什么材料，"
-            "以及如何控制预算？"
-        )
-        assert complexity in [TaskComplexity.COMPLEX, TaskComplexity.EXPERT]
-
-    def test_analyze_expert_with_multiple_questions(self):
-        """测试包含多个问题的专家级查询"""
-        complexity = TaskAnalyzer.analyze_complexity(
-            "装修风格怎么选？预算怎么控制？材料怎么挑选？工期怎么安排？"
-        )
-        assert complexity in [TaskComplexity.COMPLEX, TaskComplexity.EXPERT]
-
-    def test_analyze_complexity_with_conditions(self):
-        """测试包含条件的问题"""
-        complexity = TaskAnalyzer.analyze_complexity(
-            "如果预算只有10万，应该怎么规划装修方案？"
-        )
+            "以及如何控制预算？",
+            {TaskComplexity.COMPLEX, TaskComplexity.EXPERT},
+            id="complex_with_budget",
+        ),
+        pytest.param(
+            "装修风格怎么选？预算怎么控制？材料怎么挑选？工期怎么安排？",
+            {TaskComplexity.COMPLEX, TaskComplexity.EXPERT},
+            id="expert_with_multiple_questions",
+        ),
         # 包含条件、预算、规划等关键词，复杂度较高
-        assert complexity in [TaskComplexity.MODERATE, TaskComplexity.COMPLEX, TaskComplexity.EXPERT]
-
-    def test_analyze_complexity_with_comparison(self):
-        """测试比较类问题"""
-        complexity = TaskAnalyzer.analyze_complexity(
-            "北欧风格和现代简约风格有什么区别？哪个更适合小户型？"
-        )
-        assert complexity in [TaskComplexity.MODERATE, TaskComplexity.COMPLEX]
+        pytest.param(
+            "如果预算只有10万，应该怎么规划装修方案？",
+            {TaskComplexity.MODERATE, TaskComplexity.COMPLEX, TaskComplexity.EXPERT},
+            id="with_conditions",
+        ),
+        pytest.param(
+            "北欧风格和现代简约风格有什么区别？哪个更适合小户型？",
+            {TaskComplexity.MODERATE, TaskComplexity.COMPLEX},
+            id="with_comparison",
+        ),
+    ])
+    def test_analyze_complexity(self, query, expected):
+        """测试任务复杂度分析"""
+        assert TaskAnalyzer.analyze_complexity(query) in expected
 
     def test_get_complexity_details(self):
         """测试获取复杂度分析详情"""
@@ -243,51 +286,26 @@ class TestTaskAnalyzer:
         assert "complexity" in details
         assert details["total_score"] > 0  # 应该有正分数
 
-    def test_select_reasoning_type_direct(self):
-        """测试选择直接回答模式"""
-        reasoning_type = TaskAnalyzer.select_reasoning_type(
-            "什么是北欧风格？",
-            TaskComplexity.SIMPLE
-        )
-        assert reasoning_type == ReasoningType.DIRECT
-
-    def test_select_reasoning_type_cot(self):
-        """测试选择思维链模式"""
-        reasoning_type = TaskAnalyzer.select_reasoning_type(
-            "如何选择装修风格？",
-            TaskComplexity.MODERATE
-        )
-        assert reasoning_type == ReasoningType.CHAIN_OF_THOUGHT
-
-    def test_select_reasoning_type_react(self):
-        """测试选择 ReAct 模式（工具调用）"""
-        reasoning_type = TaskAnalyzer.select_reasoning_type(
-            "买1万元家具能补贴多少？",
-            TaskComplexity.SIMPLE
-        )
-        assert reasoning_type == ReasoningType.REACT
-
-    def test_select_reasoning_type_react_roi(self):
-        """测试 ROI 计算触发 ReAct 模式"""
-        reasoning_type = TaskAnalyzer.select_reasoning_type(
-            "我的投资回报率是多少？",
-            TaskComplexity.MODERATE
-        )
-        assert reasoning_type == ReasoningType.REACT
-
-    def test_detect_required_tools(self):
+    @pytest.mark.parametrize("query, complexity, expected", [
+        pytest.param("什么是北欧风格？", TaskComplexity.SIMPLE, ReasoningType.DIRECT, id="direct"),
+        pytest.param("如何选择装修风格？", TaskComplexity.MODERATE, ReasoningType.CHAIN_OF_THOUGHT, id="cot"),
+        # 工具调用触发 ReAct 模式
+        pytest.param("买1万元家具能补贴多少？", TaskComplexity.SIMPLE, ReasoningType.REACT, id="react"),
+        pytest.param("我的投资回报率是多少？", TaskComplexity.MODERATE, ReasoningType.REACT, id="react_roi"),
+    ])
+    def test_select_reasoning_type(self, query, complexity, expected):
+        """测试选择推理模式"""
+        assert TaskAnalyzer.select_reasoning_type(query, complexity) == expected
+
+    @pytest.mark.parametrize("query, tool", [
+        pytest.param("买家具能补贴多少钱？", "subsidy_calculator", id="subsidy"),
+        pytest.param("我的ROI是多少？", "roi_calculator", id="roi"),
+        pytest.param("这个价格划算吗？", "price_evaluator", id="price"),
+        pytest.param("装修需要几个月？", "decoration_timeline", id="timeline"),
+    ])
+    def test_detect_required_tools(self, query, tool):
         """测试检测所需工具"""
-        tools = TaskAnalyzer.detect_required_tools("买家具能补贴多少钱？")
-        assert "subsidy_calculator" in tools
-
-        tools = TaskAnalyzer.detect_required_tools("我的ROI是多少？")
-        assert "roi_calculator" in tools
-
-        tools = TaskAnalyzer.detect_required_tools("这个价格划算吗？")
-        assert "price_evaluator" in tools
-
-        tools = TaskAnalyzer.detect_required_tools("装修需要几个月？")
-        assert "decoration_timeline" in tools
+        assert tool in TaskAnalyzer.detect_required_tools(query)
 
     def test_detect_multiple_tools(self):
         """测试检测多个工具"""
@@ -297,6 +315,28 @@ class TestTaskAnalyzer:
         assert "subsidy_calculator" in tools
         assert "price_evaluator" in tools
 
+    def test_overlapping_keywords_all_matched(self):
+        """测试共享前缀的关键词（"装修时间"与"装修"）都计入评分"""
+        details = TaskAnalyzer.get_complexity_details("装修时间")
+        assert details["scores"]["domain"] == 1
+        assert "decoration_timeline" in TaskAnalyzer.detect_required_tools("装修时间")
+
+    def test_keyword_matcher_overlapping_and_shared_prefix(self):
+        """测试同一位置起始与相互重叠的关键词都能匹配到"""
+        matcher = build_keyword_matcher(["装修", "装修时间", "时间", "性价比", "比较"])
+        assert find_keywords(matcher, "装修时间和性价比较") == {
+            "装修", "装修时间", "时间", "性价比", "比较"
+        }
+        assert find_keywords(matcher, "无关内容") == set()
+
+    def test_detect_required_tools_cached_copy(self):
+        """测试重复检测命中缓存，且返回的列表互不影响"""
+        tools1 = TaskAnalyzer.detect_required_tools("买家具能补贴多少钱？")
+        tools1.append("extra_tool")
+        tools2 = TaskAnalyzer.detect_required_tools("买家具能补贴多少钱？")
+        assert tools2 == ["subsidy_calculator"]
+        assert tools1 is not tools2
+
     def test_extract_sub_questions(self):
         """测试提取子问题"""
         sub_questions = TaskAnalyzer.extract_sub_questions(
@@ -308,47 +348,57 @@ class TestTaskAnalyzer:
 class TestReasoningEngine:
     """测试 ReasoningEngine 类"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def engine(self):
-        """创建测试用的推理引擎"""
+        """创建测试用的推理引擎（模块级共享，各测试只使用自己创建的推理链）"""
         return ReasoningEngine()
 
+    @pytest.fixture(scope="module")
+    def chain(self, engine):
+        """模块内复用同一条推理链：调用 chain(query) 返回重置后的推理链"""
+        pooled = engine.create_chain("")
+
+        def make(query):
+            pooled.reset(query)
+            return pooled
+        return make
+
     def test_create_chain(self, engine):
         """测试创建推理链"""
         chain = engine.create_chain("测试问题")
         assert chain.query == "测试问题"
         assert chain.chain_id is not None
 
-    def test_think_step(self, engine):
+    def test_think_step(self, engine, chain):
         """测试添加思考步骤"""
-        chain = engine.create_chain("测试问题")
+        chain = chain("测试问题")
         step = engine.think(chain, "分析问题", confidence=0.8)
         assert step.step_type == "think"
         assert step.content == "分析问题"
         assert step.confidence == 0.8
 
-    def test_act_step(self, engine):
+    def test_act_step(self, engine, chain):
         """测试添加执行步骤"""
-        chain = engine.create_chain("测试问题")
+        chain = chain("测试问题")
         step = engine.act(chain, "调用知识库", tool="knowledge_search")
         assert step.step_type == "act"
         assert step.metadata["tool"] == "knowledge_search"
 
-    def test_observe_step(self, engine):
+    def test_observe_step(self, engine, chain):
         """测试添加观察步骤"""
-        chain = engine.create_chain("测试问题")
+        chain = chain("测试问题")
         step = engine.observe(chain, "找到3条相关信息")
         assert step.step_type == "observe"
 
-    def test_reflect_step(self, engine):
+    def test_reflect_step(self, engine, chain):
         """测试添加反思步骤"""
-        chain = engine.create_chain("测试问题")
+        chain = chain("测试问题")
         step = engine.reflect(chain, "答案是否完整？", confidence=0.7)
         assert step.step_type == "reflect"
 
-    def test_finalize_chain(self, engine):
+    def test_finalize_chain(self, engine, chain):
         """测试完成推理链"""
-        chain = engine.create_chain("测试问题")
+        chain = chain("测试问题")
         engine.think(chain, "分析问题")
         engine.finalize(chain, "最终答案", confidence=0.9)
 
@@ -436,12 +486,10 @@ class TestGetReasoningPrompt:
 class TestGetReasoningEngine:
     """测试全局推理引擎获取"""
 
+    # 全局单例在 pytest -n auto --dist=loadgroup 时固定到同一进程
+    @pytest.mark.xdist_group(name="singleton")
     def test_singleton(self):
         """测试单例模式"""
         engine1 = get_reasoning_engine()
         engine2 = get_reasoning_engine()
         assert engine1 is engine2
-
-
-if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
@@ -3,11 +3,6 @@
 测试 backend/core/stage_reasoning.py 的核心功能
 """
 import pytest
-import os
-import sys
-
-# 添加项目路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.core.stage_reasoning import (
     CEndStage, BEndStage,
@@ -17,6 +12,7 @@ from backend.core.stage_reasoning import (
     C_END_EXPERT_PROMPTS, B_END_EXPERT_PROMPTS,
     C_END_STAGE_KEYWORDS, B_END_STAGE_KEYWORDS,
     C_END_STAGE_TRANSITIONS, B_END_STAGE_TRANSITIONS,
+    _keyword_classify,
 )
 
 
@@ -207,6 +203,18 @@ class TestStageUnderstanding:
         )
         assert stage == "核销结算"
 
+    def test_keyword_detection_cached(self, understanding):
+        """测试相同问题和用户类型的关键词检测命中缓存"""
+        _keyword_classify.cache_clear()
+        first = understanding._keyword_stage_detection("防水做完了，闭水试验要做多久", "c_end")
+        second = StageUnderstanding()._keyword_stage_detection("防水做完了，闭水试验要做多久", "c_end")
+        assert first == second
+        assert _keyword_classify.cache_info().hits == 1
+
+        # 不同用户类型分别缓存
+        understanding._keyword_stage_detection("防水做完了，闭水试验要做多久", "b_end")
+        assert _keyword_classify.cache_info().misses == 2
+
     # === 情绪检测测试 ===
 
     def test_detect_anxiety(self, understanding):
@@ -402,6 +410,28 @@ class TestExpertRoleManager:
         assert "装修规划师" in prompt
         assert "专业背景" in prompt
 
+    def test_build_system_prompt_with_context(self, manager):
+        """测试基于已确定的专家角色构建定制提示词"""
+        expert = manager.get_expert_role("施工", "c_end")
+        context = StageContext(
+            stage="施工",
+            stage_confidence=0.9,
+            user_intent="检查质量",
+            surface_question="空鼓怎么办",
+            deep_need="确保质量",
+            potential_needs=[],
+            emotional_state="困惑",
+            focus_points=["质量"],
+        )
+        prompt = manager.build_system_prompt(expert, context)
+        assert prompt.startswith(expert.system_prompt)
+        assert "避免专业术语" in prompt
+        assert "质量" in prompt
+
+    def test_build_system_prompt_without_expert(self, manager):
+        """测试没有专家角色时不添加基础提示词"""
+        assert manager.build_system_prompt(None) == ""
+
     def test_get_all_c_end_experts(self, manager):
         """测试获取所有C端专家"""
         experts = manager.get_all_experts("c_end")
@@ -575,7 +605,3 @@ class TestStageTransitions:
         assert ("入驻", "获客") in B_END_STAGE_TRANSITIONS
         assert ("获客", "经营分析") in B_END_STAGE_TRANSITIONS
         assert ("经营分析", "核销结算") in B_END_STAGE_TRANSITIONS
-
-
-if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
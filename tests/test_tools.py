@@ -2,20 +2,34 @@
 工具系统单元测试
 测试 backend/core/tools.py 的核心功能
 """
+import asyncio
 import pytest
-import os
-import sys
+import threading
 import time
 
-# 添加项目路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from backend.core.tools import (
     ToolCategory, ToolParameter, ToolResult, ToolDefinition,
-    ToolRegistry, ToolChain, tool, get_tool_registry
+    ToolRegistry, ToolChain, tool, register_builtin_tools
 )
 
 
+def _noop(*args, **kwargs):
+    """返回值无关紧要的测试工具共用的处理函数"""
+    return None
+
+
+def _blocking_handler(release: threading.Event):
+    """
+    创建慢速工具的处理函数：阻塞直到 release 被设置（最多 seconds 秒）
+
+    超时测试无需真实等待 seconds 秒，fixture 清理时设置 release 放行后台线程
+    """
+    def slow_handler(seconds: float) -> str:
+        release.wait(seconds)
+        return f"完成，耗时 {seconds} 秒"
+    return slow_handler
+
+
 class TestToolParameter:
     """测试 ToolParameter 类"""
 
@@ -31,92 +45,64 @@ class TestToolParameter:
         assert param.param_type == float
         assert param.required is True
 
-    def test_validate_required_missing(self):
-        """测试必需参数缺失"""
-        param = ToolParameter(
-            name="amount",
-            param_type=float,
-            description="订单金额",
-            required=True
-        )
-        valid, error = param.validate(None)
-        assert valid is False
-        assert "必需" in error
-
-    def test_validate_optional_missing(self):
-        """测试可选参数缺失"""
-        param = ToolParameter(
-            name="period",
-            param_type=int,
-            description="周期",
-            required=False,
-            default=30
-        )
-        valid, error = param.validate(None)
-        assert valid is True
-
-    def test_validate_type_correct(self):
-        """测试类型正确"""
-        param = ToolParameter(
-            name="amount",
-            param_type=float,
-            description="金额",
-            required=True
-        )
-        valid, error = param.validate(100.0)
-        assert valid is True
-
-    def test_validate_type_conversion(self):
-        """测试类型转换"""
-        param = ToolParameter(
-            name="amount",
-            param_type=float,
-            description="金额",
-            required=True
-        )
+    @pytest.mark.parametrize("kwargs, value, expected_valid, err_substr", [
+        pytest.param(
+            {"name": "amount", "param_type": float, "description": "订单金额", "required": True},
+            None, False, "必需", id="required_missing",
+        ),
+        pytest.param(
+            {"name": "period", "param_type": int, "description": "周期", "required": False, "default": 30},
+            None, True, None, id="optional_missing",
+        ),
+        pytest.param(
+            {"name": "amount", "param_type": float, "description": "金额", "required": True},
+            100.0, True, None, id="type_correct",
+        ),
         # 字符串可以转换为 float
-        valid, error = param.validate("100")
-        assert valid is True
-
-    def test_validate_enum_values(self):
-        """测试枚举值验证"""
-        param = ToolParameter(
-            name="category",
-            param_type=str,
-            description="品类",
-            required=True,
-            enum_values=["家具", "建材", "家电"]
-        )
-        valid, error = param.validate("家具")
-        assert valid is True
-
-        valid, error = param.validate("其他")
-        assert valid is False
-        assert "必须是以下值之一" in error
+        pytest.param(
+            {"name": "amount", "param_type": float, "description": "金额", "required": True},
+            "100", True, None, id="type_conversion",
+        ),
+        pytest.param(
+            {"name": "category", "param_type": str, "description": "品类", "required": True,
+             "enum_values": ["家具", "建材", "家电"]},
+            "家具", True, None, id="enum_valid",
+        ),
+        pytest.param(
+            {"name": "category", "param_type": str, "description": "品类", "required": True,
+             "enum_values": ["家具", "建材", "家电"]},
+            "其他", False, "必须是以下值之一", id="enum_invalid",
+        ),
+    ])
+    def test_validate(self, kwargs, value, expected_valid, err_substr):
+        """测试参数验证"""
+        param = ToolParameter(**kwargs)
+        valid, error = param.validate(value)
+        assert valid is expected_valid
+        if err_substr:
+            assert err_substr in error
 
 
 class TestToolResult:
     """测试 ToolResult 类"""
 
-    def test_success_result(self):
-        """测试成功结果"""
-        result = ToolResult(
-            success=True,
-            data={"amount": 500},
-            execution_time=0.1
-        )
-        assert result.success is True
-        assert result.data["amount"] == 500
-        assert result.error is None
-
-    def test_error_result(self):
-        """测试错误结果"""
-        result = ToolResult(
-            success=False,
-            error="参数错误"
-        )
-        assert result.success is False
-        assert result.error == "参数错误"
+    @pytest.mark.parametrize("kwargs, expected", [
+        pytest.param(
+            {"success": True, "data": {"amount": 500}, "execution_time": 0.1},
+            {"success": True, "data": {"amount": 500}, "error": None},
+            id="success",
+        ),
+        pytest.param(
+            {"success": False, "error": "参数错误"},
+            {"success": False, "error": "参数错误"},
+            id="error",
+        ),
+    ])
+    def test_result(self, kwargs, expected):
+        """测试成功与错误结果"""
+        result = ToolResult(**kwargs)
+        for attr, value in expected.items():
+            assert getattr(result, attr) == value
 
     def test_to_dict(self):
         """测试转换为字典"""
@@ -130,6 +116,11 @@ class TestToolResult:
         assert data["data"]["value"] == 100
         assert data["execution_time"] == 0.05
 
+    def test_slots(self):
+        """测试结果对象使用 __slots__（无实例字典）"""
+        result = ToolResult(success=True)
+        assert not hasattr(result, "__dict__")
+
 
 class TestToolDefinition:
     """测试 ToolDefinition 类"""
@@ -152,9 +143,10 @@ class TestToolDefinition:
         assert tool_def.category == ToolCategory.CALCULATION
         assert tool_def.enabled is True
 
-    def test_get_schema(self):
-        """测试获取 Schema"""
-        tool_def = ToolDefinition(
+    @pytest.fixture(scope="module")
+    def canonical_tool_def(self):
+        """Schema 测试用的工具定义（模块级共享，只读）"""
+        return ToolDefinition(
             name="test_tool",
             description="测试工具",
             category=ToolCategory.UTILITY,
@@ -162,15 +154,31 @@ class TestToolDefinition:
                 ToolParameter("param1", str, "参数1", required=True),
                 ToolParameter("param2", int, "参数2", required=False, default=10)
             ],
-            handler=lambda x, y: x
+            handler=_noop
         )
-        schema = tool_def.get_schema()
+
+    @pytest.fixture(scope="module")
+    def canonical_schema(self, canonical_tool_def):
+        """canonical_tool_def 的 Schema（只生成一次）"""
+        return canonical_tool_def.get_schema()
+
+    def test_get_schema(self, canonical_schema):
+        """测试获取 Schema"""
+        schema = canonical_schema
         assert schema["name"] == "test_tool"
         assert schema["description"] == "测试工具"
         assert "param1" in schema["parameters"]["properties"]
         assert "param1" in schema["parameters"]["required"]
         assert "param2" not in schema["parameters"]["required"]
 
+    def test_get_schema_properties(self, canonical_schema):
+        """测试 Schema 中的参数类型与默认值"""
+        properties = canonical_schema["parameters"]["properties"]
+        assert properties["param1"]["type"] == "str"
+        assert properties["param2"]["type"] == "int"
+        assert properties["param2"]["default"] == 10
+        assert "default" not in properties["param1"]
+
 
 class TestToolRegistry:
     """测试 ToolRegistry 类"""
@@ -193,36 +201,35 @@ class TestToolRegistry:
             handler=lambda value: value * 2
         )
 
-    def test_register_tool(self, registry, sample_tool):
-        """测试注册工具"""
-        result = registry.register(sample_tool)
-        assert result is True
+    def test_registry_lifecycle(self, registry, sample_tool):
+        """测试注册、重复注册、获取与注销的完整流程"""
+        assert registry.register(sample_tool) is True
         assert "sample_tool" in registry.tools
 
-    def test_register_duplicate(self, registry, sample_tool):
-        """测试重复注册"""
-        registry.register(sample_tool)
-        result = registry.register(sample_tool)
-        assert result is False
-
-    def test_unregister_tool(self, registry, sample_tool):
-        """测试注销工具"""
-        registry.register(sample_tool)
-        result = registry.unregister("sample_tool")
-        assert result is True
-        assert "sample_tool" not in registry.tools
+        # 重复注册
+        assert registry.register(sample_tool) is False
 
-    def test_get_tool(self, registry, sample_tool):
-        """测试获取工具"""
-        registry.register(sample_tool)
         tool = registry.get("sample_tool")
         assert tool is not None
         assert tool.name == "sample_tool"
+        assert registry.get("nonexistent") is None
+
+        assert registry.unregister("sample_tool") is True
+        assert "sample_tool" not in registry.tools
+        assert registry.unregister("sample_tool") is False
 
-    def test_get_nonexistent_tool(self, registry):
-        """测试获取不存在的工具"""
-        tool = registry.get("nonexistent")
-        assert tool is None
+    def test_register_many(self, registry, sample_tool):
+        """测试批量注册（同名工具跳过）"""
+        other = ToolDefinition(
+            name="other_tool",
+            description="另一个工具",
+            category=ToolCategory.UTILITY,
+            parameters=[],
+            handler=_noop
+        )
+        registry.register(sample_tool)
+        assert registry.register_many([sample_tool, other]) == 1
+        assert set(registry.tools) == {"sample_tool", "other_tool"}
 
     def test_list_tools(self, registry):
         """测试列出工具"""
@@ -231,17 +238,16 @@ class TestToolRegistry:
             description="工具1",
             category=ToolCategory.CALCULATION,
             parameters=[],
-            handler=lambda: None
+            handler=_noop
         )
         tool2 = ToolDefinition(
             name="tool2",
             description="工具2",
             category=ToolCategory.SEARCH,
             parameters=[],
-            handler=lambda: None
+            handler=_noop
         )
-        registry.register(tool1)
-        registry.register(tool2)
+        registry.register_many([tool1, tool2])
 
         all_tools = registry.list_tools()
         assert len(all_tools) == 2
@@ -292,30 +298,32 @@ class TestToolRegistry:
 class TestToolChain:
     """测试 ToolChain 类"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def registry_with_tools(self):
-        """创建带工具的注册中心"""
+        """创建带工具的注册中心（模块级共享，测试只调用不增删工具）"""
         registry = ToolRegistry()
-        registry.register(ToolDefinition(
-            name="add",
-            description="加法",
-            category=ToolCategory.CALCULATION,
-            parameters=[
-                ToolParameter("a", int, "数字a", required=True),
-                ToolParameter("b", int, "数字b", required=True)
-            ],
-            handler=lambda a, b: a + b
-        ))
-        registry.register(ToolDefinition(
-            name="multiply",
-            description="乘法",
-            category=ToolCategory.CALCULATION,
-            parameters=[
-                ToolParameter("x", int, "数字x", required=True),
-                ToolParameter("y", int, "数字y", required=True)
-            ],
-            handler=lambda x, y: x * y
-        ))
+        registry.register_many([
+            ToolDefinition(
+                name="add",
+                description="加法",
+                category=ToolCategory.CALCULATION,
+                parameters=[
+                    ToolParameter("a", int, "数字a", required=True),
+                    ToolParameter("b", int, "数字b", required=True)
+                ],
+                handler=lambda a, b: a + b
+            ),
+            ToolDefinition(
+                name="multiply",
+                description="乘法",
+                category=ToolCategory.CALCULATION,
+                parameters=[
+                    ToolParameter("x", int, "数字x", required=True),
+                    ToolParameter("y", int, "数字y", required=True)
+                ],
+                handler=lambda x, y: x * y
+            ),
+        ])
         return registry
 
     def test_execute_chain(self, registry_with_tools):
@@ -347,57 +355,63 @@ class TestToolChain:
 class TestBuiltinTools:
     """测试内置工具"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def registry(self):
-        """获取全局注册中心（包含内置工具）"""
-        return get_tool_registry()
-
-    def test_subsidy_calculator(self, registry):
-        """测试补贴计算器"""
-        result = registry.call("subsidy_calculator", amount=10000, category="家具")
-        assert result.success is True
-        assert "final_amount" in result.data
-        assert result.data["final_amount"] == 500  # 10000 * 5% = 500
+        """创建只包含内置工具的注册中心（模块级共享，不使用全局注册中心）"""
+        registry = ToolRegistry()
+        register_builtin_tools(registry)
+        return registry
 
-    def test_subsidy_calculator_with_cap(self, registry):
-        """测试补贴计算器上限"""
-        result = registry.call("subsidy_calculator", amount=100000, category="家具")
-        assert result.success is True
+    @pytest.mark.parametrize("tool_name, kwargs, check", [
+        # 10000 * 5% = 500
+        pytest.param(
+            "subsidy_calculator", {"amount": 10000, "category": "家具"},
+            lambda data: data["final_amount"] == 500,
+            id="subsidy_calculator",
+        ),
         # 100000 * 5% = 5000，但上限是 2000
-        assert result.data["final_amount"] == 2000
-
-    def test_roi_calculator(self, registry):
-        """测试 ROI 计算器"""
-        result = registry.call("roi_calculator", investment=5000, revenue=15000)
-        assert result.success is True
-        assert result.data["roi_percent"] == 200.0  # (15000-5000)/5000 * 100
-
-    def test_roi_calculator_invalid_investment(self, registry):
-        """测试 ROI 计算器无效投入"""
-        result = registry.call("roi_calculator", investment=0, revenue=1000)
-        assert result.success is True
-        assert "error" in result.data
-
-    def test_price_evaluator(self, registry):
-        """测试价格评估器"""
-        result = registry.call("price_evaluator", category="瓷砖", price=100, area=1)
+        pytest.param(
+            "subsidy_calculator", {"amount": 100000, "category": "家具"},
+            lambda data: data["final_amount"] == 2000,
+            id="subsidy_calculator_with_cap",
+        ),
+        # (15000-5000)/5000 * 100
+        pytest.param(
+            "roi_calculator", {"investment": 5000, "revenue": 15000},
+            lambda data: data["roi_percent"] == 200.0,
+            id="roi_calculator",
+        ),
+        pytest.param(
+            "roi_calculator", {"investment": 0, "revenue": 1000},
+            lambda data: "error" in data,
+            id="roi_calculator_invalid_investment",
+        ),
+        pytest.param(
+            "price_evaluator", {"category": "瓷砖", "price": 100, "area": 1},
+            lambda data: "price_level" in data and "suggestion" in data,
+            id="price_evaluator",
+        ),
+        pytest.param(
+            "decoration_timeline", {"house_area": 100},
+            lambda data: "total_days" in data and "timeline" in data,
+            id="decoration_timeline",
+        ),
+    ])
+    def test_builtin_tool(self, registry, tool_name, kwargs, check):
+        """测试内置工具调用结果"""
+        result = registry.call(tool_name, **kwargs)
         assert result.success is True
-        assert "price_level" in result.data
-        assert "suggestion" in result.data
-
-    def test_decoration_timeline(self, registry):
-        """测试装修工期估算"""
-        result = registry.call("decoration_timeline", house_area=100)
-        assert result.success is True
-        assert "total_days" in result.data
-        assert "timeline" in result.data
+        assert check(result.data), result.data
 
 
 class TestToolDecorator:
     """测试工具装饰器"""
 
-    def test_tool_decorator(self):
-        """测试 @tool 装饰器"""
+    def test_tool_decorator(self, monkeypatch):
+        """测试 @tool 装饰器（注册到替换后的局部注册中心，不修改全局注册中心）"""
+        registry = ToolRegistry()
+        monkeypatch.setattr("backend.core.tools.get_tool_registry", lambda: registry)
+
         @tool(
             name="test_decorated_tool",
             description="测试装饰器工具",
@@ -407,7 +421,6 @@ class TestToolDecorator:
             return x + y
 
         # 检查工具是否被注册
-        registry = get_tool_registry()
         tool_def = registry.get("test_decorated_tool")
         assert tool_def is not None
         assert tool_def.name == "test_decorated_tool"
@@ -423,14 +436,11 @@ class TestToolDecorator:
 class TestToolTimeout:
     """测试工具超时控制"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def registry_with_slow_tool(self):
-        """创建带慢速工具的注册中心"""
+        """创建带慢速工具的注册中心（模块级共享，超时后仍阻塞的线程在模块结束时放行）"""
         registry = ToolRegistry()
-
-        def slow_handler(seconds: float) -> str:
-            time.sleep(seconds)
-            return f"完成，耗时 {seconds} 秒"
+        release = threading.Event()
 
         registry.register(ToolDefinition(
             name="slow_tool",
@@ -439,49 +449,68 @@ class TestToolTimeout:
             parameters=[
                 ToolParameter("seconds", float, "等待秒数", required=True)
             ],
-            handler=slow_handler
+            handler=_blocking_handler(release)
         ))
-        return registry
-
-    def test_tool_completes_within_timeout(self, registry_with_slow_tool):
-        """测试工具在超时时间内完成"""
-        result = registry_with_slow_tool.call("slow_tool", timeout=5.0, seconds=0.1)
-        assert result.success is True
-        assert "完成" in result.data
-
-    def test_tool_timeout(self, registry_with_slow_tool):
-        """测试工具超时"""
-        result = registry_with_slow_tool.call("slow_tool", timeout=0.5, seconds=2.0)
-        assert result.success is False
-        assert "超时" in result.error
-        assert result.metadata.get("timeout") is True
-
-    def test_default_timeout(self, registry_with_slow_tool):
-        """测试默认超时时间（30秒）"""
-        # 快速完成的任务应该成功
-        result = registry_with_slow_tool.call("slow_tool", seconds=0.1)
-        assert result.success is True
+        yield registry
+        release.set()
+
+    @pytest.mark.parametrize("timeout, seconds, expect_success", [
+        # 不传 timeout 时使用默认超时时间（30秒），快速完成的任务应该成功
+        pytest.param(None, 0, True, id="default_timeout"),
+        pytest.param(5.0, 0, True, id="completes_within_timeout"),
+        pytest.param(0.05, 2.0, False, id="timeout"),
+    ])
+    def test_tool_timeout(self, registry_with_slow_tool, timeout, seconds, expect_success):
+        """测试工具超时控制"""
+        kwargs = {} if timeout is None else {"timeout": timeout}
+        start = time.monotonic()
+        result = registry_with_slow_tool.call("slow_tool", seconds=seconds, **kwargs)
+        assert result.success is expect_success
+        if expect_success:
+            assert "完成" in result.data
+        else:
+            assert "超时" in result.error
+            assert result.metadata.get("timeout") is True
+            # 超时后立即返回，不等待处理函数结束
+            assert time.monotonic() - start < 1.0
 
     def test_timeout_records_error_count(self, registry_with_slow_tool):
         """测试超时会记录错误计数"""
         tool = registry_with_slow_tool.get("slow_tool")
         initial_error_count = tool.error_count
 
-        registry_with_slow_tool.call("slow_tool", timeout=0.1, seconds=1.0)
+        registry_with_slow_tool.call("slow_tool", timeout=0.05, seconds=1.0)
 
         assert tool.error_count == initial_error_count + 1
 
+    @pytest.mark.slow
+    def test_tool_timeout_real_sleep(self):
+        """测试真实阻塞的处理函数超时（pytest -m slow 运行）"""
+        registry = ToolRegistry()
+        registry.register(ToolDefinition(
+            name="sleep_tool",
+            description="真实休眠的工具",
+            category=ToolCategory.UTILITY,
+            parameters=[
+                ToolParameter("seconds", float, "等待秒数", required=True)
+            ],
+            handler=lambda seconds: time.sleep(seconds)
+        ))
+        result = registry.call("sleep_tool", timeout=0.5, seconds=2.0)
+        assert result.success is False
+        assert result.metadata.get("timeout") is True
+
 
 class TestToolAsyncTimeout:
     """测试异步工具超时控制"""
 
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def registry_with_slow_tool(self):
-        """创建带慢速工具的注册中心"""
+        """创建带协程慢速工具的注册中心（模块级共享）"""
         registry = ToolRegistry()
 
-        def slow_handler(seconds: float) -> str:
-            time.sleep(seconds)
+        async def slow_handler(seconds: float) -> str:
+            await asyncio.sleep(seconds)
             return f"完成，耗时 {seconds} 秒"
 
         registry.register(ToolDefinition(
@@ -496,20 +525,18 @@ class TestToolAsyncTimeout:
         return registry
 
     @pytest.mark.asyncio
-    async def test_async_tool_completes_within_timeout(self, registry_with_slow_tool):
-        """测试异步工具在超时时间内完成"""
-        result = await registry_with_slow_tool.call_async("slow_tool_async", timeout=5.0, seconds=0.1)
-        assert result.success is True
-        assert "完成" in result.data
-
-    @pytest.mark.asyncio
-    async def test_async_tool_timeout(self, registry_with_slow_tool):
-        """测试异步工具超时"""
-        result = await registry_with_slow_tool.call_async("slow_tool_async", timeout=0.5, seconds=2.0)
-        assert result.success is False
-        assert "超时" in result.error
-        assert result.metadata.get("timeout") is True
-
-
-if __name__ == "__main__":
-    pytest.main([__file__, "-v"])
+    @pytest.mark.parametrize("timeout, seconds, expect_success", [
+        pytest.param(5.0, 0, True, id="completes_within_timeout"),
+        pytest.param(0.05, 2.0, False, id="timeout"),
+    ])
+    async def test_async_tool_timeout(self, registry_with_slow_tool, timeout, seconds, expect_success):
+        """测试异步工具超时控制（超时时协程被取消，不占用线程）"""
+        result = await registry_with_slow_tool.call_async(
+            "slow_tool_async", timeout=timeout, seconds=seconds
+        )
+        assert result.success is expect_success
+        if expect_success:
+            assert "完成" in result.data
+        else:
+            assert "超时" in result.error
+            assert result.metadata.get("timeout") is True